@@ -0,0 +1,68 @@
+"""
+Per scalar read cost of the deca.fast_reader engine against the previous np.frombuffer per scalar readers
+
+    python -m benchmarks.bench_fast_reader [--count N] [--repeat R]
+"""
+import argparse
+import timeit
+import numpy as np
+from deca import fast_reader, fast_file, fast_file_2
+
+
+def legacy_make_read_one(data_type):
+    # reader as it was before deca.fast_reader, one slice and np.frombuffer per scalar
+    dt = np.dtype(data_type)
+    ele_size = dt.itemsize
+
+    def f(buffer, n_buffer, pos):
+        new_pos = pos + ele_size
+        if new_pos > n_buffer:
+            fast_reader.raise_error()
+        v = np.frombuffer(buffer[pos:new_pos], dtype=dt)
+        return v[0], new_pos
+
+    return f
+
+
+def read_all(f, buffer, count):
+    n_buffer = len(buffer)
+    pos = 0
+    for _ in range(count):
+        _, pos = f(buffer, n_buffer, pos)
+
+
+def read_all_bufn(f, buffer, count):
+    bufn = (buffer, len(buffer))
+    pos = 0
+    for _ in range(count):
+        _, pos = f(bufn, pos)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    count = args.count
+    buffer = np.arange(count * 2, dtype=np.uint32).tobytes()
+
+    cases = [
+        ('u8', np.uint8, fast_file.ff_read_u8, fast_file_2.ff_read_u8),
+        ('u32', np.uint32, fast_file.ff_read_u32, fast_file_2.ff_read_u32),
+        ('f32', np.float32, fast_file.ff_read_f32, fast_file_2.ff_read_f32),
+        ('u64', np.uint64, fast_file.ff_read_u64, fast_file_2.ff_read_u64),
+    ]
+
+    print('{:6s} {:>14s} {:>14s} {:>14s} {:>9s}'.format('type', 'before ns', 'after ns', 'after bufn ns', 'speedup'))
+    for name, dt, f_new, f_new_bufn in cases:
+        f_old = legacy_make_read_one(dt)
+        t_old = min(timeit.repeat(lambda: read_all(f_old, buffer, count), number=1, repeat=args.repeat))
+        t_new = min(timeit.repeat(lambda: read_all(f_new, buffer, count), number=1, repeat=args.repeat))
+        t_bufn = min(timeit.repeat(lambda: read_all_bufn(f_new_bufn, buffer, count), number=1, repeat=args.repeat))
+        print('{:6s} {:14.1f} {:14.1f} {:14.1f} {:8.1f}x'.format(
+            name, t_old / count * 1e9, t_new / count * 1e9, t_bufn / count * 1e9, t_old / t_new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""
+Times every stage of the cotw/deca pipeline over the sample files bundled with the repo
+
+    python -m benchmarks.bench_pipeline [--repeat R] [--output results.json] [--rtpc FILE ...] [--sarc FILE ...]
+
+Each stage runs once to warm up, then --repeat timed runs (median reported), then once more under tracemalloc for
+the peak allocation. Throughput is the stage input size over the median time. Inputs are read into memory first so
+disk speed is not part of the numbers.
+
+The repo has no RTPC, SARC or GDCC samples, the RTPC and SARC stages run on the files given with --rtpc and --sarc,
+or on files from benchmarks.synthetic when none are given. GDCC stages always run on a synthetic archive.
+"""
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import contextlib
+import tracemalloc
+from pathlib import Path
+
+from deca.ff_adf import Adf, GdccArchive, TypeLibrary, adf_value_extract
+from deca.ff_rtpc import RtpcVisitor, RtpcVisitorDumpToString
+from deca.ff_sarc import FileSarc
+from cotw import adf, adf_builder
+from benchmarks import synthetic
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# SAVE/COMP containers, a 32 byte header then zlib data
+COMPRESSED_FIXTURES = [
+    'animal_population_8_org',
+    'animal_population_8_broke',
+]
+
+ADF_FIXTURES = [
+    'found_need_zones_adf_sliced',
+    'found_need_zones_adf_sliced_u',
+    'new_sliced',
+    'animal_population_8_org_sliced',
+    'animal_population_8_broke_sliced',
+]
+
+# same insert as `cotw test found_need_zones_adf_sliced`, which produced found_need_zones_adf_sliced_u
+INSERT_FIXTURE = 'found_need_zones_adf_sliced'
+INSERT_ARGS = dict(src=(35928, 35976), header_offset=320, data_offset=35976, array_length=35, old_array_length=34)
+
+BATCH_INSERT_FIXTURE = 'animal_population_8_org_sliced'
+BATCH_INSERT_ARRAYS = 40
+BATCH_INSERT_RECORDS = 5
+
+
+def measure(func, n_bytes, repeat):
+    func()
+
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(times)
+    return {
+        'bytes': n_bytes,
+        'repeat': repeat,
+        'median_s': median,
+        'min_s': min(times),
+        'max_s': max(times),
+        'peak_bytes': peak,
+        'mb_per_s': n_bytes / median / 1e6 if median > 0 else None,
+    }
+
+
+def run_stage(results, stage, name, func, n_bytes, repeat):
+    result = {'stage': stage, 'input': name}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result.update(measure(func, n_bytes, repeat))
+    except Exception as e:
+        result['error'] = repr(e)
+    results.append(result)
+    print_result(result)
+
+
+def print_result(result):
+    if 'error' in result:
+        print('{:22s} {:40s} ERROR {}'.format(result['stage'], result['input'], result['error']))
+        return
+    print('{:22s} {:40s} {:10.3f} ms {:9.2f} MB/s {:10.1f} KiB'.format(
+        result['stage'], result['input'], result['median_s'] * 1e3, result['mb_per_s'] or 0.0,
+        result['peak_bytes'] / 1024))
+
+
+def parse_adf_bytes(data, map_typedef=None):
+    obj = Adf()
+    obj.deserialize(data, map_typedef=map_typedef)
+    return obj
+
+
+def bench_decompress(results, root, repeat):
+    for name in COMPRESSED_FIXTURES:
+        data = (root / name).read_bytes()[32:]
+        run_stage(results, 'decompress', name, lambda: adf._decompress_bytes(data), len(data), repeat)
+
+
+def bench_adf(results, root, repeat):
+    for name in ADF_FIXTURES:
+        filename = root / name
+        data = filename.read_bytes()
+        run_stage(results, 'adf_deserialize', name, lambda: parse_adf_bytes(data), len(data), repeat)
+        # typedefs come from a library that has seen the file, like every file after the first in a batch
+        type_library = TypeLibrary()
+        run_stage(
+            results, 'adf_deserialize_typelib', name, lambda: parse_adf_bytes(data, type_library), len(data), repeat)
+
+        try:
+            obj = parse_adf_bytes(data)
+        except Exception:
+            # the failure is already recorded by the deserialize stage
+            continue
+
+        run_stage(
+            results, 'adf_value_extract', name,
+            lambda: [adf_value_extract(v) for v in obj.table_instance_full_values], len(data), repeat)
+        run_stage(results, 'adf_dump_to_string', name, obj.dump_to_string, len(data), repeat)
+        run_stage(results, 'create_profile', name, lambda: adf_builder.create_profile(filename), len(data), repeat)
+
+        # what a repeated edit of the same file pays with a profile cache
+        with tempfile.TemporaryDirectory() as tmp:
+            profile_filename = Path(tmp) / 'profile.npz'
+            adf_builder.ProfileColumns.from_profile(adf_builder.create_profile(filename)).save(profile_filename)
+            run_stage(
+                results, 'profile_columns_load', name,
+                lambda: adf_builder.ProfileColumns.load(profile_filename).array_offsets(), len(data), repeat)
+
+
+def bench_insert(results, root, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = Path(tmp) / INSERT_FIXTURE
+        shutil.copyfile(root / INSERT_FIXTURE, filename)
+        data = filename.read_bytes()
+        args = INSERT_ARGS
+        new_data = bytearray(data[args['src'][0]:args['src'][1]])
+
+        def insert():
+            adf_builder.insert_array_data(
+                filename, new_data, args['header_offset'], args['data_offset'], args['array_length'],
+                args['old_array_length'])
+
+        run_stage(results, 'insert_array_data', INSERT_FIXTURE, insert, len(data), repeat)
+
+        # 200 animals over 40 groups in one batch, a copy of each group's first animal
+        filename = Path(tmp) / BATCH_INSERT_FIXTURE
+        shutil.copyfile(root / BATCH_INSERT_FIXTURE, filename)
+        data = filename.read_bytes()
+        profile = adf_builder.create_profile(filename)
+        array_offsets = adf_builder.find_population_array_offsets(
+            profile['details']['instance_offsets']['instances'][0]['0'], [])
+        animals = [x for x in array_offsets if x['key'] == 'Animals' and x['values'] is not None][:BATCH_INSERT_ARRAYS]
+        inserts = []
+        for offset in animals:
+            start, end = offset['values']
+            record = data[start:start + (end - start) // offset['length']]
+            inserts.append((adf_builder.array_key(offset), [record] * BATCH_INSERT_RECORDS))
+
+        run_stage(
+            results, 'insert_arrays_data', BATCH_INSERT_FIXTURE,
+            lambda: adf_builder.insert_arrays_data(filename, inserts), len(data), repeat)
+
+
+def bench_rtpc(results, filenames, repeat):
+    inputs = [(str(filename), Path(filename).read_bytes()) for filename in filenames]
+    if not inputs:
+        inputs = [('<synthetic rtpc 4x4x6>', synthetic.build_rtpc(depth=4, fanout=4, props=6))]
+
+    for name, data in inputs:
+        run_stage(results, 'rtpc_visit', name, lambda: RtpcVisitor().visit(data), len(data), repeat)
+
+        def dump():
+            visitor = RtpcVisitorDumpToString()
+            visitor.visit(data)
+            return visitor.result()
+
+        run_stage(results, 'rtpc_dump', name, dump, len(data), repeat)
+
+
+def bench_sarc(results, filenames, entry_count, repeat):
+    inputs = [(str(filename), Path(filename).read_bytes()) for filename in filenames]
+    if not inputs:
+        data = synthetic.build_sarc(entry_count, max_size=64)
+        inputs = [('<synthetic sarc {} entries>'.format(entry_count), data)]
+
+    for name, data in inputs:
+        run_stage(results, 'sarc_header_deserialize', name, lambda: FileSarc().header_deserialize(data), len(data),
+                  repeat)
+
+
+def bench_gdcc(results, entry_count, repeat):
+    data = synthetic.build_gdcc(entry_count, max_size=64)
+    name = '<synthetic gdcc {} entries>'.format(entry_count)
+    run_stage(results, 'gdcc_open', name, lambda: GdccArchive.open(data), len(data), repeat)
+
+    archive = GdccArchive.open(data)
+    v_paths = [entry.v_path for entry in archive]
+    run_stage(results, 'gdcc_read_all', name, lambda: [archive.read(v_path) for v_path in v_paths], len(data), repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root', type=Path, default=ROOT, help='directory holding the sample files')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--output', type=Path, default=None, help='write results as JSON')
+    parser.add_argument('--rtpc', type=Path, nargs='*', default=[])
+    parser.add_argument('--sarc', type=Path, nargs='*', default=[])
+    parser.add_argument('--sarc-entries', type=int, default=10000)
+    parser.add_argument('--gdcc-entries', type=int, default=10000)
+    args = parser.parse_args()
+
+    results = []
+    bench_decompress(results, args.root, args.repeat)
+    bench_adf(results, args.root, args.repeat)
+    bench_insert(results, args.root, args.repeat)
+    bench_rtpc(results, args.rtpc, args.repeat)
+    bench_sarc(results, args.sarc, args.sarc_entries, args.repeat)
+    bench_gdcc(results, args.gdcc_entries, args.repeat)
+
+    if args.output is not None:
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version,
+            'platform': platform.platform(),
+            'results': results,
+        }
+        args.output.write_text(json.dumps(report, indent=2))
+        print('Saved {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
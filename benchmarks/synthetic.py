@@ -0,0 +1,525 @@
+"""
+Synthetic ADF, RTPC and SARC files for scaling tests
+
+    python -m benchmarks.synthetic adf OUT [--populations P] [--groups G] [--animals A] [--seed S]
+    python -m benchmarks.synthetic rtpc OUT [--depth D] [--fanout F] [--props N] [--seed S]
+    python -m benchmarks.synthetic sarc OUT [--entries N] [--version 2|3] [--seed S]
+    python -m benchmarks.synthetic gdcc OUT [--entries N] [--seed S]
+
+ADF files use the AnimalPopulationReserveData_3 typedefs from typedef.json and the layout of the game's animal
+population saves: the root structure first, then each array's elements followed by the arrays those elements own,
+depth first in member order. Array headers carry the same relocation chain as the game writes (the second u32 is the
+distance to the next non empty array header), so the files also work with cotw.adf_builder.
+
+GDCC files are an ADF with the single gdc/global.gdcc instance: the directory header and 32 byte records, the v_path
+strings, then the files aligned to 16, every fourth one an RTPC behind its own 16 byte header.
+"""
+import sys
+import json
+import random
+import struct
+import argparse
+from pathlib import Path
+
+from deca.hashes import hash32_func
+from deca.file import ArchiveFile
+from deca.ff_sarc import FileSarc, EntrySarc
+from deca.ff_rtpc import k_type_u32, k_type_f32, k_type_str, k_type_vec3, k_type_array_f32, k_type_objid
+from deca.ff_adf import \
+    typedef_s8, typedef_u8, typedef_s16, typedef_u16, typedef_s32, typedef_u32, typedef_s64, typedef_u64, \
+    typedef_f32, typedef_f64
+
+ROOT = Path(__file__).resolve().parent.parent
+TYPEDEF_FILENAME = ROOT / 'typedef.json'
+
+ADF_ROOT_TYPE = 'AnimalPopulationReserveData_3'
+ADF_COMMENT = b'savegamedata_spec_imm.adf in  '
+ADF_INSTANCE_NAME = b'0'
+
+GDCC_TYPE_HASH = 0x178842fe
+GDCC_RTPC_HASH = 0xD74CC4CB
+GDCC_INSTANCE_NAME = b'global.gdcc'
+
+primitive_codes = {
+    typedef_s8: 'b',
+    typedef_u8: 'B',
+    typedef_s16: 'h',
+    typedef_u16: 'H',
+    typedef_s32: 'i',
+    typedef_u32: 'I',
+    typedef_s64: 'q',
+    typedef_u64: 'Q',
+    typedef_f32: 'f',
+    typedef_f64: 'd',
+}
+
+adf_header = struct.Struct('<4sIIIIIIIIII5I')
+adf_instance_entry = struct.Struct('<IIIIQ')
+adf_typedef_header = struct.Struct('<IIIIQIIII')
+adf_member = struct.Struct('<QIIIIQ')
+adf_array_header = struct.Struct('<III')
+
+# metatypes used by the animal population typedefs
+STRUCTURE = 1
+ARRAY = 3
+
+ARRAY_SIZE = 16
+ARRAY_ALIGN = 8
+EMPTY_ARRAY_ALIGN = 16
+# typedef flags as found in the game files, bit 0 marks structures without arrays, bit 1 structures of one
+# primitive type
+TYPEDEF_FLAGS = 0x8000
+
+
+def _align(v, n):
+    return (v + n - 1) // n * n
+
+
+def load_typedefs(filename=TYPEDEF_FILENAME):
+    """
+    Typedefs from a create_profile style typedef dump, in file order
+    """
+    return json.loads(Path(filename).read_text())['offsets']
+
+
+class AdfBuilder:
+    """
+    Minimal ADF writer for the structure/array typedefs produced by create_profile
+
+    Values are dicts for structures, lists (or bytes for u8) for arrays and ints/floats for primitives.
+    """
+    def __init__(self, typedefs):
+        self.typedefs = typedefs
+        self.type_map = {td['type_hash']: td for td in typedefs}
+        self.type_by_name = {td['name']: td for td in typedefs}
+        self._plain = {}
+
+    # type information
+    def size_of(self, type_hash):
+        if type_hash in primitive_codes:
+            return struct.calcsize(primitive_codes[type_hash])
+        td = self.type_map[type_hash]
+        if td['metatype'] == ARRAY:
+            return ARRAY_SIZE
+        return td['size']
+
+    def align_of(self, type_hash):
+        if type_hash in primitive_codes:
+            return self.size_of(type_hash)
+        td = self.type_map[type_hash]
+        if td['metatype'] == ARRAY:
+            return ARRAY_ALIGN
+        return max([self.align_of(m['type_hash']) for m in td['members']] + [1])
+
+    def flags_of(self, type_hash):
+        td = self.type_map[type_hash]
+        flags = TYPEDEF_FLAGS
+        if td['metatype'] == STRUCTURE:
+            if self.plain_struct(type_hash) is not None:
+                flags |= 1
+            member_types = {m['type_hash'] for m in td['members']}
+            if len(member_types) == 1 and member_types <= primitive_codes.keys():
+                flags |= 2
+        return flags
+
+    def plain_struct(self, type_hash):
+        """
+        (struct.Struct, member name paths) for a structure made only of primitives and nested plain structures,
+        None otherwise. Arrays of these are packed one record per pack_into.
+        """
+        if type_hash in self._plain:
+            return self._plain[type_hash]
+        fields = self._plain_fields(type_hash, 0, ())
+        plain = None
+        if fields is not None:
+            fmt = '<'
+            pos = 0
+            paths = []
+            for offset, code, path in sorted(fields):
+                fmt += 'x' * (offset - pos) + code
+                pos = offset + struct.calcsize(code)
+                paths.append(path)
+            fmt += 'x' * (self.size_of(type_hash) - pos)
+            plain = (struct.Struct(fmt), paths)
+        self._plain[type_hash] = plain
+        return plain
+
+    def _plain_fields(self, type_hash, base, path):
+        td = self.type_map.get(type_hash)
+        if td is None or td['metatype'] != STRUCTURE:
+            return None
+        fields = []
+        for m in td['members']:
+            m_type = m['type_hash']
+            m_path = path + (m['name'],)
+            if m_type in primitive_codes:
+                fields.append((base + m['offset'], primitive_codes[m_type], m_path))
+            else:
+                sub = self._plain_fields(m_type, base + m['offset'], m_path)
+                if sub is None:
+                    return None
+                fields.extend(sub)
+        return fields
+
+    # instance data
+    def _write_value(self, buf, pos, type_hash, value, deferred):
+        if type_hash in primitive_codes:
+            struct.pack_into('<' + primitive_codes[type_hash], buf, pos, value)
+            return
+        td = self.type_map[type_hash]
+        if td['metatype'] == ARRAY:
+            deferred.append((pos, td, value))
+        elif td['metatype'] == STRUCTURE:
+            for m in td['members']:
+                self._write_value(buf, pos + m['offset'], m['type_hash'], value[m['name']], deferred)
+        else:
+            raise NotImplementedError('AdfBuilder: metatype {} of {}'.format(td['metatype'], td['name']))
+
+    def _write_arrays(self, buf, deferred, slots):
+        for header_pos, td, items in deferred:
+            count = len(items)
+            if count == 0:
+                # empty arrays have an all zero header and are not part of the relocation chain, the game still
+                # aligns the data that follows
+                buf.extend(bytes(_align(len(buf), EMPTY_ARRAY_ALIGN) - len(buf)))
+                continue
+
+            element_type = td['element_type_hash']
+            element_size = self.size_of(element_type)
+            data_pos = _align(len(buf), ARRAY_ALIGN)
+            buf.extend(bytes(data_pos - len(buf) + element_size * count))
+            adf_array_header.pack_into(buf, header_pos, data_pos, 0, count)
+            slots.append(header_pos)
+
+            if element_type in primitive_codes:
+                if isinstance(items, (bytes, bytearray)):
+                    buf[data_pos:data_pos + count] = items
+                else:
+                    struct.pack_into('<{}{}'.format(count, primitive_codes[element_type]), buf, data_pos, *items)
+                continue
+
+            plain = self.plain_struct(element_type)
+            if plain is not None:
+                st, paths = plain
+                for i, item in enumerate(items):
+                    st.pack_into(buf, data_pos + i * element_size, *[_get_path(item, p) for p in paths])
+                continue
+
+            for i, item in enumerate(items):
+                child_deferred = []
+                self._write_value(buf, data_pos + i * element_size, element_type, item, child_deferred)
+                self._write_arrays(buf, child_deferred, slots)
+
+    def instance_bytes(self, type_hash, value):
+        buf = bytearray(self.size_of(type_hash))
+        deferred = []
+        slots = []
+        self._write_value(buf, 0, type_hash, value, deferred)
+        self._write_arrays(buf, deferred, slots)
+
+        # relocation chain, each non empty array header points at the next one
+        slots.sort()
+        for slot, next_slot in zip(slots, slots[1:]):
+            struct.pack_into('<I', buf, slot + 4, next_slot - slot)
+        return buf
+
+    # file
+    def build(self, root_type_name, value, comment=ADF_COMMENT, instance_name=ADF_INSTANCE_NAME):
+        root = self.type_by_name[root_type_name]
+
+        names = []
+        name_index = {}
+
+        def add_name(name):
+            if isinstance(name, str):
+                name = name.encode('utf-8')
+            if name not in name_index:
+                name_index[name] = len(names)
+                names.append(name)
+            return name_index[name]
+
+        add_name(instance_name)
+        typedef_blocks = []
+        for td in self.typedefs:
+            type_hash = td['type_hash']
+            name_idx = add_name(td['name'])
+            if td['metatype'] == STRUCTURE:
+                block = adf_typedef_header.pack(
+                    STRUCTURE, td['size'], self.align_of(type_hash), type_hash, name_idx, self.flags_of(type_hash),
+                    0, 0, len(td['members']))
+                for m in td['members']:
+                    block += adf_member.pack(add_name(m['name']), m['type_hash'], m['size'], m['offset'], 0, 0)
+            elif td['metatype'] == ARRAY:
+                block = adf_typedef_header.pack(
+                    ARRAY, ARRAY_SIZE, ARRAY_ALIGN, type_hash, name_idx, self.flags_of(type_hash),
+                    td['element_type_hash'], 0, 0)
+            else:
+                raise NotImplementedError('AdfBuilder: metatype {} of {}'.format(td['metatype'], td['name']))
+            typedef_blocks.append(block)
+
+        instance_offset = _align(adf_header.size + len(comment) + 1, self.align_of(root['type_hash']))
+        instance = self.instance_bytes(root['type_hash'], value)
+
+        # the game writes a u32 12 after the instance data, then the instance table
+        instance_table_offset = _align(instance_offset + len(instance), 8) + 8
+        typedef_offset = instance_table_offset + adf_instance_entry.size
+        nametable_offset = typedef_offset + sum(len(b) for b in typedef_blocks)
+        nametable = bytes(len(n) for n in names) + b''.join(n + b'\00' for n in names)
+        total_size = nametable_offset + len(nametable)
+
+        out = bytearray(total_size)
+        adf_header.pack_into(
+            out, 0, b' FDA', 4, 1, instance_table_offset, len(self.typedefs), typedef_offset, 0, 0, len(names),
+            nametable_offset, total_size, 0, 1, 0, 0, 0)
+        out[adf_header.size:adf_header.size + len(comment)] = comment
+        out[instance_offset:instance_offset + len(instance)] = instance
+        struct.pack_into('<I', out, instance_table_offset - 8, 12)
+        adf_instance_entry.pack_into(
+            out, instance_table_offset, hash32_func(instance_name), root['type_hash'], instance_offset,
+            len(instance), name_index[instance_name])
+        out[typedef_offset:nametable_offset] = b''.join(typedef_blocks)
+        out[nametable_offset:] = nametable
+        return bytes(out)
+
+
+def _get_path(value, path):
+    for key in path:
+        value = value[key]
+    return value
+
+
+def animal_population_value(populations=11, groups=25, animals=6, need_zones=7, pressure_map_size=65536, seed=0):
+    """
+    Value for AnimalPopulationReserveData_3 with a fixed number of groups per population and animals per group
+    """
+    rnd = random.Random(seed)
+
+    def animal():
+        weight = rnd.uniform(20.0, 80.0)
+        return {
+            'Gender': rnd.choice((1, 2)),
+            'Weight': weight,
+            'Score': weight * rnd.uniform(0.8, 1.1),
+            'IsGreatOne': int(rnd.random() < 0.001),
+            'VisualVariationSeed': rnd.getrandbits(32),
+            'Id': 0,
+            'MapPosition': {'X': 0.0, 'Y': 0.0},
+        }
+
+    def group(index):
+        return {
+            'SpawnAreadId': rnd.getrandbits(31),
+            'NeedZonePathGuids': [rnd.getrandbits(32) for _ in range(need_zones)],
+            'Animals': [animal() for _ in range(animals)],
+            'Id': index,
+        }
+
+    def population():
+        return {
+            'NameHashId': rnd.getrandbits(32),
+            'Groups': [group(i) for i in range(groups)],
+            'RepopulateData': [],
+            'InitialTotalScore': 0.0,
+            'InitialNumAnimals': 0,
+            'Revision': 6,
+            'GroupToWarrenId': [],
+        }
+
+    return {
+        'AlreadyConverted': 1,
+        'Populations': [population() for _ in range(populations)],
+        'HuntingPressureMap': bytes(rnd.getrandbits(8) for _ in range(pressure_map_size)),
+        'ReserveSeed': rnd.getrandbits(32),
+    }
+
+
+def build_animal_population_adf(populations=11, groups=25, animals=6, seed=0, typedef_filename=TYPEDEF_FILENAME,
+                                **kwargs):
+    builder = AdfBuilder(load_typedefs(typedef_filename))
+    value = animal_population_value(populations, groups, animals, seed=seed, **kwargs)
+    return builder.build(ADF_ROOT_TYPE, value)
+
+
+def build_rtpc(depth=3, fanout=3, props=4, seed=0):
+    """
+    RTPC v1 tree, every node below depth has fanout children and each node has props properties cycling through
+    u32, f32, string, vec3, f32 array and object id values
+    """
+    rnd = random.Random(seed)
+    out = bytearray(b'RTPC' + struct.pack('<I', 1))
+    blobs = []  # (position of the data offset to fix up, data)
+
+    def emit_node(d, index, header_pos):
+        child_count = fanout if d < depth else 0
+        data_offset = len(out)
+        struct.pack_into('<IIHH', out, header_pos, hash32_func('node_{}_{}'.format(d, index)), data_offset, props,
+                         child_count)
+        for j in range(props):
+            name = hash32_func('prop_{}'.format(j))
+            kind = j % 6
+            prop_pos = len(out)
+            if kind == 0:
+                out.extend(struct.pack('<IIB', name, rnd.getrandbits(32), k_type_u32))
+            elif kind == 1:
+                out.extend(struct.pack('<IfB', name, rnd.random(), k_type_f32))
+            elif kind == 2:
+                out.extend(struct.pack('<IIB', name, 0, k_type_str))
+                blobs.append((prop_pos + 4, 'str_{}'.format(rnd.randrange(1000)).encode() + b'\00'))
+            elif kind == 3:
+                out.extend(struct.pack('<IIB', name, 0, k_type_vec3))
+                blobs.append((prop_pos + 4, struct.pack('<3f', rnd.random(), rnd.random(), rnd.random())))
+            elif kind == 4:
+                n = rnd.randrange(8)
+                out.extend(struct.pack('<IIB', name, 0, k_type_array_f32))
+                blobs.append((prop_pos + 4, struct.pack('<I{}f'.format(n), n, *[rnd.random() for _ in range(n)])))
+            else:
+                out.extend(struct.pack('<IIB', name, 0, k_type_objid))
+                blobs.append((prop_pos + 4, struct.pack('<q', rnd.getrandbits(63))))
+        out.extend(bytes(_align(len(out), 4) - len(out)))
+        children_pos = len(out)
+        out.extend(bytes(12 * child_count))
+        for i in range(child_count):
+            emit_node(d + 1, index * fanout + i, children_pos + 12 * i)
+
+    out.extend(bytes(12))
+    emit_node(0, 0, 8)
+
+    for fixup_pos, blob in blobs:
+        out.extend(bytes(_align(len(out), 4) - len(out)))
+        struct.pack_into('<I', out, fixup_pos, len(out))
+        out.extend(blob)
+
+    return bytes(out)
+
+
+def build_sarc(entries=1000, version=3, max_size=4096, seed=0):
+    """
+    SARC archive with entries files of random content, the directory is written by FileSarc.header_serialize
+    """
+    rnd = random.Random(seed)
+    sarc = FileSarc()
+    sarc.ver2 = version
+    sarc.entries = []
+    contents = []
+    for i in range(entries):
+        ext = ('adf', 'blo', 'bin', 'ddsc')[i % 4]
+        entry = EntrySarc(i, 'gdc/synthetic/{:03d}/file_{:07d}.{}'.format(i % 997, i, ext).encode())
+        data = rnd.getrandbits(8 * 16).to_bytes(16, 'little') * (rnd.randrange(1, max_size) // 16 + 1)
+        entry.length = len(data)
+        entry.is_symlink = False
+        sarc.entries.append(entry)
+        contents.append(data)
+
+    f = ArchiveFile(_BytesFile())
+    sarc.header_serialize(f)
+    out = f.f.buffer
+    for entry, data in zip(sarc.entries, contents):
+        out[entry.offset:entry.offset + entry.length] = data
+    return bytes(out)
+
+
+def build_gdcc(entries=1000, max_size=4096, seed=0):
+    """
+    ADF wrapped gdc/global.gdcc archive with entries files of random content (see the layout above)
+    """
+    rnd = random.Random(seed)
+    v_paths = [
+        'gdc/synthetic/{:03d}/file_{:07d}.{}'.format(i % 97, i, 'rtpc' if i % 4 == 0 else 'adf').encode()
+        for i in range(entries)]
+
+    strings_pos = 32 + 32 * entries
+    strings = b''.join(v_path + b'\00' for v_path in v_paths)
+    instance = bytearray(_align(strings_pos + len(strings), 16))
+    instance[strings_pos:strings_pos + len(strings)] = strings
+
+    string_pos = strings_pos
+    for i, v_path in enumerate(v_paths):
+        data = rnd.getrandbits(8 * 16).to_bytes(16, 'little') * (rnd.randrange(1, max_size) // 16 + 1)
+        instance.extend(bytes(_align(len(instance), 16) - len(instance)))
+        record_offset = len(instance)
+        if i % 4 == 0:
+            filetype_hash = GDCC_RTPC_HASH
+            instance.extend(adf_array_header.pack(record_offset + 16, 0, len(data)) + bytes(4))
+        else:
+            filetype_hash = hash32_func('SyntheticAdf_{}'.format(i % 3))
+        instance.extend(data)
+        struct.pack_into('<8I', instance, 32 + 32 * i, record_offset, 16, filetype_hash, 0, string_pos, 16, 0, 0)
+        string_pos += len(v_path) + 1
+    struct.pack_into('<8I', instance, 0, 32, 16, entries, 0, len(instance), 16, entries, 0)
+
+    instance_offset = _align(adf_header.size + len(ADF_COMMENT) + 1, 16)
+    instance_table_offset = _align(instance_offset + len(instance), 8) + 8
+    nametable_offset = instance_table_offset + adf_instance_entry.size
+    nametable = bytes([len(GDCC_INSTANCE_NAME)]) + GDCC_INSTANCE_NAME + b'\00'
+    total_size = nametable_offset + len(nametable)
+
+    out = bytearray(total_size)
+    adf_header.pack_into(
+        out, 0, b' FDA', 4, 1, instance_table_offset, 0, nametable_offset, 0, 0, 1, nametable_offset, total_size,
+        0, 1, 0, 0, 0)
+    out[adf_header.size:adf_header.size + len(ADF_COMMENT)] = ADF_COMMENT
+    out[instance_offset:instance_offset + len(instance)] = instance
+    struct.pack_into('<I', out, instance_table_offset - 8, 12)
+    adf_instance_entry.pack_into(
+        out, instance_table_offset, hash32_func(GDCC_INSTANCE_NAME), GDCC_TYPE_HASH, instance_offset, len(instance),
+        0)
+    out[nametable_offset:] = nametable
+    return bytes(out)
+
+
+class _BytesFile:
+    # header_serialize writes the header and the zero fill up to the end of the data, that is the whole archive
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def tell(self):
+        return len(self.buffer)
+
+    def write(self, blk):
+        self.buffer += blk
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='kind', required=True)
+
+    p = sub.add_parser('adf')
+    p.add_argument('output', type=Path)
+    p.add_argument('--populations', type=int, default=11)
+    p.add_argument('--groups', type=int, default=25)
+    p.add_argument('--animals', type=int, default=6)
+    p.add_argument('--seed', type=int, default=0)
+
+    p = sub.add_parser('rtpc')
+    p.add_argument('output', type=Path)
+    p.add_argument('--depth', type=int, default=4)
+    p.add_argument('--fanout', type=int, default=4)
+    p.add_argument('--props', type=int, default=6)
+    p.add_argument('--seed', type=int, default=0)
+
+    p = sub.add_parser('gdcc')
+    p.add_argument('output', type=Path)
+    p.add_argument('--entries', type=int, default=1000)
+    p.add_argument('--seed', type=int, default=0)
+
+    p = sub.add_parser('sarc')
+    p.add_argument('output', type=Path)
+    p.add_argument('--entries', type=int, default=1000)
+    p.add_argument('--version', type=int, choices=(2, 3), default=3)
+    p.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+    if args.kind == 'adf':
+        data = build_animal_population_adf(args.populations, args.groups, args.animals, seed=args.seed)
+    elif args.kind == 'rtpc':
+        data = build_rtpc(args.depth, args.fanout, args.props, seed=args.seed)
+    elif args.kind == 'gdcc':
+        data = build_gdcc(args.entries, seed=args.seed)
+    else:
+        data = build_sarc(args.entries, args.version, seed=args.seed)
+    args.output.write_bytes(data)
+    print('Saved {} ({} bytes)'.format(args.output, len(data)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,13 @@
 import zlib
-from deca.file import ArchiveFile
-from deca.ff_adf import Adf
+from deca.file import map_file
+from deca.ff_adf import Adf, GdccArchive, adf_value_view
+from cotw.hashdb import load_hash_db
 from pathlib import Path 
 
 def _read_file(filename: Path, verbose = False):
     if verbose:
         print(f"Reading {filename}")
+    # the callers keep the bytes and write files next to it, a copy leaves no map open
     return filename.read_bytes()
 
 def _decompress_bytes(data_bytes: bytearray) -> bytearray:
@@ -26,20 +28,22 @@ def _save_file(filename: Path, data_bytes: bytearray, verbose = False):
     if verbose:
         print(f"Saved {filename}")
 
-def _parse_adf_file(filename: Path, suffix: str = None, verbose = False) -> Adf:
+def _parse_adf_file(filename: Path, suffix: str = None, verbose = False, array_view = False) -> Adf:
     obj = Adf()
-    with ArchiveFile(open(filename, 'rb')) as f:
-      obj.deserialize(f)
-    content = obj.dump_to_string()
+    with map_file(filename) as f:
+      obj.deserialize(f, array_view=array_view, gc_paused=True)
     suffix = f"_{suffix}.txt" if suffix else ".txt"
     txt_filename = Path.cwd() / f"{filename.name}{suffix}"
-    _save_file(txt_filename, bytearray(content, 'utf-8'), verbose)            
+    Path(txt_filename.parent).mkdir(exist_ok=True)
+    with txt_filename.open("w", encoding="utf-8", newline="") as f:
+      obj.dump(f, hash_db=load_hash_db())
+    if verbose:
+      print(f"Saved {txt_filename}")
     return obj
 
 def _decompress_adf_file(filename: Path, verbose = False) -> Path:
     # read entire adf file
     data_bytes = _read_file(filename, verbose)
-    data_bytes = bytearray(data_bytes)
 
     # split out header
     header = data_bytes[0:32]
@@ -47,10 +51,9 @@ def _decompress_adf_file(filename: Path, verbose = False) -> Path:
 
     # decompress data
     decompressed_data_bytes = _decompress_bytes(data_bytes)
-    decompressed_data_bytes = bytearray(decompressed_data_bytes)
 
     # split out compression header
-    decompressed_data_bytes = decompressed_data_bytes[5:]
+    decompressed_data_bytes = memoryview(decompressed_data_bytes)[5:]
 
     # save uncompressed adf data to file
     parsed_basename = filename.name
@@ -62,7 +65,6 @@ def _decompress_adf_file(filename: Path, verbose = False) -> Path:
 def _decompress_adf_headers(filename: Path, verbose = False):
     # read entire adf file
     data_bytes = _read_file(filename, verbose)
-    data_bytes = bytearray(data_bytes)
 
     # split out header
     header = data_bytes[0:32]
@@ -70,11 +72,10 @@ def _decompress_adf_headers(filename: Path, verbose = False):
 
     # decompress data
     decompressed_data_bytes = _decompress_bytes(data_bytes)
-    decompressed_data_bytes = bytearray(decompressed_data_bytes)
 
     # split out compression header
     decompressed_header = decompressed_data_bytes[0:5]
-    decompressed_data_bytes = decompressed_data_bytes[5:]
+    decompressed_data_bytes = memoryview(decompressed_data_bytes)[5:]
 
     # save uncompressed adf data to file
     parsed_basename = filename.name
@@ -114,10 +115,10 @@ class CellReference:
      return f"I:{self.cell_index}, D:{self.data_offset},{self.data_hex_offset} ({len(self.refs)})"
 
 
-def parse_adf(filename: Path, suffix: str = None, verbose = False) -> Adf:
+def parse_adf(filename: Path, suffix: str = None, verbose = False, array_view = False) -> Adf:
     if verbose:
         print(f"Parsing {filename}")
-    return _parse_adf_file(filename, suffix, verbose=verbose)
+    return _parse_adf_file(filename, suffix, verbose=verbose, array_view=array_view)
 
 def load_adfc(filename: Path, verbose = False) -> Adf:
     data_filename = _decompress_adf_file(filename, verbose=verbose)
@@ -126,54 +127,56 @@ def load_adfc(filename: Path, verbose = False) -> Adf:
     # data_filename.parent.rmdir()
     return adf
 
-def load_adf(filename: Path, verbose = False) -> Adf:
-    adf = parse_adf(filename, verbose=verbose)
+def load_adf(filename: Path, verbose = False, array_view = False) -> Adf:
+    adf = parse_adf(filename, verbose=verbose, array_view=array_view)
     return adf
   
 def load_adf_xls(filename: Path) -> None:
-  adf = load_adf(filename)
-  src = adf.table_instance_values[0]
-  src_full = adf.table_instance_full_values[0]
+  adf = load_adf(filename, array_view=True)
+  # member nodes of the instance, each has the value and its offset
+  src = adf.table_instance_full_values[0].value
   
-  cell_data_indices = src["Cell"]
+  cell_data_indices = adf_value_view(src["Cell"])
   if "BoolData" in src:
-    bool_data = src["BoolData"]
+    bool_data = src["BoolData"].value
+    bool_data_offset = int(src["BoolData"].data_offset)
   if "StringData" in src:    
-    string_data = src["StringData"]
+    string_data = src["StringData"].value
   if "ValueData" in src:
-    number_data = src["ValueData"]
+    number_data = src["ValueData"].value
+    number_data_offset = int(src["ValueData"].data_offset)
     
   sheets = {}
   numbers = {}
   
-  for i, sheet in enumerate(src["Sheet"]):
-    col_cnt = sheet["Cols"].item()
-    row_cnt = sheet["Rows"].item()
-    name = sheet["Name"].decode("utf-8")
-    cell_indices = sheet["CellIndex"]  
-    cell_index_full = src_full.value["Sheet"].value[i].value["CellIndex"]
-    cell_index_base_offset = cell_index_full.data_offset.item()
+  for sheet_full in src["Sheet"].value:
+    sheet = sheet_full.value
+    col_cnt = int(sheet["Cols"].value)
+    row_cnt = int(sheet["Rows"].value)
+    name = sheet["Name"].value.decode("utf-8")
+    cell_indices = sheet["CellIndex"].value
+    cell_index_base_offset = int(sheet["CellIndex"].data_offset)
     sheets[name] = []
     print(name)
     for row in range(row_cnt):
       for col in range(col_cnt):
-        cell_index = cell_indices[col + col_cnt * row].item()
+        cell_index = int(cell_indices[col + col_cnt * row])
         cell_info = cell_data_indices[cell_index]
         cell_type = cell_info["Type"]
         cell_format = _cell_format(cell_type)
-        cell_data_index = cell_info["DataIndex"].item()
+        cell_data_index = int(cell_info["DataIndex"])
         cell_lookup = f"{_column_format(col+1)}{row+1}"
         cell_index_offset = cell_index_base_offset + (4 * (col + col_cnt * row))
         
         if cell_format == "boolean":
           cell_data = bool_data[cell_data_index]
-          cell_data_offset = src_full.value["BoolData"].data_offset.item()
+          cell_data_offset = bool_data_offset
         elif cell_format == "string":
-          cell_data = string_data[cell_data_index].decode("utf-8")
-          cell_data_offset = src_full.value["StringData"].value[cell_data_index].data_offset.item()
+          cell_data = string_data[cell_data_index].value.decode("utf-8")
+          cell_data_offset = int(string_data[cell_data_index].data_offset)
         elif cell_format == "number":
-          cell_data = number_data[cell_data_index].item()
-          cell_data_offset = src_full.value["ValueData"].data_offset.item() + 4 * cell_data_index         
+          cell_data = float(number_data[cell_data_index])
+          cell_data_offset = number_data_offset + 4 * cell_data_index         
           if str(cell_data) not in numbers:
             numbers[str(cell_data)] = int(cell_index)
         else:
@@ -205,19 +208,13 @@ def load_adf_xls(filename: Path) -> None:
   }
 
 def extract_global_file(global_filename: Path, filename: str) -> None:
-  adf = parse_adf(global_filename)
-  for i, instance in enumerate(adf.table_instance_values):
-    for item in instance:
-      full = adf.table_instance[i]
-      if item.v_path.decode("Utf-8") == filename:
-        with global_filename.open("rb") as fp:
-          fp.seek(item.offset + full.offset)
-          data = fp.read(full.size)
-          write_path = Path.cwd() / Path(filename).parent
-          write_path.mkdir(parents=True, exist_ok=True)
-          (Path.cwd() / filename).write_bytes(data)
-          print("Extracted: ", filename)
-        break
+  with GdccArchive.open(global_filename) as archive:
+    data = archive.read(filename)
+    if data is not None:
+      write_path = Path.cwd() / Path(filename).parent
+      write_path.mkdir(parents=True, exist_ok=True)
+      (Path.cwd() / filename).write_bytes(data)
+      print("Extracted: ", filename)
 
 def load_global_gdcc(filename: Path) -> None:
   adf = parse_adf(filename)
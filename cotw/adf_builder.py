@@ -1,6 +1,11 @@
-import struct, json, re
+import struct, json, re, io, mmap, zipfile, hashlib
+import numpy as np
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
 from pathlib import Path
-from typing import Tuple, List
+from typing import Tuple, List, Union
+from deca.file import map_file
+from deca.ff_adf import Adf, AdfValue, adf_gc_paused, adf_type_size
 
 typedef_s8 = 1477249634
 typedef_u8 = 211976733
@@ -18,7 +23,11 @@ PRIMITIVE_2 = [typedef_s16, typedef_u16]
 PRIMITIVE_8 = [typedef_s64, typedef_u64, typedef_f64]
 STRUCTURE = 1
 ARRAY = 3
+INLINE_ARRAY = 4
+ENUMERATION = 8
 STRINGHASH = 9
+TYPE_STRING = 0x8955583e
+TYPE_DEFERRED = 0xdefe88ed
 
 def read_u32(data: bytearray) -> int:
   return struct.unpack("I", data)[0]
@@ -39,7 +48,7 @@ def read_u64(data: bytearray) -> int:
   return struct.unpack("Q", data)[0]
 
 def read_str(data: bytearray) -> str:
-  value = data[0:-1]
+  value = bytes(data[0:-1])
   return value.decode("utf-8")
 
 def write_value(data: bytearray, new_data: bytearray, offset: int) -> None:
@@ -51,112 +60,9 @@ def find_length_of_string(data: bytearray) -> bytearray:
       return i
   return 0
 
-def find_nametable_size(data: bytearray, count: int) -> int:
-  size = 0
+def find_nametable_size(data: bytearray, count: int, offset: int = 0) -> int:
   eos = 1
-  for i in range(count):
-    i_length = read_u8(data[i:i+1])
-    size += 1 + i_length + eos
-  return size
-
-def read_nametables(data: bytearray, count: int) -> List[str]:
-  nametable_sizes = []
-  nametables = []
-  for i in range(count):
-    i_length = read_u8(data[i:i+1])
-    nametable_sizes.append(i_length)
-  
-  table_offset = count
-  pointer = table_offset
-  
-  for i in range(count):
-    i_length = nametable_sizes[i]
-    nametables.append(read_str(data[pointer:pointer+i_length+1]))
-    pointer += i_length + 1
-  
-  return nametables
-
-def read_typemember(data: bytearray, nametables: List[str]) -> dict:
-  name_index = read_u64(data[0:8]) 
-  name = nametables[name_index]
-  type_hash = read_u32(data[8:12])
-  size = read_u32(data[12:16])
-  offset = read_u32(data[16:20])
-  return {
-    "name": name,
-    "type_hash": type_hash,
-    "size": size,
-    "offset": offset
-  }
-
-def read_typedef(header: bytearray, offset: int, nametables: List[str]) -> Tuple[int, dict]:
-  header_size = 36
-  member_size = 32
-  metatype = read_u32(header[0:4])
-  size = read_u32(header[4:8])
-  type_hash = read_u32(header[12:16])
-  name_index = read_u64(header[16:24])
-  element_type_hash = read_u32(header[28:32])
-  name = nametables[name_index]
-  
-  if metatype == 1:
-    member_count = read_u32(header[header_size:header_size+4])
-    structure_size = header_size + 4 + (member_size * member_count)
-    members = []
-    for i in range(member_count):
-      pointer = i * member_size
-      members.append(read_typemember(header[header_size+4+pointer:], nametables))
-    return (structure_size, {
-      "name": name, 
-      "metatype": metatype,
-      "type_hash": type_hash,
-      "start": offset, 
-      "end": offset + structure_size,
-      "size": size,
-      "members": members
-    })
-  elif metatype == 0:
-    return (header_size, {
-      "name": name, 
-      "metatype": metatype,
-      "type_hash": type_hash,
-      "start": offset, 
-      "end": offset + header_size
-    })
-  else:
-    return (header_size+4, {
-      "name": name, 
-      "metatype": metatype,
-      "type_hash": type_hash,
-      "element_type_hash": element_type_hash,
-      "start": offset, 
-      "end": offset+header_size+4
-    })
-
-def find_typedef_offset(data: bytearray, typedef_offset: int, count: int, nametables: List[str]) -> dict:
-  pointer = typedef_offset
-  offsets = []
-  for i in range(count):
-    read_size, info = read_typedef(data[pointer:], pointer, nametables)
-    pointer += read_size
-    offsets.append(info)
-  
-  type_map = {}
-  for offset in offsets:
-    type_map[offset["type_hash"]] = { 
-      "name": offset["name"], 
-      "metatype": offset["metatype"],
-      "size": offset["size"] if "size" in offset else None,
-      "element_type_hash": offset["element_type_hash"] if "element_type_hash" in offset else None,
-      "members": offset["members"] if "members" in offset else []
-    }
-  
-  return {
-    "start": typedef_offset,
-    "end": pointer,
-    "offsets": offsets,
-    "type_map": type_map
-  }
+  return count + sum(data[offset:offset+count]) + count * eos
 
 def get_primitive_size(type_id: int) -> int:
   if type_id in PRIMITIVE_1:
@@ -168,87 +74,93 @@ def get_primitive_size(type_id: int) -> int:
   else:
     return 4
 
-def read_instance(data: bytearray, offset: int, pointer: int, type_id: int, type_map: dict) -> dict:
-  value = None
-  pos = offset+pointer
-  
+def profile_struct_plan(type_def, memo: dict) -> List[Tuple[str, int, int, int]]:
+  # (name, offset, type, primitive size or None) of every member, made once per struct type
+  plan = memo.get(type_def.type_hash)
+  if plan is None:
+    plan = []
+    for m in type_def.members:
+      prim_size = get_primitive_size(m.type_hash) if m.type_hash in PRIMITIVES else None
+      plan.append((m.name_utf8, m.offset | (m.bit_offset << 24), m.type_hash, prim_size))
+    memo[type_def.type_hash] = plan
+  return plan
+
+def read_instance(data: bytearray, v, pos: int, type_id: int, map_typedef: dict, memo: dict = None):
+  """
+  Profile of a value the deca decoder read at pos: offsets of structures, members and arrays, array headers and a
+  "Kind (size, pos)" string for leaves. v is the AdfValue, or None where the decoder keeps no AdfValue (elements of
+  primitive arrays and of structured array views), only arrays need it, for their data offset.
+  """
+  if memo is None:
+    memo = {}
   if type_id in PRIMITIVES:
-    primitive_size = get_primitive_size(type_id)
-    value = f"Primitive ({primitive_size}, {pos})"
-    pointer += primitive_size # TODO: READ
-  else:
-    type_def = type_map[type_id]
-    if type_def["metatype"] == STRUCTURE:
-      value = {}
-      value["structure_offset"] = (pos, pos+type_def["size"])
-      value["size"] = type_def["size"]   
-      org_pointer = pointer
-      for m in type_def["members"]:
-        m_offset = m["offset"]
-        pointer = org_pointer + m_offset
-        v = read_instance(data, offset, pointer, int(m["type_hash"]), type_map)
-        value[m["name"]] = { 
-          "member_rel_offset": m_offset,
-          "member_offset": pointer+offset,
-          "value": v[0]
-        }
-      pointer = org_pointer + type_def["size"] # TODO: READ
-    elif type_def["metatype"] == ARRAY:
-      array_offset = read_u32(data[pos:pos+4])
-      flags = read_u32(data[pos+4:pos+8])
-      length = read_u32(data[pos+8:pos+12]) 
-      array_header_size = 12
-      org_pos = pos
-      pointer += array_header_size
-      org_pointer = pointer
-      pos = offset+pointer
-      value = { "Array": { 
-        "name": type_def["name"], 
-        "header_offset": (org_pos, org_pos+array_header_size),
-        "flags": flags,
-        "length": length
-      }}
-      pointer = array_offset
-      
-      if length > 0:
-        element_type = type_def["element_type_hash"]
-        new_pointer = pointer
-        values = []
-        for i in range(length):
-          v, new_pointer = read_instance(data, offset, new_pointer, int(element_type), type_map)
-          values.append(v)
-        value["Array"]["type"] = "Primitives" if element_type in PRIMITIVES else "Structures"
-        value["Array"]["array_offset"] = (offset+pointer, offset+new_pointer)
-        value["Array"]["values"] = values
-      
-      pointer = org_pointer
-    elif type_def["metatype"] == STRINGHASH:
-      print(type_def["name"], type_def["size"])
-      if type_def["size"] == 4:
-        value = f"String Hash (4, {pos})"
-        pointer += 4      
-    else:
-      print(f"Unknown metatype: {type_def['metatype']}")
-  
-  return (value, pointer)
-
-def find_instance_offset(data: bytearray, offset: int, count: int, nametables: List[str], type_map: dict) -> dict:
+    return f"Primitive ({get_primitive_size(type_id)}, {pos})"
+  elif type_id == TYPE_STRING:
+    return f"String (8, {pos})"
+  elif type_id == TYPE_DEFERRED:
+    return f"Deferred (16, {pos})"
+
+  type_def = map_typedef[type_id]
+  if type_def.metatype == STRUCTURE:
+    value = {}
+    value["structure_offset"] = (pos, pos+type_def.size)
+    value["size"] = type_def.size
+    members = v.value if isinstance(v, AdfValue) else None
+    for name, m_offset, m_type, prim_size in profile_struct_plan(type_def, memo):
+      m_pos = pos + m_offset
+      if prim_size is not None:
+        m_value = f"Primitive ({prim_size}, {m_pos})"
+      else:
+        m_value = read_instance(data, members[name] if members is not None else None, m_pos, m_type, map_typedef, memo)
+      value[name] = {
+        "member_rel_offset": m_offset,
+        "member_offset": m_pos,
+        "value": m_value
+      }
+    return value
+  elif type_def.metatype == ARRAY:
+    _, flags, length = struct.unpack_from("3I", data, pos)
+    array_header_size = 12
+    value = { "Array": { 
+      "name": type_def.name.decode("utf-8"), 
+      "header_offset": (pos, pos+array_header_size),
+      "flags": flags,
+      "length": length
+    }}
+    if length > 0:
+      element_type = type_def.element_type_hash
+      element_size = adf_type_size(element_type, map_typedef)
+      start = int(v.data_offset)
+      end = start + length*element_size
+      value["Array"]["type"] = "Primitives" if element_type in PRIMITIVES else "Structures"
+      value["Array"]["array_offset"] = (start, end)
+      if element_type in PRIMITIVES:
+        values = [f"Primitive ({element_size}, {p})" for p in range(start, end, element_size)]
+      else:
+        elements = v.value if not isinstance(v.value, np.ndarray) else [None] * length
+        values = [
+          read_instance(data, element, p, element_type, map_typedef, memo)
+          for element, p in zip(elements, range(start, end, element_size))
+        ]
+      value["Array"]["values"] = values
+    return value
+  elif type_def.metatype == STRINGHASH and type_def.size == 4:
+    return f"String Hash (4, {pos})"
+  return None
+
+def find_instance_offset(data: bytearray, adf: Adf) -> dict:
   instance_header_size = 24
   instances = []
-  for i in range(count):
-    pointer = offset + i * count
-    instance_type = read_u32(data[pointer+4:pointer+8])
-    instance_offset = read_u32(data[pointer+8:pointer+12])
-    instance_size = read_u32(data[pointer+12:pointer+16])
-    instance_name = nametables[read_u64(data[pointer+16:pointer+24])]
+  memo = {}
+  for ins, v in zip(adf.table_instance, adf.table_instance_full_values):
     instances.append({ 
-      "offset": (instance_offset, instance_offset + instance_size), 
-      "size": instance_size, 
-      f"{instance_name}": read_instance(data, instance_offset, 0, instance_type, type_map)[0]
+      "offset": (ins.offset, ins.offset + ins.size), 
+      "size": ins.size, 
+      f"{ins.name.decode('utf-8')}": read_instance(data, v, ins.offset, ins.type_hash, adf.extended_map_typedef, memo)
     })
   
   return {
-    "offset": (offset, offset + count*instance_header_size),
+    "offset": (adf.instance_offset, adf.instance_offset + len(adf.table_instance)*instance_header_size),
     "instances": instances
   }
   
@@ -271,7 +183,9 @@ def find_population_array_offsets(offsets: dict, result: List[dict] = [], org_pa
           "index": index,
           "length": array_details["length"],
           "header": array_details["header_offset"],
-          "values": array_details["array_offset"] if "array_offset" in array_details else None
+          "values": array_details["array_offset"] if "array_offset" in array_details else None,
+          "type": array_details["type"] if "type" in array_details else None,
+          "flags": array_details["flags"]
         })
                 
         if "values" in array_details:
@@ -378,27 +292,26 @@ def profile_header(data: bytearray) -> dict:
     "header_end": 64
   }  
 
-def create_profile(filename: Path) -> None:
-  data = bytearray(filename.read_bytes())
-  header_profile = profile_header(data)
-  instance_count = header_profile["instance_count"]
-  instance_offset = header_profile["instance_offset"]
-  typedef_count = header_profile["typedef_count"]
-  typedef_offset = header_profile["typedef_offset"]
-  stringhash_count = header_profile["stringhash_count"]
-  stringhash_offset = header_profile["stringhash_offset"]  
-  nametable_count = header_profile["nametable_count"]
-  nametable_offset = header_profile["nametable_offset"]
-  total_size = header_profile["total_size"]
-  comment_size = find_length_of_string(data[64:])
-  nametable_size = find_nametable_size(data[nametable_offset:], nametable_count)
-  nametables = read_nametables(data[nametable_offset:], nametable_count)
-  typedef_offsets = find_typedef_offset(data, typedef_offset, typedef_count, nametables)
-  type_map = typedef_offsets["type_map"]
-  instance_offsets = find_instance_offset(data, instance_offset, instance_count, nametables, type_map)
+def create_profile(filename: Path) -> dict:
+  with map_file(filename) as fp:
+    adf = Adf()
+    adf.deserialize(fp, array_view=True, gc_paused=True)
+    fp.seek(0)
+    return profile_adf(fp.read_view(), adf)
+
+def profile_adf(data: bytearray, adf: Adf) -> dict:
+  """
+  Layout profile of a file already decoded with deca, data is the whole file. The offsets come from the AdfValue tree
+  and the typedefs, so decoding once gives both the values and the profile.
+  """
+  comment_size = len(adf.comment)
+  nametable_size = find_nametable_size(data, adf.nametable_count, adf.nametable_offset)
+  typedef_end = adf.typedef_offset + sum(t.serialized_size() for t in adf.table_typedef)
+  with adf_gc_paused():
+    instance_offsets = find_instance_offset(data, adf)
   
   return {
-    "total_size": total_size,
+    "total_size": adf.total_size,
     "header_start": 0,
     "header_instance_offset": 12,
     "header_typedef_offset": 20,
@@ -412,12 +325,12 @@ def create_profile(filename: Path) -> None:
     "instance_end": instance_offsets["instances"][0]["offset"][0] + instance_offsets["instances"][0]["size"],
     "instance_header_start": instance_offsets["offset"][0],
     "instance_header_end": instance_offsets["offset"][1],    
-    "typedef_start": typedef_offset,
-    "typedef_end": typedef_offsets["end"],    
-    "stringhash_start": stringhash_offset,
-    "stringhash_end": nametable_offset,
-    "nametable_start": nametable_offset,
-    "nametable_end": nametable_offset+nametable_size,
+    "typedef_start": adf.typedef_offset,
+    "typedef_end": typedef_end,    
+    "stringhash_start": adf.stringhash_offset,
+    "stringhash_end": adf.nametable_offset,
+    "nametable_start": adf.nametable_offset,
+    "nametable_end": adf.nametable_offset+nametable_size,
     "details": {
       "instance_offsets": instance_offsets
     }
@@ -431,6 +344,331 @@ def find_arrays(profile: dict) -> Tuple[List[AdfArray], List[AdfArray]]:
   other_arrays = [create_array(x, instance_offset) for x in array_offsets if x["key"] != 'Animals']
   return (animal_arrays, other_arrays)
 
+RELOCATION_KINDS = ["header", "instance", "size", "array", "chain", "string", "deferred"]
+
+class RelocationTable:
+  """
+  Every pointer bearing u32 of a file: where it is (slot), the position it points at (target) and what it is
+  relative to (base), the u32 holds target - base. Targets, slots and bases are each kept sorted, slot_entries and
+  base_entries give the entry of each sorted slot and base. An insert at P moves everything at or after P, the order
+  of each column is unchanged, so it is a bisect and one add over the tail slice of each.
+  """
+  def __init__(self, entries: List[Tuple[int, int, int, str]]) -> None:
+    entries = sorted(entries, key=lambda x: x[1])
+    slots, targets, bases, kinds = zip(*entries) if entries else ((), (), (), ())
+    self.targets = np.array(targets, dtype=np.int64)
+    self.kinds = np.array([RELOCATION_KINDS.index(x) for x in kinds], dtype=np.uint8)
+    slots = np.array(slots, dtype=np.int64)
+    bases = np.array(bases, dtype=np.int64)
+    self.slot_entries = np.argsort(slots, kind="stable")
+    self.slots = slots[self.slot_entries]
+    self.base_entries = np.argsort(bases, kind="stable")
+    self.bases = bases[self.base_entries]
+
+  def __len__(self) -> int:
+    return len(self.targets)
+
+  def insert(self, position: int, size: int) -> None:
+    self.targets[np.searchsorted(self.targets, position, side="left"):] += size
+    self.slots[np.searchsorted(self.slots, position, side="left"):] += size
+    self.bases[np.searchsorted(self.bases, position, side="left"):] += size
+
+  def entry_slots(self) -> np.ndarray:
+    slots = np.empty_like(self.slots)
+    slots[self.slot_entries] = self.slots
+    return slots
+
+  def values(self) -> np.ndarray:
+    bases = np.empty_like(self.bases)
+    bases[self.base_entries] = self.bases
+    return self.targets - bases
+
+  def apply(self, data: bytearray) -> None:
+    view = np.frombuffer(data, dtype=np.uint8)
+    values = self.values().astype("<u4").view(np.uint8).reshape(-1, 4)
+    view[self.entry_slots()[:, None] + np.arange(4)] = values
+
+def has_pointers(type_id: int, map_typedef: dict, memo: dict) -> bool:
+  if type_id in memo:
+    return memo[type_id]
+  memo[type_id] = False
+  if type_id in [TYPE_STRING, TYPE_DEFERRED]:
+    result = True
+  elif type_id in PRIMITIVES or type_id not in map_typedef:
+    result = False
+  else:
+    type_def = map_typedef[type_id]
+    if type_def.metatype == ARRAY:
+      result = True
+    elif type_def.metatype == STRUCTURE:
+      result = any(has_pointers(m.type_hash, map_typedef, memo) for m in type_def.members)
+    elif type_def.metatype == INLINE_ARRAY:
+      result = has_pointers(type_def.element_type_hash, map_typedef, memo)
+    else:
+      result = False
+  memo[type_id] = result
+  return result
+
+def find_pointers(data: bytearray, instance_start: int, pos: int, type_id: int, map_typedef: dict, memo: dict, entries: List[Tuple[int, int, int, str]]) -> None:
+  # the value of type_id at pos, only types holding pointers are walked
+  if not has_pointers(type_id, map_typedef, memo):
+    return
+  if type_id == TYPE_STRING:
+    entries.append((pos, instance_start + struct.unpack_from("I", data, pos)[0], instance_start, "string"))
+  elif type_id == TYPE_DEFERRED:
+    offset, _, deferred_type, _ = struct.unpack_from("4I", data, pos)
+    if offset != 0 and deferred_type != 0:
+      entries.append((pos, instance_start + offset, instance_start, "deferred"))
+      find_pointers(data, instance_start, instance_start + offset, deferred_type, map_typedef, memo, entries)
+  else:
+    type_def = map_typedef[type_id]
+    if type_def.metatype == STRUCTURE:
+      for m in type_def.members:
+        find_pointers(data, instance_start, pos + m.offset, m.type_hash, map_typedef, memo, entries)
+    elif type_def.metatype == ARRAY:
+      offset, chain, length = struct.unpack_from("3I", data, pos)
+      if length == 0:
+        return
+      entries.append((pos, instance_start + offset, instance_start, "array"))
+      if chain != 0:
+        # relocation chain, the distance to the next non empty array header
+        entries.append((pos+4, pos + chain, pos, "chain"))
+      element_type = type_def.element_type_hash
+      if has_pointers(element_type, map_typedef, memo):
+        element_size = adf_type_size(element_type, map_typedef)
+        for i in range(length):
+          find_pointers(data, instance_start, instance_start + offset + i*element_size, element_type, map_typedef, memo, entries)
+    elif type_def.metatype == INLINE_ARRAY:
+      element_type = type_def.element_type_hash
+      element_size = adf_type_size(element_type, map_typedef)
+      for i in range(type_def.element_length):
+        find_pointers(data, instance_start, pos + i*element_size, element_type, map_typedef, memo, entries)
+
+def profile_relocations(data: bytearray, profile: dict, adf: Adf = None) -> RelocationTable:
+  """
+  RelocationTable of a profiled file: the section offsets in the header, the offset and size of every instance and,
+  inside the instances, every array data offset, relocation chain value, string offset and deferred value offset.
+  adf is the file decoded with deca (create_profile / profile_adf), without it only the header and typedefs are read.
+  """
+  if adf is None:
+    adf = Adf()
+    adf.deserialize(data, process_instances=False)
+  entries = [
+    (profile["header_instance_offset"], profile["instance_header_start"], 0, "header"),
+    (profile["header_typedef_offset"], profile["typedef_start"], 0, "header"),
+    (profile["header_nametable_offset"], profile["nametable_start"], 0, "header"),
+    (profile["header_total_size_offset"], profile["total_size"], 0, "header")
+  ]
+  if profile["stringhash_start"] != 0:
+    entries.append((profile["header_stringhash_offset"], profile["stringhash_start"], 0, "header"))
+
+  memo = {}
+  for i, ins in enumerate(adf.table_instance):
+    pointer = profile["instance_header_start"] + i * 24
+    entries.append((pointer+8, ins.offset, 0, "instance"))
+    entries.append((pointer+12, ins.offset + ins.size, ins.offset, "size"))
+    find_pointers(data, ins.offset, ins.offset, ins.type_hash, adf.extended_map_typedef, memo, entries)
+  return RelocationTable(entries)
+
+PROFILE_FORMAT = 1
+PROFILE_SECTION_KEYS = [
+  "total_size", "header_start", "header_instance_offset", "header_typedef_offset", "header_stringhash_offset",
+  "header_nametable_offset", "header_total_size_offset", "header_end", "comment_start", "comment_end",
+  "instance_start", "instance_end", "instance_header_start", "instance_header_end", "typedef_start", "typedef_end",
+  "stringhash_start", "stringhash_end", "nametable_start", "nametable_end"
+]
+PROFILE_KINDS = ["Primitives", "Structures", "Empty"]
+
+def pack_strings(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+  # utf-8 blob and the start of every string in it, plus the end of the last one
+  encoded = [x.encode("utf-8") for x in values]
+  offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+  offsets[1:] = np.cumsum([len(x) for x in encoded])
+  return (np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+class ProfileColumns:
+  """
+  Columnar create_profile: the section offsets and one row per array of the first instance, in the order
+  find_population_array_offsets gives them, as parallel arrays
+    path_id, name_id  into the path (path and key, "Populations[0];Groups[1];Animals") and type name tables
+    kind              PROFILE_KINDS, element type or empty
+    index             index of the element holding the array
+    header_start, data_start, data_end, length, flags
+  Saved as an uncompressed .npz, load() memory maps it and reads the columns in place, the map is released by
+  close() or at the end of a with block.
+  """
+  def __init__(self, columns: dict, buffer: mmap.mmap = None) -> None:
+    self.columns = columns
+    self.buffer = buffer
+
+  def __enter__(self) -> "ProfileColumns":
+    return self
+
+  def __exit__(self, t, value, traceback) -> None:
+    self.close()
+
+  def close(self) -> None:
+    # columns handed out before keep the map until they are collected
+    self.columns = None
+    if self.buffer is not None:
+      buffer, self.buffer = self.buffer, None
+      try:
+        buffer.close()
+      except BufferError:
+        pass
+
+  def __len__(self) -> int:
+    return len(self.columns["path_id"])
+
+  def __getitem__(self, key: str) -> np.ndarray:
+    return self.columns[key]
+
+  @classmethod
+  def from_profile(cls, profile: dict) -> "ProfileColumns":
+    instance = profile["details"]["instance_offsets"]["instances"][0]
+    array_offsets = find_population_array_offsets(instance["0"], [])
+    paths = {}
+    names = {}
+    rows = []
+    for offset in array_offsets:
+      path_id = paths.setdefault(array_key(offset), len(paths))
+      name_id = names.setdefault(offset["name"], len(names))
+      header = offset["header"][0]
+      if offset["values"] is None:
+        kind = PROFILE_KINDS.index("Empty")
+        data_start, data_end = (0, 0)
+      else:
+        kind = PROFILE_KINDS.index(offset["type"])
+        data_start, data_end = offset["values"]
+      rows.append((path_id, name_id, kind, offset["index"], header, data_start, data_end, offset["length"], offset["flags"]))
+
+    path_blob, path_offsets = pack_strings(list(paths))
+    name_blob, name_offsets = pack_strings(list(names))
+    columns = dict(zip(
+      ["path_id", "name_id", "kind", "index", "header_start", "data_start", "data_end", "length", "flags"],
+      [np.array(x, dtype=dtype) for x, dtype in zip(zip(*rows) if rows else [()] * 9, [
+        np.int32, np.int32, np.uint8, np.int32, np.int64, np.int64, np.int64, np.uint32, np.uint32])]
+    ))
+    columns.update({
+      "format": np.array([PROFILE_FORMAT], dtype=np.int32),
+      "sections": np.array([profile[x] for x in PROFILE_SECTION_KEYS], dtype=np.int64),
+      "paths": path_blob,
+      "path_offsets": path_offsets,
+      "names": name_blob,
+      "name_offsets": name_offsets
+    })
+    return cls(columns)
+
+  def save(self, filename: Path) -> None:
+    with open(filename, "wb") as f:
+      np.savez(f, **self.columns)
+
+  @classmethod
+  def load(cls, filename: Path) -> "ProfileColumns":
+    columns, buffer = load_npz_mapped(filename)
+    if columns.get("format") is None or int(columns["format"][0]) != PROFILE_FORMAT:
+      columns = None
+      buffer.close()
+      raise ValueError(f"{filename}: not a profile of format {PROFILE_FORMAT}")
+    return cls(columns, buffer)
+
+  def sections(self) -> dict:
+    return dict(zip(PROFILE_SECTION_KEYS, self.columns["sections"].tolist()))
+
+  def path(self, path_id: int) -> str:
+    start, end = self.columns["path_offsets"][path_id:path_id+2]
+    return bytes(self.columns["paths"][start:end]).decode("utf-8")
+
+  def name(self, name_id: int) -> str:
+    start, end = self.columns["name_offsets"][name_id:name_id+2]
+    return bytes(self.columns["names"][start:end]).decode("utf-8")
+
+  def array_offsets(self) -> List[dict]:
+    """
+    The rows in the form find_population_array_offsets gives
+    """
+    result = []
+    empty = PROFILE_KINDS.index("Empty")
+    names = [self.name(i) for i in range(len(self.columns["name_offsets"]) - 1)]
+    for path_id, name_id, kind, index, header, data_start, data_end, length, flags in zip(*[self.columns[x].tolist() for x in [
+        "path_id", "name_id", "kind", "index", "header_start", "data_start", "data_end", "length", "flags"]]):
+      path, _, key = self.path(path_id).rpartition(";")
+      result.append({
+        "path": f"{path};" if path else "",
+        "key": key,
+        "name": names[name_id],
+        "index": index,
+        "length": length,
+        "header": (header, header+12),
+        "values": None if kind == empty else (data_start, data_end),
+        "type": None if kind == empty else PROFILE_KINDS[kind],
+        "flags": flags
+      })
+    return result
+
+  def to_json(self) -> dict:
+    """
+    Sections and arrays as plain values, for reading, the profile itself stays in the .npz
+    """
+    return { "sections": self.sections(), "arrays": self.array_offsets() }
+
+def load_npz_mapped(filename: Path) -> Tuple[dict, mmap.mmap]:
+  """
+  Arrays of an uncompressed .npz as read only views of a memory map of the file, and the map, which the caller
+  closes once the arrays are no longer used
+  """
+  with open(filename, "rb") as f:
+    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  arrays = {}
+  with zipfile.ZipFile(filename) as z:
+    for info in z.infolist():
+      if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError(f"{filename}: {info.filename} is compressed and can not be mapped")
+      name_length, extra_length = struct.unpack_from("<HH", buffer, info.header_offset + 26)
+      pos = info.header_offset + 30 + name_length + extra_length
+      if buffer[pos+6] == 1:
+        header_end = pos + 10 + struct.unpack_from("<H", buffer, pos + 8)[0]
+      else:
+        header_end = pos + 12 + struct.unpack_from("<I", buffer, pos + 8)[0]
+      header = io.BytesIO(buffer[pos:header_end])
+      version = np.lib.format.read_magic(header)
+      if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(header)
+      else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(header)
+      count = int(np.prod(shape))
+      if count == 0:
+        array = np.empty(shape, dtype=dtype)
+      else:
+        array = np.frombuffer(buffer, dtype=dtype, count=count, offset=header_end)
+        array = array.reshape(shape, order="F" if fortran_order else "C")
+      arrays[info.filename[:-4] if info.filename.endswith(".npy") else info.filename] = array
+  return arrays, buffer
+
+PROFILE_CACHE_DIR = Path.home() / ".cache" / "cotw-process" / "profiles"
+
+def content_hash(data: bytearray) -> str:
+  return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def cached_profile(file: Path, cache_dir: Path = PROFILE_CACHE_DIR, data: bytearray = None) -> ProfileColumns:
+  """
+  ProfileColumns of file from cache_dir, keyed by the hash of its content and PROFILE_FORMAT, profiled and saved there
+  on a miss. data is the content when already read.
+  """
+  if data is None:
+    data = file.read_bytes()
+  filename = Path(cache_dir) / f"{content_hash(data)}.v{PROFILE_FORMAT}.npz"
+  if filename.exists():
+    return ProfileColumns.load(filename)
+
+  columns = ProfileColumns.from_profile(create_profile(file))
+  filename.parent.mkdir(parents=True, exist_ok=True)
+  # write next to it and rename, a reader never sees half a file
+  partial = filename.with_suffix(".partial")
+  columns.save(partial)
+  partial.replace(filename)
+  return columns
+
 def insert_animal(data:bytearray, animal: Animal, array: AdfArray) -> None:
   write_value(data, create_u32(array.length+1), array.header_length_offset) 
   animal_bytes = animal.to_bytes()
@@ -456,37 +694,205 @@ def update_non_instance_offsets(data: bytearray, profile: dict, added_size: int)
       new_value = 0
     write_value(data, create_u32(new_value), offset[0])
 
-def _update_instance_arrays(data: bytearray, other_arrays: List[AdfArray], target_array: AdfArray, size: int):
-  for array in other_arrays: # find all arrays after me and update
-    if array.array_start_offset >= target_array.array_end_offset and array.array_start_offset != 0:
-      print("Other", array)
-      array.array_start_offset = array.array_start_offset + size
-      array.array_end_offset = array.array_end_offset + size
-      array.rel_array_start_offset = array.rel_array_start_offset + size
-      write_value(data, create_u32(array.rel_array_start_offset), array.header_array_offset)
-
 def insert_array_data(file: Path, new_data: bytearray, header_offset: int, data_offset: int, array_length: int, old_array_length: int = None) -> None:
-  profile = create_profile(file)
-  _, other_arrays = find_arrays(profile)
-  print("Size of other arrays", len(other_arrays))
-  target_array = None
-  for a in other_arrays:
-    if a.header_array_offset == header_offset:
-      target_array = a
-      break
-    
-  data = bytearray(file.read_bytes())
-  if target_array:
-    print("Target", target_array)
-    _update_instance_arrays(data, other_arrays, target_array, len(new_data))
-    
-  update_non_instance_offsets(data, profile, len(new_data))
+  raw = file.read_bytes()
+  adf = Adf()
+  adf.deserialize(raw, array_view=True, gc_paused=True)
+  profile = profile_adf(raw, adf)
+  data = bytearray(raw)
+  relocations = profile_relocations(raw, profile, adf)
+  relocations.insert(data_offset, len(new_data))
   print(read_u32(data[header_offset+8:header_offset+12]), array_length)
   print("Length", len(new_data))
   write_value(data, create_u32(array_length), header_offset+8)
   data[data_offset:data_offset] = new_data
+  relocations.apply(data)
   (file.parent / f"{file.name}_u" ).write_bytes(data)
 
+ARRAY_DATA_ALIGNMENT = 8
+INSTANCE_ALIGNMENT = 16
+INSERT_MODES = ["shift", "tail"]
+
+def align(value: int, alignment: int) -> int:
+  return (value + alignment - 1) // alignment * alignment
+
+def array_key(offset: dict) -> str:
+  return f"{offset['path']}{offset['key']}"
+
+def records_to_bytes(records, element_size: int, key: str) -> Tuple[bytes, int]:
+  if isinstance(records, (bytes, bytearray, memoryview)):
+    blob = bytes(records)
+  else:
+    items = [x.to_bytes() if hasattr(x, "to_bytes") else bytes(x) for x in records]
+    if any(len(x) != element_size for x in items):
+      raise ValueError(f"{key}: records must be {element_size} bytes")
+    blob = b"".join(items)
+  if len(blob) % element_size != 0:
+    raise ValueError(f"{key}: {len(blob)} bytes is not a whole number of {element_size} byte records")
+  return (blob, len(blob) // element_size)
+
+def plan_inserts(array_offsets: List[dict], inserts: List[Tuple[Union[str, int], object]]) -> List[Tuple[int, bytes, dict, int]]:
+  """
+  Resolve (array, records) pairs to (insert position, bytes, array offsets, new length), sorted by position.
+  array is the path find_population_array_offsets gives plus the key, e.g. "Populations[0];Groups[1];Animals", or
+  the offset of the array header. records are the bytes of whole elements, or a list of elements as bytes or with a
+  to_bytes() like Animal. Records for the same array are appended in order.
+  """
+  by_key = {}
+  for offset in array_offsets:
+    by_key[array_key(offset)] = offset
+    by_key[offset["header"][0]] = offset
+
+  planned = {}
+  for array, records in inserts:
+    offset = by_key.get(array)
+    if offset is None:
+      raise ValueError(f"No array {array}")
+    key = array_key(offset)
+    if offset["values"] is None:
+      raise ValueError(f"{key}: inserting into an empty array is not supported")
+    element_size = (offset["values"][1] - offset["values"][0]) // offset["length"]
+    blob, count = records_to_bytes(records, element_size, key)
+    if offset["header"][0] in planned:
+      position, chunks, _, length = planned[offset["header"][0]]
+      planned[offset["header"][0]] = (position, chunks + [blob], offset, length + count)
+    else:
+      planned[offset["header"][0]] = (offset["values"][1], [blob], offset, offset["length"] + count)
+
+  return sorted(((p, b"".join(c), o, n) for p, c, o, n in planned.values()), key=lambda x: x[0])
+
+def section_patches(profile: dict, added: int, instance_size: int) -> dict:
+  # header offsets of the sections after the instance data and the instance size, by their position in the file
+  patches = {
+    profile["header_instance_offset"]: profile["instance_header_start"] + added,
+    profile["header_typedef_offset"]: profile["typedef_start"] + added,
+    profile["header_nametable_offset"]: profile["nametable_start"] + added,
+    profile["header_total_size_offset"]: profile["total_size"] + added,
+    profile["instance_header_start"]+12: instance_size
+  }
+  if profile["stringhash_start"] != 0:
+    patches[profile["header_stringhash_offset"]] = profile["stringhash_start"] + added
+  return patches
+
+def shift_inserts(data: memoryview, profile: dict, planned: List[Tuple[int, bytes, dict, int]], adf: Adf = None) -> bytearray:
+  for _, blob, offset, _ in planned:
+    if len(blob) % ARRAY_DATA_ALIGNMENT != 0:
+      raise ValueError(f"{array_key(offset)}: {len(blob)} bytes would leave the data after it unaligned")
+
+  # last insert first, the positions of the ones before it do not move
+  relocations = profile_relocations(data, profile, adf)
+  for position, blob, _, _ in reversed(planned):
+    relocations.insert(position, len(blob))
+
+  added = sum(len(x[1]) for x in planned)
+  result = bytearray(len(data) + added)
+  src = 0
+  dst = 0
+  for position, blob in [(x[0], x[1]) for x in planned] + [(len(data), b"")]:
+    result[dst:dst+position-src] = data[src:position]
+    dst += position - src
+    result[dst:dst+len(blob)] = blob
+    dst += len(blob)
+    src = position
+  relocations.apply(result)
+
+  # array headers sit in front of their own data, only earlier inserts move them
+  positions = [x[0] for x in planned]
+  shifts = [0] + list(accumulate(len(x[1]) for x in planned))
+  for _, _, offset, length in planned:
+    header = offset["header"][0]
+    struct.pack_into("I", result, header + shifts[bisect_right(positions, header)] + 8, length)
+  return result
+
+def tail_inserts(data: memoryview, profile: dict, array_offsets: List[dict], planned: List[Tuple[int, bytes, dict, int]]) -> bytearray:
+  instance_start = profile["instance_start"]
+  instance_end = profile["instance_end"]
+  headers = sorted(x["header"][0] for x in array_offsets)
+
+  # the grown arrays go after the instance data, nothing in front of them moves
+  result = bytearray(data[:instance_end])
+  for _, blob, offset, length in planned:
+    start, end = offset["values"]
+    i = bisect_left(headers, start)
+    if i < len(headers) and headers[i] < end:
+      raise ValueError(f"{array_key(offset)}: an array holding arrays can not be moved")
+    result.extend(bytes(align(len(result), ARRAY_DATA_ALIGNMENT) - len(result)))
+    struct.pack_into("I", result, offset["header"][0], len(result) - instance_start)
+    struct.pack_into("I", result, offset["header"][0]+8, length)
+    result.extend(data[start:end])
+    result.extend(blob)
+
+  instance_size = len(result) - instance_start
+  # later instances move as a whole, everything in them is relative to their own start so only their offsets in the
+  # instance table change, a shift by a multiple of INSTANCE_ALIGNMENT keeps them aligned
+  instance_count = read_u32(data[8:12])
+  alignment = ARRAY_DATA_ALIGNMENT if instance_count == 1 else INSTANCE_ALIGNMENT
+  rest = align(instance_end, ARRAY_DATA_ALIGNMENT)
+  result.extend(bytes(rest + align(len(result) - rest, alignment) - len(result)))
+  added = len(result) - rest
+  result.extend(data[rest:])
+  patches = section_patches(profile, added, instance_size)
+  for i in range(1, instance_count):
+    pointer = profile["instance_header_start"] + i*24 + 8
+    patches[pointer] = read_u32(data[pointer:pointer+4]) + added
+  for pos, value in patches.items():
+    if pos >= instance_end:
+      pos += added
+    struct.pack_into("I", result, pos, value)
+  return result
+
+def insert_arrays_data(file: Path, inserts: List[Tuple[Union[str, int], object]], output: Path = None, mode: str = "shift", profile_cache: Path = None) -> bytearray:
+  """
+  Batched insert_array_data: append records to any number of arrays of the first instance with one profile of the
+  file. The result is written to output, {file}_u by default, and returned. With profile_cache the profile comes from
+  that directory when the same content was profiled before (see cached_profile).
+
+  mode "shift" inserts the records after each array, every offset delta comes from the profile and the new file is
+  built in one left to right copy, the pointers are then moved with the file's RelocationTable (array data offsets,
+  relocation chain, strings, deferred values, instance table and header offsets) and written in one go.
+  mode "tail" copies each grown array to the end of the first instance and points its header there, only the instance
+  size and the offsets of the instances and sections after it change. The old data is left in place until compact().
+  """
+  if mode not in INSERT_MODES:
+    raise ValueError(f"Unknown insert mode {mode}, expected one of {INSERT_MODES}")
+  data = memoryview(file.read_bytes())
+  adf = None
+  if profile_cache is None:
+    adf = Adf()
+    adf.deserialize(data, array_view=True, gc_paused=True)
+    columns = ProfileColumns.from_profile(profile_adf(data, adf))
+  else:
+    columns = cached_profile(file, profile_cache, data)
+  with columns:
+    profile = columns.sections()
+    array_offsets = columns.array_offsets()
+  planned = plan_inserts(array_offsets, inserts)
+  if mode == "shift":
+    result = shift_inserts(data, profile, planned, adf)
+  else:
+    result = tail_inserts(data, profile, array_offsets, planned)
+
+  if output is None:
+    output = file.parent / f"{file.name}_u"
+  output.write_bytes(result)
+  return result
+
+def compact(file: Path, output: Path = None) -> bytes:
+  """
+  Rewrite a file with its instance data back in the order the game writes it, dropping the data insert_arrays_data
+  mode "tail" leaves behind. One linear rewrite from the decoded values (Adf.serialize). The result is written to
+  output, file itself by default, and returned.
+  """
+  with map_file(file) as fp:
+    obj = Adf()
+    obj.deserialize(fp, gc_paused=True)
+    result = obj.serialize()
+
+  if output is None:
+    output = file
+  output.write_bytes(result)
+  return result
+
 def compare_headers() -> None:
   org_filename = Path().cwd() / "animal_population_0_sliced"
   new_filename = Path().cwd() / "animal_population_0_updated"
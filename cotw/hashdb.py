@@ -0,0 +1,54 @@
+from deca.file import map_file
+from deca.ff_adf import Adf, GdcArchiveEntry, TypeLibrary
+from deca.ff_sarc import FileSarc
+from deca.hash_dictionary import HashDictionary
+from pathlib import Path
+from typing import List
+from collections.abc import Sequence
+
+DEFAULT_FILENAME = "hashes.dhd"
+
+def default_path() -> Path:
+  return Path.cwd() / DEFAULT_FILENAME
+
+def load_hash_db(filename: Path = None) -> HashDictionary:
+  filename = filename if filename else default_path()
+  if not filename.exists():
+    return None
+  return HashDictionary.load(filename)
+
+def _add_file(hash_db: HashDictionary, filename: Path, type_library: TypeLibrary = None) -> str:
+  with map_file(filename) as fp:
+    data = fp.read_view()
+    if data[0:4] == b' FDA':
+      adf = Adf()
+      adf.deserialize(data, map_typedef=type_library, gc_paused=True)
+      hash_db.add_adf(adf)
+      for value in adf.table_instance_values:
+        if isinstance(value, Sequence) and len(value) > 0 and isinstance(value[0], GdcArchiveEntry):
+          hash_db.add_gdcc(value)
+      return "adf"
+    elif data[0:4] == b'RTPC':
+      hash_db.add_rtpc(data)
+      return "rtpc"
+    elif data[4:8] == b'SARC':
+      sarc = FileSarc()
+      sarc.header_deserialize(data)
+      hash_db.add_sarc(sarc)
+      return "sarc"
+    return None
+
+def build_hash_db(output: Path, filenames: List[Path], verbose = False) -> HashDictionary:
+  hash_db = load_hash_db(output)
+  if hash_db is None:
+    hash_db = HashDictionary()
+  # saves of one kind share their typedefs, parse them once for the whole batch
+  type_library = TypeLibrary()
+  for filename in filenames:
+    file_type = _add_file(hash_db, filename, type_library)
+    if verbose:
+      print(f"{filename}: {file_type if file_type else 'skipped'}")
+  hash_db.save(output)
+  if verbose:
+    print(f"Saved {output} ({len(hash_db)} strings)")
+  return hash_db
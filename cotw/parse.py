@@ -1,6 +1,6 @@
 import sys, json, struct
 from pathlib import Path
-from cotw import adf, sarc, rtpc, adf_builder
+from cotw import adf, sarc, rtpc, adf_builder, hashdb
 
 def main():  
   type = sys.argv[1]
@@ -28,11 +28,16 @@ def main():
     output = Path().cwd() / f"{filename}.json"
     output.write_text(json.dumps(compressed_data, indent=2))
     print(output)
+  elif type == "hashdb":
+    sources = [Path().cwd() / x for x in sys.argv[3:]]
+    hashdb.build_hash_db(Path().cwd() / filename, sources, verbose=True)
   elif type == "rtpc":
     rtpc.load_rtpc(Path().cwd() / filename)
   elif type == "profile":
-    profile = adf_builder.create_profile(Path().cwd() / filename)
-    (Path().cwd() / f"{Path(filename).name}_profile.json").write_text(json.dumps(profile, indent=2))
+    columns = adf_builder.ProfileColumns.from_profile(adf_builder.create_profile(Path().cwd() / filename))
+    columns.save(Path().cwd() / f"{Path(filename).name}_profile.npz")
+    if "--json" in sys.argv[3:]:
+      (Path().cwd() / f"{Path(filename).name}_profile.json").write_text(json.dumps(columns.to_json(), indent=2))
   elif type == "profile_header":
     compressed_data = bytearray((Path().cwd() / filename).read_bytes())
     profile = adf_builder.profile_header(compressed_data)
@@ -1,18 +1,20 @@
 from deca.ff_rtpc import RtpcVisitorDumpToString, rtpc_from_binary, RtpcNode
+from deca.file import map_file
+from cotw.hashdb import load_hash_db
 from pathlib import Path
 import json
 
 def open_rtpc(filename: Path) -> RtpcNode:
-  with filename.open("rb") as f:
-    data = rtpc_from_binary(f) 
+  with map_file(filename) as f:
+    data = rtpc_from_binary(f)
   root = data.root_node
   return root.child_table[0].child_table
 
 def load_rtpc(filename: Path) -> None:
-  data = filename.read_bytes()
-  dump = RtpcVisitorDumpToString()
-  dump.visit(data)
-  parsed = dump.result()
+  with map_file(filename) as fp:
+    dump = RtpcVisitorDumpToString(hash_db=load_hash_db())
+    dump.visit(fp.read_view())
+    parsed = dump.result()
   (Path.cwd() / f"{filename.name}.txt").write_text(parsed)  
 
 def parse_animal_types() -> None:
@@ -1,4 +1,5 @@
 from deca.ff_sarc import FileSarc
+from deca.file import map_file
 from pathlib import Path
 
 def extract_file(sarc: FileSarc, src_filename: Path, filename: str) -> None:  
@@ -10,16 +11,16 @@ def extract_file(sarc: FileSarc, src_filename: Path, filename: str) -> None:
       break
   if byte_start:
     dest_filename = Path(filename).name
-    with src_filename.open("rb") as fp:
+    with map_file(src_filename) as fp:
       fp.seek(byte_start)
-      data = fp.read(byte_size)
+      data = fp.read_view(byte_size)
       (Path().cwd() / dest_filename).write_bytes(data)
       print("Extracted: ", dest_filename)
 
 def load_sarc(filename: Path, debug=True) -> FileSarc:
   sarc = FileSarc()
   entries = []
-  with filename.open('rb') as fp:
+  with map_file(filename) as fp:
     sarc.header_deserialize(fp)
     for sarc_file in sarc.entries:
       entries.append((sarc_file.META_entry_ptr, sarc_file.offset, sarc_file.length, sarc_file.v_path))
@@ -1,53 +1,10 @@
+# (bufn, pos) call style of the reader engine in deca.fast_reader, bufn is the tuple (buffer, n_buffer)
 import numpy as np
-
-
-class FFError(Exception):
-    pass
-
-
-params = {
-    'inline': 'always',
-    'nogil': True,
-}
-
-def raise_error():
-    raise FFError('ff_read: not enough data')
-
-
-def ff_read(bufn, pos, n):
-    if bufn[1] >= (pos + n):
-        ret = bufn[0][pos:(pos + n)]
-        return ret, pos + n
-    else:
-        return raise_error()
-
-
-def make_read_one(data_type):
-    dt = np.dtype(data_type)
-    ele_size = dt.itemsize
-
-    def f(bufn, pos):
-        new_pos = pos + ele_size
-        if new_pos > bufn[1]:
-            raise_error()
-        v = np.frombuffer(bufn[0][pos:new_pos], dtype=dt)
-        return v[0], new_pos
-
-    return f
-
-
-def make_read_many(data_type):
-    dt = np.dtype(data_type)
-    ele_size = dt.itemsize
-
-    def f(bufn, pos, count):
-        new_pos = pos + ele_size * count
-        if new_pos > bufn[1]:
-            raise_error()
-        v = np.frombuffer(bufn[0][pos:new_pos], dtype=dt)
-        return list(v), new_pos
-
-    return f
+from deca.fast_reader import FFError, params, raise_error
+from deca.fast_reader import make_read_one_bufn as make_read_one
+from deca.fast_reader import make_read_many_bufn as make_read_many
+from deca.fast_reader import ff_read_bufn as ff_read
+from deca.fast_reader import ff_read_strz_bufn as ff_read_strz
 
 
 ff_read_u8 = make_read_one(np.uint8)
@@ -71,10 +28,3 @@ ff_read_u64s = make_read_many(np.uint64)
 ff_read_s64s = make_read_many(np.int64)
 ff_read_f32s = make_read_many(np.float32)
 ff_read_f64s = make_read_many(np.float64)
-
-
-def ff_read_strz(bufn, pos):
-    pos0 = pos
-    while bufn[0][pos] != 0 and pos < bufn[1]:
-        pos += 1
-    return bufn[0][pos0:pos], pos
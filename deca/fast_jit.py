@@ -0,0 +1,237 @@
+"""
+Optional numba compiled readers and a flattened RTPC walker
+
+Nothing is compiled unless jit is requested with use_jit(True) or the DECA_JIT=1 environment variable and numba can
+be imported. Without it the same kernels run as plain Python on top of deca.fast_reader, so results are identical
+either way. Compiled kernels are built with the nogil option from deca.fast_reader.params, so rtpc_flatten_many
+scales across threads.
+"""
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from deca import fast_reader
+from deca.fast_reader import FFError, params
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAVE_NUMBA = numba is not None
+
+_jit_requested = os.environ.get('DECA_JIT', '0') not in {'', '0'}
+_kernels = {}
+
+# columns of the node and property tables produced by rtpc_flatten
+RTPC_NODE_HEADER_POS = 0
+RTPC_NODE_NAME_HASH = 1
+RTPC_NODE_DATA_OFFSET = 2
+RTPC_NODE_PROP_COUNT = 3
+RTPC_NODE_CHILD_COUNT = 4
+RTPC_NODE_PARENT = 5
+RTPC_NODE_DEPTH = 6
+RTPC_NODE_FIRST_PROP = 7
+RTPC_NODE_COLUMNS = 8
+
+RTPC_PROP_POS = 0
+RTPC_PROP_NAME_HASH = 1
+RTPC_PROP_DATA_RAW = 2
+RTPC_PROP_TYPE = 3
+RTPC_PROP_NODE = 4
+RTPC_PROP_COLUMNS = 5
+
+
+def use_jit(enabled=True):
+    """
+    Request compiled kernels, returns whether they will actually be used
+    """
+    global _jit_requested
+    _jit_requested = enabled
+    return jit_enabled()
+
+
+def jit_enabled():
+    return _jit_requested and HAVE_NUMBA
+
+
+# primitives over a uint8 array, same (buffer, n_buffer, pos) -> (value, new_pos) contract as deca.fast_reader,
+# values up to 32 bits are int64 so positions never mix signed and unsigned arithmetic in compiled code
+def _jit_read_u8(buffer, n_buffer, pos):
+    if pos + 1 > n_buffer:
+        raise FFError('ff_read: not enough data')
+    return np.int64(buffer[pos]), pos + 1
+
+
+def _jit_read_u16(buffer, n_buffer, pos):
+    if pos + 2 > n_buffer:
+        raise FFError('ff_read: not enough data')
+    v = np.int64(buffer[pos]) | (np.int64(buffer[pos + 1]) << 8)
+    return v, pos + 2
+
+
+def _jit_read_u32(buffer, n_buffer, pos):
+    if pos + 4 > n_buffer:
+        raise FFError('ff_read: not enough data')
+    v = np.int64(buffer[pos]) | (np.int64(buffer[pos + 1]) << 8) | \
+        (np.int64(buffer[pos + 2]) << 16) | (np.int64(buffer[pos + 3]) << 24)
+    return v, pos + 4
+
+
+def _jit_read_u64(buffer, n_buffer, pos):
+    if pos + 8 > n_buffer:
+        raise FFError('ff_read: not enough data')
+    return buffer[pos:pos + 8].view(np.uint64)[0], pos + 8
+
+
+def _jit_read_f32(buffer, n_buffer, pos):
+    if pos + 4 > n_buffer:
+        raise FFError('ff_read: not enough data')
+    return buffer[pos:pos + 4].view(np.float32)[0], pos + 4
+
+
+def _jit_read_f64(buffer, n_buffer, pos):
+    if pos + 8 > n_buffer:
+        raise FFError('ff_read: not enough data')
+    return buffer[pos:pos + 8].view(np.float64)[0], pos + 8
+
+
+def _make_rtpc_flatten(read_u8, read_u16, read_u32):
+    """
+    Build the RTPC walker around a set of read primitives, the walk is iterative so it can be compiled by numba.
+
+    Nodes are emitted in the same depth first order RtpcVisitor visits them.
+    """
+    def rtpc_flatten_kernel(buffer, n_buffer, root_pos, nodes, props):
+        # stack of (next child header position, children left, node index), a node's children are read after all
+        # its properties, 4 byte aligned
+        stack = np.zeros((nodes.shape[0] + 1, 3), dtype=np.int64)
+        n_nodes = 0
+        n_props = 0
+        sp = 0
+        stack[0, 0] = root_pos
+        stack[0, 1] = 1
+        stack[0, 2] = -1
+        while sp >= 0:
+            if stack[sp, 1] == 0:
+                sp -= 1
+                continue
+            header_pos = stack[sp, 0]
+            parent = stack[sp, 2]
+            stack[sp, 0] = header_pos + 12
+            stack[sp, 1] -= 1
+
+            if n_nodes >= nodes.shape[0]:
+                raise FFError('rtpc_flatten: node table overflow')
+            pos = header_pos
+            name_hash, pos = read_u32(buffer, n_buffer, pos)
+            data_offset, pos = read_u32(buffer, n_buffer, pos)
+            prop_count, pos = read_u16(buffer, n_buffer, pos)
+            child_count, pos = read_u16(buffer, n_buffer, pos)
+
+            node_index = n_nodes
+            nodes[node_index, 0] = header_pos
+            nodes[node_index, 1] = name_hash
+            nodes[node_index, 2] = data_offset
+            nodes[node_index, 3] = prop_count
+            nodes[node_index, 4] = child_count
+            nodes[node_index, 5] = parent
+            nodes[node_index, 6] = sp
+            nodes[node_index, 7] = n_props
+            n_nodes += 1
+
+            pos = data_offset
+            for i in range(prop_count):
+                if n_props >= props.shape[0]:
+                    raise FFError('rtpc_flatten: property table overflow')
+                prop_pos = pos
+                prop_name_hash, pos = read_u32(buffer, n_buffer, pos)
+                prop_data_raw, pos = read_u32(buffer, n_buffer, pos)
+                prop_type, pos = read_u8(buffer, n_buffer, pos)
+                props[n_props, 0] = prop_pos
+                props[n_props, 1] = prop_name_hash
+                props[n_props, 2] = prop_data_raw
+                props[n_props, 3] = prop_type
+                props[n_props, 4] = node_index
+                n_props += 1
+
+            if child_count > 0:
+                sp += 1
+                stack[sp, 0] = pos + (4 - (pos % 4)) % 4
+                stack[sp, 1] = child_count
+                stack[sp, 2] = node_index
+
+        return n_nodes, n_props
+
+    return rtpc_flatten_kernel
+
+
+def _get_kernels():
+    mode = 'jit' if jit_enabled() else 'python'
+    kernels = _kernels.get(mode)
+    if kernels is not None:
+        return kernels
+
+    if mode == 'jit':
+        njit = numba.njit(nogil=params['nogil'], inline=params['inline'])
+        read_u8 = njit(_jit_read_u8)
+        read_u16 = njit(_jit_read_u16)
+        read_u32 = njit(_jit_read_u32)
+        kernels = {
+            'ff_read_u8': read_u8,
+            'ff_read_u16': read_u16,
+            'ff_read_u32': read_u32,
+            'ff_read_u64': njit(_jit_read_u64),
+            'ff_read_f32': njit(_jit_read_f32),
+            'ff_read_f64': njit(_jit_read_f64),
+            'rtpc_flatten': numba.njit(nogil=params['nogil'])(_make_rtpc_flatten(read_u8, read_u16, read_u32)),
+        }
+    else:
+        kernels = {
+            'ff_read_u8': fast_reader.ff_read_u8,
+            'ff_read_u16': fast_reader.ff_read_u16,
+            'ff_read_u32': fast_reader.ff_read_u32,
+            'ff_read_u64': fast_reader.ff_read_u64,
+            'ff_read_f32': fast_reader.ff_read_f32,
+            'ff_read_f64': fast_reader.ff_read_f64,
+            'rtpc_flatten': _make_rtpc_flatten(
+                fast_reader.ff_read_u8, fast_reader.ff_read_u16, fast_reader.ff_read_u32),
+        }
+    _kernels[mode] = kernels
+    return kernels
+
+
+def get_reader(name):
+    """
+    ff_read_* primitive for the current mode, compiled readers take a np.uint8 array as buffer
+    """
+    return _get_kernels()[name]
+
+
+def rtpc_flatten(buffer):
+    """
+    Walk an RTPC buffer into two int64 tables, nodes (RTPC_NODE_* columns) and properties (RTPC_PROP_* columns)
+    """
+    if jit_enabled():
+        buffer = np.frombuffer(buffer, dtype=np.uint8)
+    n_buffer = len(buffer)
+
+    magic, pos = fast_reader.ff_read(buffer, n_buffer, 0, 4)
+    if bytes(magic) != b'RTPC':
+        raise Exception('Bad MAGIC {}'.format(magic))
+    version, pos = fast_reader.ff_read_u32(buffer, n_buffer, pos)
+
+    # upper bounds, a node header is 12 bytes and a property 9 bytes
+    nodes = np.zeros((n_buffer // 12 + 1, RTPC_NODE_COLUMNS), dtype=np.int64)
+    props = np.zeros((n_buffer // 9 + 1, RTPC_PROP_COLUMNS), dtype=np.int64)
+
+    n_nodes, n_props = _get_kernels()['rtpc_flatten'](buffer, n_buffer, pos, nodes, props)
+
+    return nodes[:n_nodes].copy(), props[:n_props].copy()
+
+
+def rtpc_flatten_many(buffers, workers=None):
+    """
+    rtpc_flatten over many buffers on a thread pool, results are in the order of buffers
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(rtpc_flatten, buffers))
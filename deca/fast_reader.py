@@ -0,0 +1,165 @@
+import struct
+import numpy as np
+from deca.util import find_byte
+
+
+class FFError(Exception):
+    pass
+
+
+params = {
+    'inline': 'always',
+    'nogil': True,
+}
+
+# struct format for each supported dtype, keyed by (kind, itemsize) so platform dependent dtype chars do not matter
+struct_codes = {
+    ('u', 1): 'B',
+    ('i', 1): 'b',
+    ('u', 2): 'H',
+    ('i', 2): 'h',
+    ('u', 4): 'I',
+    ('i', 4): 'i',
+    ('u', 8): 'Q',
+    ('i', 8): 'q',
+    ('f', 4): 'f',
+    ('f', 8): 'd',
+}
+
+
+def struct_for_dtype(data_type):
+    dt = np.dtype(data_type)
+    return struct.Struct('<' + struct_codes[(dt.kind, dt.itemsize)])
+
+
+def raise_error():
+    raise FFError('ff_read: not enough data')
+
+
+# Both call styles are generated from the same factories, the plain style passes (buffer, n_buffer, pos) and the
+# bufn style passes ((buffer, n_buffer), pos). Scalars are unpacked in place with a precompiled struct.Struct,
+# arrays are a single np.frombuffer at an offset, neither slices the buffer.
+
+def make_read_one(data_type):
+    unpack_from = struct_for_dtype(data_type).unpack_from
+    ele_size = np.dtype(data_type).itemsize
+
+    def f(buffer, n_buffer, pos):
+        new_pos = pos + ele_size
+        if new_pos > n_buffer:
+            raise_error()
+        return unpack_from(buffer, pos)[0], new_pos
+
+    return f
+
+
+def make_read_many(data_type):
+    dt = np.dtype(data_type).newbyteorder('<')
+    ele_size = dt.itemsize
+
+    def f(buffer, n_buffer, pos, count):
+        new_pos = pos + ele_size * count
+        if new_pos > n_buffer:
+            raise_error()
+        if count == 0:
+            return [], new_pos
+        v = np.frombuffer(buffer, dtype=dt, count=count, offset=pos)
+        return list(v), new_pos
+
+    return f
+
+
+def make_read_array(data_type):
+    """
+    Like make_read_many but the value is a read only np.ndarray view over the buffer instead of a list
+    """
+    dt = np.dtype(data_type).newbyteorder('<')
+    ele_size = dt.itemsize
+
+    def f(buffer, n_buffer, pos, count):
+        new_pos = pos + ele_size * count
+        if new_pos > n_buffer:
+            raise_error()
+        v = np.frombuffer(buffer, dtype=dt, count=count, offset=pos)
+        v.flags.writeable = False
+        return v, new_pos
+
+    return f
+
+
+def make_read_one_bufn(data_type):
+    unpack_from = struct_for_dtype(data_type).unpack_from
+    ele_size = np.dtype(data_type).itemsize
+
+    def f(bufn, pos):
+        new_pos = pos + ele_size
+        if new_pos > bufn[1]:
+            raise_error()
+        return unpack_from(bufn[0], pos)[0], new_pos
+
+    return f
+
+
+def make_read_many_bufn(data_type):
+    f_many = make_read_many(data_type)
+
+    def f(bufn, pos, count):
+        return f_many(bufn[0], bufn[1], pos, count)
+
+    return f
+
+
+def ff_read(buffer, n_buffer, pos, n):
+    if n_buffer >= (pos + n):
+        ret = buffer[pos:(pos + n)]
+        return ret, pos + n
+    else:
+        return raise_error()
+
+
+def ff_read_bufn(bufn, pos, n):
+    return ff_read(bufn[0], bufn[1], pos, n)
+
+
+def ff_read_strz(buffer, n_buffer, pos):
+    pos0 = pos
+    pos = find_byte(buffer, b'\00', pos0, n_buffer)
+    if pos < 0:
+        pos = max(n_buffer, pos0)
+    return bytes(buffer[pos0:pos]), pos
+
+
+def ff_read_strz_bufn(bufn, pos):
+    return ff_read_strz(bufn[0], bufn[1], pos)
+
+
+ff_read_u8 = make_read_one(np.uint8)
+ff_read_s8 = make_read_one(np.int8)
+ff_read_u16 = make_read_one(np.uint16)
+ff_read_s16 = make_read_one(np.int16)
+ff_read_u32 = make_read_one(np.uint32)
+ff_read_s32 = make_read_one(np.int32)
+ff_read_u64 = make_read_one(np.uint64)
+ff_read_s64 = make_read_one(np.int64)
+ff_read_f32 = make_read_one(np.float32)
+ff_read_f64 = make_read_one(np.float64)
+
+ff_read_u8s = make_read_many(np.uint8)
+ff_read_s8s = make_read_many(np.int8)
+ff_read_u16s = make_read_many(np.uint16)
+ff_read_s16s = make_read_many(np.int16)
+ff_read_u32s = make_read_many(np.uint32)
+ff_read_s32s = make_read_many(np.int32)
+ff_read_u64s = make_read_many(np.uint64)
+ff_read_s64s = make_read_many(np.int64)
+ff_read_f32s = make_read_many(np.float32)
+ff_read_f64s = make_read_many(np.float64)
+
+ff_read_u16a = make_read_array(np.uint16)
+ff_read_s16a = make_read_array(np.int16)
+ff_read_u32a = make_read_array(np.uint32)
+ff_read_s32a = make_read_array(np.int32)
+ff_read_u64a = make_read_array(np.uint64)
+ff_read_s64a = make_read_array(np.int64)
+ff_read_f32a = make_read_array(np.float32)
+ff_read_f64a = make_read_array(np.float64)
@@ -1,10 +1,23 @@
-import io
+import os
+import re
+import sys
+import ast
+import copy
+import contextlib
 import enum
+import gc
+import struct
+import hashlib
+import operator
+import numpy as np
 from typing import List, Dict
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
 from deca.errors import *
-from deca.file import ArchiveFile
-from deca.fast_file import *
-from deca.hashes import hash32_func
+from deca.file import BufferArchiveFile, BufferWriter, as_archive_file, map_file
+from deca.fast_reader import *
+from deca.hashes import hash32_many
 
 adf_hash_fields = {
     'EquipmentHash', 'Name', 'RegionHash',
@@ -54,6 +67,158 @@ class GdcArchiveEntry:
             self.index, self.offset, str_size, str_vhash, str_fthash, str_adfhash, self.v_path.decode('utf-8'))
 
 
+gdcc_rtpc_filetype_hash = 0xD74CC4CB
+
+
+class GdccArchive:
+    """
+    Directory of a gdc/global.gdcc archive, the instance of type 0x178842fe in its ADF wrapper. The 32 byte directory
+    records are read as one (count, 8) u32 array and entries are found by v_path or v_hash through dict indexes.
+
+    Offsets are relative to the instance buffer, base_offset is where the instance starts in the file. An entry
+    without a size (anything but RTPC) is taken to run up to the next entry, string table or the end of the instance.
+    """
+    def __init__(self, buffer, base_offset=0):
+        # the map open made for a filename, released by close
+        self.source = None
+        buffer = memoryview(buffer).cast('B')
+        n_buffer = len(buffer)
+        if n_buffer < 32:
+            raise EDecaErrorParse('GDCC: directory header out of data')
+        header = np.frombuffer(buffer, dtype='<u4', count=8)
+        count = int(header[2])
+        if header[0] != 32 or header[1] != 16 or header[3] != 0 or header[5] != 16 or header[6] != count or \
+                header[7] != 0:
+            raise EDecaErrorParse('GDCC: unexpected directory header {}'.format(header.tolist()))
+        if 32 + 32 * count > n_buffer:
+            raise EDecaErrorParse('GDCC: directory of {} entries out of data'.format(count))
+
+        records = np.frombuffer(buffer, dtype='<u4', count=8 * count, offset=32).reshape(count, 8)
+        if not ((records[:, 1] == 16).all() and (records[:, 3] == 0).all() and (records[:, 5] == 16).all() and
+                (records[:, 6] == 0).all() and (records[:, 7] == 0).all()):
+            raise EDecaErrorParse('GDCC: unexpected directory record')
+
+        record_offsets = records[:, 0].astype(np.int64)
+        filetype_hashes = records[:, 2]
+        vpath_offsets = records[:, 4].astype(np.int64)
+
+        # RTPC entries point at a 16 byte header, (offset, 0, size, 0) like an array header
+        is_rtpc = filetype_hashes == gdcc_rtpc_filetype_hash
+        rtpc_offsets = record_offsets[is_rtpc]
+        if len(rtpc_offsets) and rtpc_offsets.max() + 16 > n_buffer:
+            raise EDecaErrorParse('GDCC: RTPC header out of data')
+        raw = np.frombuffer(buffer, dtype=np.uint8)
+        rtpc_headers = raw[rtpc_offsets[:, None] + np.arange(16)].view('<u4').reshape(-1, 4)
+        offsets = record_offsets.copy()
+        offsets[is_rtpc] = rtpc_headers[:, 0]
+
+        bounds = np.unique(np.concatenate((
+            record_offsets, offsets, vpath_offsets.min(initial=n_buffer, keepdims=True), [n_buffer])))
+        sizes = bounds[np.searchsorted(bounds, offsets, side='right').clip(max=len(bounds) - 1)] - offsets
+        sizes[is_rtpc] = rtpc_headers[:, 2]
+
+        # the v_path strings sit together, copy that span once and split it there
+        v_paths = []
+        if count:
+            strings_start = int(vpath_offsets.min())
+            _, strings_end = ff_read_strz(buffer, n_buffer, int(vpath_offsets.max()))
+            strings = bytes(buffer[strings_start:strings_end]) + b'\00'
+            for pos in (vpath_offsets - strings_start).tolist():
+                v_paths.append(strings[pos:strings.find(b'\00', pos)])
+        v_hashes = hash32_many(v_paths).tolist()
+
+        self.buffer = buffer
+        self.base_offset = base_offset
+        self.offsets = offsets
+        self.sizes = sizes
+        self.entries = []
+        for i, (offset, filetype_hash, rtpc, size, v_path, v_hash) in enumerate(zip(
+                offsets.tolist(), filetype_hashes.tolist(), is_rtpc.tolist(), sizes.tolist(), v_paths, v_hashes)):
+            self.entries.append(GdcArchiveEntry(
+                index=i,
+                offset=offset,
+                size=size if rtpc else None,
+                v_hash=v_hash,
+                filetype_hash=filetype_hash,
+                adf_type_hash=None if rtpc else filetype_hash,
+                v_path=v_path))
+
+        # a repeated path or hash finds its first entry
+        self.path_index = {}
+        self.hash_index = {}
+        for i in range(count - 1, -1, -1):
+            self.path_index[v_paths[i]] = i
+            self.hash_index[v_hashes[i]] = i
+
+    @classmethod
+    def open(cls, fp):
+        """
+        Archive of the gdc/global.gdcc instance of an ADF file, fp is anything Adf.deserialize takes. A filename is
+        memory mapped and the map is kept until close, use the archive in a with block
+        """
+        source = None
+        if isinstance(fp, (str, os.PathLike)):
+            fp = source = map_file(fp)
+        try:
+            adf = Adf()
+            adf.deserialize(fp, process_instances=False)
+            for i, ins in enumerate(adf.table_instance):
+                if ins.type_hash == 0x178842fe:
+                    archive = cls(adf.instance_buffer(i), ins.offset)
+                    archive.source = source
+                    return archive
+            raise EDecaErrorParse('GDCC: no gdc/global.gdcc instance')
+        except BaseException:
+            if source is not None:
+                source.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t, value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Release the map open made for a filename, data returned by read stays valid until it is collected
+        """
+        self.buffer = None
+        if self.source is not None:
+            source, self.source = self.source, None
+            source.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def index_of(self, key):
+        """
+        Entry index for a v_path (str or bytes) or a v_hash, None if there is no such entry
+        """
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+        if isinstance(key, bytes):
+            return self.path_index.get(key)
+        return self.hash_index.get(int(key))
+
+    def find(self, key):
+        index = self.index_of(key)
+        return None if index is None else self.entries[index]
+
+    def read(self, key):
+        """
+        Contents of an entry as a zero copy view of the archive, None if there is no such entry
+        """
+        index = self.index_of(key)
+        if index is None:
+            return None
+        offset = int(self.offsets[index])
+        return self.buffer[offset:offset + int(self.sizes[index])]
+
+
 class StringHash:
     def __init__(self):
         self.value = None
@@ -63,6 +228,13 @@ class StringHash:
         self.value = f.read_strz()
         self.value_hash = f.read_u64()
 
+    def serialized_size(self):
+        return len(self.value) + 1 + 8
+
+    def serialize(self, f, name_index):
+        f.write(self.value + b'\00')
+        f.write_u64(self.value_hash)
+
 
 class MemberDef:
     def __init__(self):
@@ -87,6 +259,14 @@ class MemberDef:
         self.default_type = f.read_u32()
         self.default_value = f.read_u64()
 
+    def serialize(self, f, name_index):
+        f.write_u64(name_index[self.name])
+        f.write_u32(self.type_hash)
+        f.write_u32(self.size)
+        f.write_u32(self.offset | (self.bit_offset << 24))
+        f.write_u32(self.default_type)
+        f.write_u64(self.default_value)
+
 
 class EnumDef:
     def __init__(self):
@@ -99,6 +279,10 @@ class EnumDef:
 
         # print(self.name, self.value)
 
+    def serialize(self, f, name_index):
+        f.write_u64(name_index[self.name])
+        f.write_u32(self.value)
+
 
 class MetaType(enum.IntEnum):
     Primative = 0
@@ -175,6 +359,34 @@ class TypeDef:
         else:
             raise Exception('Unknown Typedef Type {}'.format(self.metatype))
 
+    def serialized_size(self):
+        if self.metatype == 0:
+            return 36
+        elif self.metatype == 1:
+            return 40 + 32 * len(self.members)
+        elif self.metatype == 8:
+            return 40 + 12 * len(self.members)
+        return 40
+
+    def serialize(self, f, name_index):
+        f.write_u32(self.metatype)
+        f.write_u32(self.size)
+        f.write_u32(self.alignment)
+        f.write_u32(self.type_hash)
+        f.write_u64(name_index[self.name])
+        f.write_u32(self.flags)
+        f.write_u32(self.element_type_hash)
+        f.write_u32(self.element_length)
+
+        if self.metatype == 0:  # Primative
+            pass
+        elif self.metatype in {1, 8}:  # Structure, Enumeration
+            f.write_u32(len(self.members))
+            for m in self.members:
+                m.serialize(f, name_index)
+        else:
+            f.write_u32(0)
+
 
 class InstanceEntry:
     def __init__(self):
@@ -195,6 +407,13 @@ class InstanceEntry:
         # print('{:08x}'.format(self.name_hash), '{:08x}'.format(self.type_hash), self.offset, self.size, self.name)
         # print('FP End', f.tell())
 
+    def serialize(self, f, name_index, offset, size):
+        f.write_u32(self.name_hash)
+        f.write_u32(self.type_hash)
+        f.write_u32(offset)
+        f.write_u32(size)
+        f.write_u64(name_index[self.name])
+
     # def read(self, type_systems, f):
     #     if self.type_hash not in type_systems:
     #         raise EDecaMissingAdfType(self.type_hash)
@@ -243,40 +462,93 @@ prim_type_names = {
 }
 
 
-def dump_type(type_id, type_map, offset=0, displayed_types=None):
+def adf_type_closure(type_id, type_map, memo=None):
+    # every type id reachable from type_id, itself included
+    key = ('closure', type_id)
+    if memo is not None and key in memo:
+        return memo[key]
+    closure = set()
+    todo = [type_id]
+    while todo:
+        t = todo.pop()
+        if t in closure:
+            continue
+        closure.add(t)
+        type_def = type_map.get(t)
+        if type_def is None:
+            continue
+        if type_def.metatype == 1:
+            todo.extend(m.type_hash for m in type_def.members)
+        elif type_def.metatype in {3, 4}:
+            todo.append(type_def.element_type_hash)
+    if memo is not None:
+        memo[key] = closure
+    return closure
+
+
+def dump_type(type_id, type_map, offset=0, displayed_types=None, memo=None):
+    return ''.join(dump_type_lines(type_id, type_map, offset, displayed_types, memo))
+
+
+def dump_type_lines(type_id, type_map, offset=0, displayed_types=None, memo=None):
+    """
+    Lines of dump_type. With a memo dict the lines of a type are kept per (type_id, offset) and reused wherever the
+    type does not depend on the types being displayed around it.
+    """
     if displayed_types is None:
         displayed_types = []
 
+    if memo is None:
+        yield from _dump_type_lines(type_id, type_map, offset, displayed_types, memo)
+        return
+
+    if not adf_type_closure(type_id, type_map, memo).isdisjoint(displayed_types):
+        yield from _dump_type_lines(type_id, type_map, offset, displayed_types, memo)
+        return
+
+    key = ('dump', type_id, offset)
+    lines = memo.get(key)
+    if lines is None:
+        lines = list(_dump_type_lines(type_id, type_map, offset, displayed_types, memo))
+        memo[key] = lines
+    yield from lines
+
+
+def _dump_type_lines(type_id, type_map, offset, displayed_types, memo):
     if type_id in prim_type_names:
-        return '{}PrimType: {}\n'.format(' ' * offset, prim_type_names[type_id])
+        yield '{}PrimType: {}\n'.format(' ' * offset, prim_type_names[type_id])
+        return
 
     if type_id not in type_map:
-        return '{}UNKNOWN TYPE: {:08x}\n'.format(' ' * offset, type_id)
         # raise EDecaMissingAdfType(type_id)
+        yield '{}UNKNOWN TYPE: {:08x}\n'.format(' ' * offset, type_id)
+        return
     type_def = type_map[type_id]
 
     space = ' ' * offset
 
     if type_id in displayed_types:
-        return space + 'Recursive use of {} type 0x{:08x}\n'.format(MetaType(type_def.metatype).name, type_id)
+        yield space + 'Recursive use of {} type 0x{:08x}\n'.format(MetaType(type_def.metatype).name, type_id)
+        return
 
-    sbuf = space + '{}\n'.format(MetaType(type_def.metatype).name)
+    yield space + '{}\n'.format(MetaType(type_def.metatype).name)
 
     if type_def.metatype == 0:  # Primative
         pass
     elif type_def.metatype == 1:  # Structure
         for m in type_def.members:
-            sbuf = sbuf + '{}{} o:{}({:08x})[{}] s:{} t:{:08x} dt:{:08x} dv:{:016x}\n'.format(
-                ' ' * (offset + 2), m.name_utf8, m.offset, m.offset, m.bit_offset, m.size, m.type_hash, m.default_type, m.default_value)
-            sbuf = sbuf + dump_type(m.type_hash, type_map, offset + 4, displayed_types=displayed_types + [type_id])
+            yield '{}{} o:{}({:08x})[{}] s:{} t:{:08x} dt:{:08x} dv:{:016x}\n'.format(
+                ' ' * (offset + 2), m.name_utf8, m.offset, m.offset, m.bit_offset, m.size, m.type_hash,
+                m.default_type, m.default_value)
+            yield from dump_type_lines(m.type_hash, type_map, offset + 4, displayed_types + [type_id], memo)
     elif type_def.metatype == 2:  # Pointer
         pass
     elif type_def.metatype == 3:  # Array
-        sbuf = sbuf + '{}Length: {}\n'.format(' ' * (offset + 2), type_def.element_length)
-        sbuf = sbuf + dump_type(type_def.element_type_hash, type_map, offset+2, displayed_types=displayed_types + [type_id])
+        yield '{}Length: {}\n'.format(' ' * (offset + 2), type_def.element_length)
+        yield from dump_type_lines(type_def.element_type_hash, type_map, offset + 2, displayed_types + [type_id], memo)
     elif type_def.metatype == 4:  # Inline Array
-        sbuf = sbuf + '{}Length: {}\n'.format(' ' * (offset + 2), type_def.element_length)
-        sbuf = sbuf + dump_type(type_def.element_type_hash, type_map, offset+2, displayed_types=displayed_types + [type_id])
+        yield '{}Length: {}\n'.format(' ' * (offset + 2), type_def.element_length)
+        yield from dump_type_lines(type_def.element_type_hash, type_map, offset + 2, displayed_types + [type_id], memo)
     elif type_def.metatype == 7:  # BitField
         pass
     elif type_def.metatype == 8:  # Enumeration
@@ -286,12 +558,17 @@ def dump_type(type_id, type_map, offset=0, displayed_types=None):
     else:
         raise Exception('Unknown Typedef Type {}'.format(type_def.metatype))
 
-    # print(sbuf)
 
-    return sbuf
+def adf_type_id_to_str(type_id, type_map, memo=None):
+    if memo is not None:
+        key = ('str', type_id)
+        if key not in memo:
+            memo[key] = _adf_type_id_to_str(type_id, type_map, memo)
+        return memo[key]
+    return _adf_type_id_to_str(type_id, type_map, memo)
 
 
-def adf_type_id_to_str(type_id, type_map):
+def _adf_type_id_to_str(type_id, type_map, memo):
     if type_id in prim_type_names:
         return prim_type_names[type_id]
     if type_id == 0xdefe88ed:
@@ -306,9 +583,9 @@ def adf_type_id_to_str(type_id, type_map):
     elif type_def.metatype == 2:  # Pointer
         return 'Pointer'
     elif type_def.metatype == 3:  # Array
-        return 'Array of {}'.format(adf_type_id_to_str(type_def.element_type_hash, type_map))
+        return 'Array of {}'.format(adf_type_id_to_str(type_def.element_type_hash, type_map, memo))
     elif type_def.metatype == 4:  # Inline Array
-        return 'Inline Array of {}'.format(adf_type_id_to_str(type_def.element_type_hash, type_map))
+        return 'Inline Array of {}'.format(adf_type_id_to_str(type_def.element_type_hash, type_map, memo))
     elif type_def.metatype == 7:  # BitField
         return 'Bitfield'
     elif type_def.metatype == 8:  # Enumeration
@@ -334,6 +611,20 @@ class AdfValue:
         self.enum_string = enum_string
         self.hash_string = hash_string
 
+    def __reduce__(self):
+        # numpy scalars pickle slowly and offsets are mostly np.uint32, those are sent as ints and restored by
+        # adf_value_unpickle
+        info_offset = self.info_offset
+        data_offset = self.data_offset
+        u32 = (type(info_offset) is np.uint32, type(data_offset) is np.uint32)
+        if u32[0]:
+            info_offset = int(info_offset)
+        if u32[1]:
+            data_offset = int(data_offset)
+        return adf_value_unpickle, (
+            self.value, self.type_id, info_offset, data_offset, self.bit_offset, self.enum_string, self.hash_string,
+            u32)
+
     def __repr__(self):
         s = '{} : 0x{:08X} @ {}(0x{:08x})'.format(self.value, self.type_id, self.data_offset, self.data_offset)
 
@@ -351,87 +642,166 @@ class AdfValue:
 
         return s
 
-def adf_format(v, type_map, indent=0):
-    if isinstance(v, AdfValue):
-        type_def = type_map.get(v.type_id, TypeDef())
 
-        s = ''
-        s = s + '{}(0x{:08X}), Data Offset: {}(0x{:08x})'.format(
-            adf_type_id_to_str(v.type_id, type_map), v.type_id, v.data_offset, v.data_offset)
+def adf_value_unpickle(value, type_id, info_offset, data_offset, bit_offset, enum_string, hash_string, u32):
+    if u32[0]:
+        info_offset = np.uint32(info_offset)
+    if u32[1]:
+        data_offset = np.uint32(data_offset)
+    return AdfValue(value, type_id, info_offset, data_offset, bit_offset, enum_string, hash_string)
+
 
-        if v.bit_offset is not None:
-            s = s + '[{}]'.format(v.bit_offset)
+adf_missing_typedef = TypeDef()
 
-        if v.data_offset != v.info_offset:
-            s = s + ', Info Offset: {}(0x{:08x})'.format(v.info_offset, v.info_offset)
 
-        value_info = s
-        s = ''
+def adf_format(v, type_map, indent=0, hash_db=None, memo=None):
+    parts = []
+    adf_format_write(parts.append, v, type_map, indent, hash_db, memo)
+    return ''.join(parts)
+
+
+def adf_type_is_bounded(type_id, type_map, memo=None):
+    # no (non inline) array anywhere in the type, so its values have a fixed size
+    key = ('bounded', type_id)
+    if memo is not None and key in memo:
+        return memo[key]
+    bounded = True
+    for t in adf_type_closure(type_id, type_map, memo):
+        type_def = type_map.get(t)
+        if t == 0xdefe88ed or (type_def is not None and type_def.metatype == 3):
+            bounded = False
+            break
+    if memo is not None:
+        memo[key] = bounded
+    return bounded
+
+
+def adf_format_lines(v, type_map, indent=0, hash_db=None, memo=None):
+    """
+    adf_format as a sequence of strings of whole lines. Values that can hold any number of structs are walked one
+    child at a time, anything else comes as one string.
+    """
+    if memo is None:
+        memo = {}
+
+    if isinstance(v, AdfValue) and isinstance(v.value, (Mapping, list, AdfLazyArray, AdfValue)):
+        type_def = type_map.get(v.type_id, adf_missing_typedef)
+        if v.type_id == 0xdefe88ed:
+            yield '  ' * indent + '# {}\n'.format(_adf_value_info(v, type_map, memo))
+            yield from adf_format_lines(v.value, type_map, indent, hash_db, memo)
+            return
+        elif type_def.metatype == MetaType.Structure and not adf_type_is_bounded(v.type_id, type_map, memo):
+            yield '  ' * indent + '# ' + _adf_value_info(v, type_map, memo) + '\n'
+            yield '  ' * indent + '{\n'
+            for k, iv in v.value.items():
+                yield '  ' * (indent + 1) + k + ':\n'
+                yield from adf_format_lines(iv, type_map, indent + 2, hash_db, memo)
+            yield '  ' * indent + '}\n'
+            return
+        elif type_def.metatype in {MetaType.Array, MetaType.InlineArray} and \
+                type_map.get(type_def.element_type_hash, adf_missing_typedef).metatype in {1, 3, 4}:
+            yield '  ' * indent + '# ' + _adf_value_info(v, type_map, memo) + '\n'
+            yield '  ' * indent + '[\n'
+            for iv in v.value:
+                yield from adf_format_lines(iv, type_map, indent + 1, hash_db, memo)
+            yield '  ' * indent + ']\n'
+            return
+
+    parts = []
+    adf_format_write(parts.append, v, type_map, indent, hash_db, memo)
+    yield ''.join(parts)
+
+
+def _adf_value_info(v, type_map, memo):
+    s = '{}(0x{:08X}), Data Offset: {}(0x{:08x})'.format(
+        adf_type_id_to_str(v.type_id, type_map, memo), v.type_id, v.data_offset, v.data_offset)
+
+    if v.bit_offset is not None:
+        s = s + '[{}]'.format(v.bit_offset)
+
+    if v.data_offset != v.info_offset:
+        s = s + ', Info Offset: {}(0x{:08x})'.format(v.info_offset, v.info_offset)
+
+    return s
+
+
+def adf_format_write(write, v, type_map, indent=0, hash_db=None, memo=None):
+    """
+    adf_format, passing the text to write() line by line instead of returning it
+    """
+    if isinstance(v, AdfValue):
+        type_def = type_map.get(v.type_id, adf_missing_typedef)
+        value_info = _adf_value_info(v, type_map, memo)
         if v.type_id == 0xdefe88ed:
-            s = s + '  ' * indent + '# {}\n'.format(value_info)
-            s = s + adf_format(v.value, type_map, indent)
+            write('  ' * indent + '# {}\n'.format(value_info))
+            adf_format_write(write, v.value, type_map, indent, hash_db, memo)
         elif type_def.metatype is None or type_def.metatype == MetaType.Primative:
-            s = s + '  ' * indent + '{}  # {}\n'.format(v.value, value_info)
+            write('  ' * indent + '{}  # {}\n'.format(v.value, value_info))
         elif type_def.metatype == MetaType.Structure:
-            s = s + '  ' * indent + '# ' + value_info + '\n'
-            s = s + '  ' * indent + '{\n'
+            write('  ' * indent + '# ' + value_info + '\n')
+            write('  ' * indent + '{\n')
             for k, iv in v.value.items():
-                s = s + '  ' * (indent + 1) + k + ':\n'
-                s = s + adf_format(iv, type_map, indent + 2)
-                if not hasattr(iv, 'value'):
-                    pass
-
-            s = s + '  ' * indent + '}\n'
+                write('  ' * (indent + 1) + k + ':\n')
+                adf_format_write(write, iv, type_map, indent + 2, hash_db, memo)
+            write('  ' * indent + '}\n')
         elif type_def.metatype == MetaType.Pointer:
-            s = s + '  ' * indent + '{}  # {}\n'.format(v.value, value_info)
+            write('  ' * indent + '{}  # {}\n'.format(v.value, value_info))
         elif type_def.metatype in {MetaType.Array, MetaType.InlineArray}:
-            s = s + '  ' * indent + '# ' + value_info + '\n'
-            s = s + '  ' * indent + '[\n'
-            for iv in v.value:
-                s = s + adf_format(iv, type_map, indent + 1)
-            s = s + '  ' * indent + ']\n'
+            write('  ' * indent + '# ' + value_info + '\n')
+            write('  ' * indent + '[\n')
+            if isinstance(v.value, np.ndarray) and v.value.dtype.names is not None:
+                values = adf_struct_array_values(v, type_map)
+            elif isinstance(v.value, np.ndarray):
+                values = v.value.tolist()
+            else:
+                values = v.value
+            for iv in values:
+                adf_format_write(write, iv, type_map, indent + 1, hash_db, memo)
+            write('  ' * indent + ']\n')
         elif type_def.metatype == MetaType.String:
-            s = s + '  ' * indent + '{}  # {}\n'.format(v.value, value_info)
+            write('  ' * indent + '{}  # {}\n'.format(v.value, value_info))
         elif type_def.metatype == MetaType.Bitfield:
-            s = s + '  ' * indent + '{}  # {}\n'.format(v.value, value_info)
+            write('  ' * indent + '{}  # {}\n'.format(v.value, value_info))
         elif type_def.metatype == MetaType.Enumeration:
-            s = s + '  ' * indent + '{} ({})  # {}\n'.format(v.enum_string, v.value, value_info)
+            write('  ' * indent + '{} ({})  # {}\n'.format(v.enum_string, v.value, value_info))
         elif type_def.metatype == MetaType.StringHash:
             if type_def.size == 4:
                 vp = '0x{:08x}'.format(v.value)
                 hash_string = v.hash_string
+                if hash_string is None and hash_db is not None:
+                    hash_string = hash_db.lookup32(v.value)
                 if hash_string is None:
                     hash_string = 'Hash4:0x{:08x}'.format(v.value)
             elif type_def.size == 6:
                 vp = '0x{:012x}'.format(v.value)
                 hash_string = v.hash_string
+                if hash_string is None and hash_db is not None:
+                    hash_string = hash_db.lookup48(v.value)
                 if hash_string is None:
                     hash_string = 'Hash6:0x{:012x}'.format(v.value)
             elif type_def.size == 8:
                 vp = '0x{:016x}'.format(v.value)
                 hash_string = v.hash_string
+                if hash_string is None and hash_db is not None:
+                    hash_string = hash_db.lookup64(v.value)
             else:
                 vp = v.value
                 hash_string = v.hash_string
                 if hash_string is None:
                     hash_string = 'OTHER HASH {}'.format(type_def.size)
 
-            s = s + '  ' * indent + '{} ({})  # {}\n'.format(hash_string, vp, value_info)
-
-        return s
+            write('  ' * indent + '{} ({})  # {}\n'.format(hash_string, vp, value_info))
     elif isinstance(v, list) and len(v) > 0 and isinstance(v[0], GdcArchiveEntry):
-        s = ''
-        s = s + '  ' * indent + '[\n'
+        write('  ' * indent + '[\n')
         for ent in v:
             comment = None
-            s = s + '  ' * (indent + 1) + f'{ent}{comment}\n'
-        s = s + '  ' * indent + ']\n'
-
-        return s
+            write('  ' * (indent + 1) + f'{ent}{comment}\n')
+        write('  ' * indent + ']\n')
     else:
         comment = None
-        # return '  ' * indent + f'{v}{comment}\n'
-        return '  ' * indent + f'{v}\n'
+        # write('  ' * indent + f'{v}{comment}\n')
+        write('  ' * indent + f'{v}\n')
+
 
 def adf_value_extract(v):
     if isinstance(v, AdfValue):
@@ -443,13 +813,532 @@ def adf_value_extract(v):
         return n
     elif isinstance(v, list):
         return [adf_value_extract(iv) for iv in v]
+    elif isinstance(v, (AdfStructView, AdfArrayView)):
+        return adf_value_extract(v._values)
+    elif isinstance(v, AdfLazyStruct):
+        # reads every member that was not read yet
+        return {k: adf_value_extract(v[k]) for k in v}
+    elif isinstance(v, AdfLazyArray):
+        return [adf_value_extract(e) for e in v]
+    else:
+        return v
+
+
+def adf_value_view(v):
+    """
+    The value adf_value_extract gives as a read-only projection of v, structs and arrays are wrapped instead of copied
+    and their members are projected when they are accessed. The views are a Mapping and a Sequence, not a dict and a
+    list, adf_value_extract of a view gives the plain dicts and lists (e.g. for json.dumps).
+    """
+    if isinstance(v, AdfValue):
+        v = v.value
+    if isinstance(v, dict):
+        return AdfStructView(v)
+    elif isinstance(v, list):
+        return AdfArrayView(v)
+    elif isinstance(v, (AdfLazyStruct, AdfLazyArray)):
+        return v.extracted()
     else:
         return v
 
 
+class AdfStructView(Mapping):
+    """
+    Plain value of a struct, see adf_value_view
+    """
+    __slots__ = ('_values',)
+
+    def __init__(self, values):
+        self._values = values
+
+    def __getitem__(self, name):
+        return adf_value_view(self._values[name])
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return repr(adf_value_extract(self._values))
+
+
+class AdfArrayView(Sequence):
+    """
+    Plain value of an array, see adf_value_view
+    """
+    __slots__ = ('_values',)
+
+    def __init__(self, values):
+        self._values = values
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return AdfArrayView(self._values[index])
+        return adf_value_view(self._values[index])
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, AdfArrayView)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(adf_value_extract(self._values))
+
+
+class AdfLazyStruct(Mapping):
+    """
+    Value of a struct in lazy mode, a member is read from the instance buffer the first time it is accessed. A view
+    made by adf_value_view shares the cache and returns plain values, adf_value_extract reads the whole struct into a
+    dict.
+    """
+    __slots__ = ('_reader', '_pos', '_type_def', '_members', '_cache', '_extract')
+
+    def __init__(self, reader, pos, type_def):
+        self._reader = reader
+        self._pos = pos
+        self._type_def = type_def
+        self._members = adf_struct_members(type_def)
+        self._cache = {}
+        self._extract = False
+
+    def extracted(self):
+        v = copy.copy(self)
+        v._extract = True
+        return v
+
+    def __getitem__(self, name):
+        v = self._cache.get(name)
+        if v is None:
+            m = self._members[name]
+            v, _ = self._reader(self._pos + m.offset, m.type_hash, m.bit_offset)
+            self._cache[name] = v
+        if self._extract:
+            return adf_value_view(v)
+        return v
+
+    def __iter__(self):
+        return iter(self._members)
+
+    def __len__(self):
+        return len(self._members)
+
+    def __repr__(self):
+        return '<AdfLazyStruct {} {} members>'.format(self._type_def.name, len(self._members))
+
+
+class AdfLazyArray(Sequence):
+    """
+    Value of an array of structs in lazy mode, an element is read the first time it is accessed
+    """
+    __slots__ = ('_reader', '_pos', '_length', '_element_def', '_cache', '_extract')
+
+    def __init__(self, reader, pos, length, element_def):
+        self._reader = reader
+        self._pos = pos
+        self._length = length
+        self._element_def = element_def
+        self._cache = {}
+        self._extract = False
+
+    def extracted(self):
+        v = copy.copy(self)
+        v._extract = True
+        return v
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('AdfLazyArray index out of range')
+        v = self._cache.get(index)
+        if v is None:
+            v, _ = self._reader(self._pos + index * self._element_def.size, self._element_def.type_hash, None)
+            self._cache[index] = v
+        if self._extract:
+            return adf_value_view(v)
+        return v
+
+    def __len__(self):
+        return self._length
+
+    def __repr__(self):
+        return '<AdfLazyArray {} x {}>'.format(self._element_def.name, self._length)
+
+
+adf_struct_member_maps = {}
+
+
+def adf_struct_members(type_def):
+    # member name to MemberDef, a repeated name maps to its last member like the dict read_instance builds
+    members = adf_struct_member_maps.get(type_def.type_hash)
+    if members is None:
+        members = {m.name_utf8: m for m in type_def.members}
+        adf_struct_member_maps[type_def.type_hash] = members
+    return members
+
+
+def adf_lazy_reader(buffer, n_buffer, map_typedef, map_string_hash, abs_offset, found_strings, array_view):
+    """
+    reader(pos, type_id, bit_offset) -> (value, new_pos) over one instance buffer, structs and arrays of structs it
+    reads are lazy and share the reader
+    """
+    def reader(pos, type_id, bit_offset):
+        return read_instance(
+            buffer, n_buffer, pos, type_id, map_typedef, map_string_hash, abs_offset,
+            bit_offset=bit_offset, found_strings=found_strings, array_view=array_view, lazy_reader=reader)
+    return reader
+
+
+# readers for arrays of primitives, u8/s8 arrays are always read as bytes
+adf_array_readers = {
+    typedef_u16: ff_read_u16s,
+    typedef_s16: ff_read_s16s,
+    typedef_u32: ff_read_u32s,
+    typedef_s32: ff_read_s32s,
+    typedef_u64: ff_read_u64s,
+    typedef_s64: ff_read_s64s,
+    typedef_f32: ff_read_f32s,
+    typedef_f64: ff_read_f64s,
+}
+
+# zero copy variants, the value is a read only np.ndarray over the instance buffer
+adf_array_view_readers = {
+    typedef_u16: ff_read_u16a,
+    typedef_s16: ff_read_s16a,
+    typedef_u32: ff_read_u32a,
+    typedef_s32: ff_read_s32a,
+    typedef_u64: ff_read_u64a,
+    typedef_s64: ff_read_s64a,
+    typedef_f32: ff_read_f32a,
+    typedef_f64: ff_read_f64a,
+}
+
+
+# struct codes of the primitive types, the only members a compiled struct decoder reads in place
+adf_prim_struct_codes = {
+    typedef_s8: 'b',
+    typedef_u8: 'B',
+    typedef_s16: 'h',
+    typedef_u16: 'H',
+    typedef_s32: 'i',
+    typedef_u32: 'I',
+    typedef_s64: 'q',
+    typedef_u64: 'Q',
+    typedef_f32: 'f',
+    typedef_f64: 'd',
+}
+
+# type hashes read_instance handles before looking at map_typedef: string, deferred value and gdc/global.gdcc
+adf_special_types = {0x8955583e, 0xdefe88ed, 0x178842fe}
+
+# Structures are read by decoders generated per typedef. A plan is plain tuples so it can be kept with the typedefs
+# it came from, the decoder built from it only lives in memory. Both are keyed by type hash.
+adf_struct_plans = {}
+adf_struct_decoders = {}
+
+
+def adf_struct_plan(type_def, map_typedef):
+    """
+    Plan for reading a struct typedef, (type_hash, size, ops) with the ops in member order:
+
+        ('prims', offset, fmt, ((name, offset, type_hash), ...))  consecutive primitives, one unpack_from of fmt
+        ('struct', name, offset, type_hash, plan)                 struct member, read inline with its own plan
+        ('array', name, offset, type_hash, bit_offset)            array or inline array
+        ('value', name, offset, type_hash, bit_offset)            anything else, read with read_instance
+    """
+    plan = adf_struct_plans.get(type_def.type_hash)
+    if plan is not None:
+        return plan
+
+    ops = []
+    run = []
+    run_end = 0
+
+    def flush_run():
+        if not run:
+            return
+        start = run[0][1]
+        fmt = '<'
+        pos = start
+        for name, offset, type_hash in run:
+            if offset > pos:
+                fmt += '{}x'.format(offset - pos)
+            code = adf_prim_struct_codes[type_hash]
+            fmt += code
+            pos = offset + struct.calcsize('<' + code)
+        ops.append(('prims', start, fmt, tuple(run)))
+        run.clear()
+
+    for m in type_def.members:
+        code = adf_prim_struct_codes.get(m.type_hash)
+        if code is not None:
+            # a run only moves forward, an overlapping member starts a new one
+            if run and m.offset < run_end:
+                flush_run()
+            run.append((m.name_utf8, m.offset, m.type_hash))
+            run_end = m.offset + struct.calcsize('<' + code)
+            continue
+
+        flush_run()
+        member_def = map_typedef.get(m.type_hash)
+        if m.type_hash in adf_special_types or member_def is None:
+            ops.append(('value', m.name_utf8, m.offset, m.type_hash, m.bit_offset))
+        elif member_def.metatype == 1:
+            ops.append(('struct', m.name_utf8, m.offset, m.type_hash, adf_struct_plan(member_def, map_typedef)))
+        elif member_def.metatype in {3, 4}:
+            ops.append(('array', m.name_utf8, m.offset, m.type_hash, m.bit_offset))
+        else:
+            ops.append(('value', m.name_utf8, m.offset, m.type_hash, m.bit_offset))
+    flush_run()
+
+    plan = (type_def.type_hash, type_def.size, tuple(ops))
+    adf_struct_plans[type_def.type_hash] = plan
+    return plan
+
+
+def _adf_struct_source(ops, src, env, var, base, pos_offset, indent):
+    # emit the reads of ops into the dict named var, members are at pos + pos_offset and base is their
+    # pos + abs_offset, nested structs get their own dict and base
+    for op in ops:
+        if op[0] == 'prims':
+            _, start, fmt, members = op
+            st = struct.Struct(fmt)
+            unpack = 'unpack_{}'.format(len(env))
+            env[unpack] = st.unpack_from
+            names = ''.join('x{}, '.format(j) for j in range(len(members)))
+            src.append('{}if pos + {} > n_buffer:'.format(indent, pos_offset + start + st.size))
+            src.append('{}    raise_error()'.format(indent))
+            src.append('{}{}= {}(buffer, pos + {})'.format(indent, names, unpack, pos_offset + start))
+            for j, (name, offset, member_hash) in enumerate(members):
+                src.append('{}{}[{!r}] = AdfValue(x{}, {}, {} + {})'.format(
+                    indent, var, name, j, member_hash, base, offset))
+            continue
+
+        kind, name, offset, member_hash, extra = op
+        if kind == 'struct':
+            n = len(src)
+            sub_var = 'v{}'.format(n)
+            sub_base = 'base{}'.format(n)
+            src.append('{}{} = {{}}'.format(indent, sub_var))
+            src.append('{}{} = {} + {}'.format(indent, sub_base, base, offset))
+            _adf_struct_source(extra[2], src, env, sub_var, sub_base, pos_offset + offset, indent)
+            src.append('{}{}[{!r}] = AdfValue({}, {}, {})'.format(indent, var, name, sub_var, member_hash, sub_base))
+        elif kind == 'array':
+            src.append('{}td = map_typedef.get({})'.format(indent, member_hash))
+            src.append('{}if td is None:'.format(indent))
+            src.append('{}    raise EDecaMissingAdfType({})'.format(indent, member_hash))
+            src.append(
+                '{}{}[{!r}], _ = read_array(buffer, n_buffer, pos + {}, {}, td, map_typedef, map_string_hash, '
+                'abs_offset, found_strings, array_view)'.format(indent, var, name, pos_offset + offset, member_hash))
+        else:
+            src.append(
+                '{}{}[{!r}], _ = read_instance(buffer, n_buffer, pos + {}, {}, map_typedef, map_string_hash, '
+                'abs_offset, bit_offset={}, found_strings=found_strings, array_view=array_view)'.format(
+                    indent, var, name, pos_offset + offset, member_hash, extra))
+
+
+def adf_struct_compile(plan):
+    """
+    Build the decoder for a plan,
+        decoder(buffer, n_buffer, pos, type_id, map_typedef, map_string_hash, abs_offset, found_strings, array_view)
+    returns the same (AdfValue, new_pos) as read_instance does for the struct
+    """
+    type_hash, size, ops = plan
+    env = {
+        'AdfValue': AdfValue,
+        'EDecaMissingAdfType': EDecaMissingAdfType,
+        'raise_error': raise_error,
+        'read_instance': read_instance,
+        'read_array': read_array,
+    }
+    src = [
+        'def decoder(buffer, n_buffer, pos, type_id, map_typedef, map_string_hash, abs_offset, found_strings, '
+        'array_view):',
+        '    v = {}',
+        '    base = pos + abs_offset',
+    ]
+    _adf_struct_source(ops, src, env, 'v', 'base', 0, '    ')
+    src.append('    return AdfValue(v, type_id, base), pos + {}'.format(size))
+
+    exec(compile('\n'.join(src), '<adf struct 0x{:08x}>'.format(type_hash), 'exec'), env)
+    return env['decoder']
+
+
+def adf_struct_decoder(type_def, map_typedef):
+    decoder = adf_struct_decoders.get(type_def.type_hash)
+    if decoder is None:
+        decoder = adf_struct_compile(adf_struct_plan(type_def, map_typedef))
+        adf_struct_decoders[type_def.type_hash] = decoder
+    return decoder
+
+
+# dtypes of the primitive types and of bitfield storage by size, used for structured views of struct arrays
+adf_prim_dtypes = {
+    typedef_s8: '<i1',
+    typedef_u8: '<u1',
+    typedef_s16: '<i2',
+    typedef_u16: '<u2',
+    typedef_s32: '<i4',
+    typedef_u32: '<u4',
+    typedef_s64: '<i8',
+    typedef_u64: '<u8',
+    typedef_f32: '<f4',
+    typedef_f64: '<f8',
+}
+
+adf_bitfield_dtypes = {1: '<u1', 2: '<u2', 4: '<u4', 8: '<u8'}
+
+adf_struct_dtypes = {}
+
+
+def adf_struct_dtype(type_def, map_typedef):
+    """
+    Structured np.dtype for a struct typedef with the member offsets and size of the typedef, or None if a member is
+    not a primitive, a bitfield or such a struct itself. A bitfield member holds its whole storage word, the bit is
+    (word >> bit_offset) & 1.
+    """
+    if type_def.type_hash in adf_struct_dtypes:
+        return adf_struct_dtypes[type_def.type_hash]
+
+    names = []
+    formats = []
+    offsets = []
+    for m in type_def.members:
+        fmt = adf_prim_dtypes.get(m.type_hash)
+        member_def = map_typedef.get(m.type_hash)
+        if fmt is None and member_def is not None and m.type_hash not in adf_special_types:
+            if member_def.metatype == 1:
+                fmt = adf_struct_dtype(member_def, map_typedef)
+            elif member_def.metatype == 7:
+                fmt = adf_bitfield_dtypes.get(member_def.size)
+        if fmt is None or m.name_utf8 in names:
+            dtype = None
+            break
+        names.append(m.name_utf8)
+        formats.append(fmt)
+        offsets.append(m.offset)
+    else:
+        dtype = np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': type_def.size})
+
+    adf_struct_dtypes[type_def.type_hash] = dtype
+    return dtype
+
+
+def _adf_struct_records(values, type_def, type_map, positions):
+    columns = []
+    for m in type_def.members:
+        column = values[m.name_utf8]
+        member_positions = [pos + m.offset for pos in positions]
+        if m.type_hash in adf_prim_dtypes:
+            items = [AdfValue(x, m.type_hash, pos) for x, pos in zip(column.tolist(), member_positions)]
+        elif type_map[m.type_hash].metatype == 1:
+            items = _adf_struct_records(column, type_map[m.type_hash], type_map, member_positions)
+        else:
+            bit = m.bit_offset
+            items = [
+                AdfValue((x >> bit) & 1, m.type_hash, pos, bit_offset=bit)
+                for x, pos in zip(column.tolist(), member_positions)]
+        columns.append((m.name_utf8, items))
+
+    return [
+        AdfValue({name: items[i] for name, items in columns}, type_def.type_hash, pos)
+        for i, pos in enumerate(positions)]
+
+
+def adf_struct_array_values(v, type_map):
+    """
+    Expand an array value holding a structured view back into the list of struct AdfValues read_instance builds
+    without array_view
+    """
+    element_def = type_map[type_map[v.type_id].element_type_hash]
+    itemsize = v.value.dtype.itemsize
+    positions = [v.data_offset + i * itemsize for i in range(len(v.value))]
+    return _adf_struct_records(v.value, element_def, type_map, positions)
+
+
+def read_array(
+        buffer, n_buffer, buffer_pos, type_id, type_def, map_typedef, map_string_hash, abs_offset,
+        found_strings=None, array_view=False, lazy_reader=None):
+    dpos = buffer_pos
+    if type_def.metatype == 3:
+        v0, buffer_pos = ff_read_u32s(buffer, n_buffer, buffer_pos, 3)
+        opos = buffer_pos
+
+        offset = v0[0]
+        flags = v0[1]
+        length = v0[2]
+        # unknown = v0[3] sometimes does not exist, is it even real data, in some cases it removed in GZ EXE
+        align = None
+        # aligning based on element size info
+        # if type_def.element_type_hash not in prim_types:
+        #     align = 4
+        buffer_pos = offset
+    else:
+        opos = None
+        offset = buffer_pos
+        length = type_def.element_length
+        align = None
+
+    element_hash = type_def.element_type_hash
+    if element_hash == typedef_u8:
+        # v, buffer_pos = ff_read_u8s(buffer, n_buffer, buffer_pos, length)
+        v, buffer_pos = ff_read(buffer, n_buffer, buffer_pos, length)
+        v = bytes(v)
+    elif element_hash == typedef_s8:
+        # v, buffer_pos = ff_read_s8s(buffer, n_buffer, buffer_pos, length)
+        v, buffer_pos = ff_read(buffer, n_buffer, buffer_pos, length)
+        v = bytes(v)
+    elif element_hash in adf_array_readers:
+        if array_view:
+            read_values = adf_array_view_readers[element_hash]
+        else:
+            read_values = adf_array_readers[element_hash]
+        v, buffer_pos = read_values(buffer, n_buffer, buffer_pos, length)
+    else:
+        element_def = map_typedef.get(element_hash)
+        is_struct = element_def is not None and element_def.metatype == 1 and element_hash not in adf_special_types
+        dtype = adf_struct_dtype(element_def, map_typedef) if is_struct and array_view else None
+        if dtype is not None:
+            new_pos = buffer_pos + dtype.itemsize * length
+            if new_pos > n_buffer:
+                raise_error()
+            v = np.frombuffer(buffer, dtype=dtype, count=length, offset=buffer_pos)
+            v.flags.writeable = False
+            buffer_pos = new_pos
+        elif is_struct and lazy_reader is not None:
+            v = AdfLazyArray(lazy_reader, buffer_pos, length, element_def)
+            buffer_pos = buffer_pos + element_def.size * length
+        elif is_struct:
+            v = [None] * length
+            decoder = adf_struct_decoder(element_def, map_typedef)
+            for i in range(length):
+                v[i], buffer_pos = decoder(
+                    buffer, n_buffer, buffer_pos, element_hash, map_typedef, map_string_hash, abs_offset,
+                    found_strings, array_view)
+        else:
+            v = [None] * length
+            for i in range(length):
+                v[i], buffer_pos = read_instance(
+                    buffer, n_buffer, buffer_pos, element_hash, map_typedef, map_string_hash, abs_offset,
+                    found_strings=found_strings, array_view=array_view, lazy_reader=lazy_reader)
+    if opos is not None:
+        buffer_pos = opos
+
+    v = AdfValue(v, type_id, dpos + abs_offset, offset + abs_offset)
+
+    return v, buffer_pos
+
+
 def read_instance(
         buffer, n_buffer, buffer_pos, type_id, map_typedef, map_string_hash, abs_offset,
-        bit_offset=None, found_strings=None):
+        bit_offset=None, found_strings=None, array_view=False, lazy_reader=None):
 
     dpos = buffer_pos
     if type_id == typedef_s8:
@@ -512,7 +1401,7 @@ def read_instance(
             try:
                 v, buffer_pos = read_instance(
                     buffer, n_buffer, buffer_pos, v0[2], map_typedef, map_string_hash, abs_offset,
-                    found_strings=found_strings)
+                    found_strings=found_strings, array_view=array_view, lazy_reader=lazy_reader)
             except EDecaMissingAdfType as e:
                 v = f"!!!MISSING TYPE:  0x{e.type_id:08x} in 0x{v0[2]:08x}[{v0[1]}]"
             buffer_pos = opos
@@ -520,72 +1409,7 @@ def read_instance(
 
     elif type_id == 0x178842fe:  # gdc/global.gdcc
         # TODO this should probably be it's own file type and the adf should be considered a wrapper
-        gdf_buffer = buffer[buffer_pos:]
-        gdf_n_buffer = len(gdf_buffer)
-        gdf_buffer_pos = 0
-
-        count, gdf_buffer_pos = ff_read_u32s(gdf_buffer, gdf_n_buffer, gdf_buffer_pos, 8)
-        assert(count[0] == 32)
-        assert(count[1] == 16)
-        assert(count[2] == count[6])
-        assert(count[3] == 0)
-        # assert(count[4] == filesize +- k)
-        assert(count[5] == 16)
-        assert(count[6] == count[2])
-        assert(count[7] == 0)
-        dir_list = []
-        for i in range(count[2]):
-            d00_offset, gdf_buffer_pos = ff_read_u32(gdf_buffer, gdf_n_buffer, gdf_buffer_pos)
-            d04_unk, gdf_buffer_pos = ff_read_u32(gdf_buffer, gdf_n_buffer, gdf_buffer_pos)
-            d08_filetype_hash, gdf_buffer_pos = ff_read_u32(gdf_buffer, gdf_n_buffer, gdf_buffer_pos)
-            d12_unk, gdf_buffer_pos = ff_read_u32(gdf_buffer, gdf_n_buffer, gdf_buffer_pos)
-            d16_vpath_offset, gdf_buffer_pos = ff_read_u32(gdf_buffer, gdf_n_buffer, gdf_buffer_pos)
-            d20_unk, gdf_buffer_pos = ff_read_u32(gdf_buffer, gdf_n_buffer, gdf_buffer_pos)
-            d24_unk, gdf_buffer_pos = ff_read_u32(gdf_buffer, gdf_n_buffer, gdf_buffer_pos)
-            d28_unk, gdf_buffer_pos = ff_read_u32(gdf_buffer, gdf_n_buffer, gdf_buffer_pos)
-            assert(d04_unk == 16)
-            assert(d12_unk == 0)
-            assert(d20_unk == 16)
-            assert(d24_unk == 0)
-            assert(d28_unk == 0)
-            entry = [d00_offset, d16_vpath_offset, d08_filetype_hash, d04_unk, d12_unk, d20_unk, d24_unk, d28_unk]
-            dir_list.append(entry)
-
-        dir_contents = []
-        idx = 0
-        for e1 in dir_list:
-            # TODO something weird is going on with this second header, sometimes it makes sense, sometimes it may
-            # have floats? or indicate that is should be 24 byte long?
-            string_offset = e1[1]
-            ftype_hash = e1[2]
-
-            gdf_buffer_pos = string_offset
-            v_path, gdf_buffer_pos = ff_read_strz(gdf_buffer, gdf_n_buffer, gdf_buffer_pos)
-            v_hash = hash32_func(v_path)
-
-            if ftype_hash in {0xD74CC4CB}:  # RTPC read directly
-                # TODO this follows the data structure for an array of some type, 0xD74CC4CB is probably it's hash
-                gdf_buffer_pos = e1[0]
-                header2, gdf_buffer_pos = ff_read_u32s(gdf_buffer, gdf_n_buffer, gdf_buffer_pos, 4)
-                actual_offset = header2[0]
-                actual_size = header2[2]
-                adf_type_hash = None
-            else:  # TODO current guess is that it is a bare ADF instance
-                actual_offset = e1[0]
-                actual_size = None
-                adf_type_hash = ftype_hash
-
-            entry = GdcArchiveEntry(
-                index=idx,
-                offset=actual_offset,
-                size=actual_size,
-                v_hash=v_hash,
-                filetype_hash=ftype_hash,
-                adf_type_hash=adf_type_hash,
-                v_path=v_path)
-            dir_contents.append(entry)
-            idx += 1
-        v = dir_contents
+        v = GdccArchive(memoryview(buffer)[buffer_pos:n_buffer], abs_offset + buffer_pos).entries
 
     else:
         if type_id not in map_typedef:
@@ -594,21 +1418,14 @@ def read_instance(
         
         if type_def.metatype == 0:  # Primative
             raise EDecaMissingAdfType(type_id)
+        elif type_def.metatype == 1 and lazy_reader is not None:  # Structure, read on access
+            v = AdfValue(AdfLazyStruct(lazy_reader, buffer_pos, type_def), type_id, buffer_pos + abs_offset)
+            buffer_pos = buffer_pos + type_def.size
         elif type_def.metatype == 1:  # Structure
-            v = {}
-            p0 = buffer_pos
-            for m in type_def.members:
-                buffer_pos = p0 + m.offset
-                nm = m.name_utf8
-                vt, buffer_pos = read_instance(
-                    buffer, n_buffer, buffer_pos, m.type_hash, map_typedef, map_string_hash, abs_offset,
-                    bit_offset=m.bit_offset, found_strings=found_strings)
-                v[nm] = vt
-                # print(nm, vt)
-            p1 = buffer_pos
-            buffer_pos = p0 + type_def.size
-
-            v = AdfValue(v, type_id, p0 + abs_offset)
+            decoder = adf_struct_decoder(type_def, map_typedef)
+            v, buffer_pos = decoder(
+                buffer, n_buffer, buffer_pos, type_id, map_typedef, map_string_hash, abs_offset, found_strings,
+                array_view)
 
         elif type_def.metatype == 2:  # Pointer
             v0, buffer_pos = ff_read_u64(buffer, n_buffer, buffer_pos)
@@ -616,59 +1433,9 @@ def read_instance(
             # TODO not sure how this is used yet, but it's used by effects so lower priority
             # raise EDecaMissingAdfType(type_id)
         elif type_def.metatype in {3, 4}:  # Array or Inline Array
-            if type_def.metatype == 3:
-                v0, buffer_pos = ff_read_u32s(buffer, n_buffer, buffer_pos, 3)
-                opos = buffer_pos
-
-                offset = v0[0]
-                flags = v0[1]
-                length = v0[2]
-                # unknown = v0[3] sometimes does not exist, is it even real data, in some cases it removed in GZ EXE
-                align = None
-                # aligning based on element size info
-                # if type_def.element_type_hash not in prim_types:
-                #     align = 4
-                buffer_pos = offset
-            else:
-                opos = None
-                offset = buffer_pos
-                length = type_def.element_length
-                align = None
-
-            if type_def.element_type_hash == typedef_u8:
-                # v, buffer_pos = ff_read_u8s(buffer, n_buffer, buffer_pos, length)
-                v, buffer_pos = ff_read(buffer, n_buffer, buffer_pos, length)
-            elif type_def.element_type_hash == typedef_s8:
-                # v, buffer_pos = ff_read_s8s(buffer, n_buffer, buffer_pos, length)
-                v, buffer_pos = ff_read(buffer, n_buffer, buffer_pos, length)
-            elif type_def.element_type_hash == typedef_u16:
-                v, buffer_pos = ff_read_u16s(buffer, n_buffer, buffer_pos, length)
-            elif type_def.element_type_hash == typedef_s16:
-                v, buffer_pos = ff_read_s16s(buffer, n_buffer, buffer_pos, length)
-            elif type_def.element_type_hash == typedef_u32:
-                v, buffer_pos = ff_read_u32s(buffer, n_buffer, buffer_pos, length)
-            elif type_def.element_type_hash == typedef_s32:
-                v, buffer_pos = ff_read_s32s(buffer, n_buffer, buffer_pos, length)
-            elif type_def.element_type_hash == typedef_u64:
-                v, buffer_pos = ff_read_u64s(buffer, n_buffer, buffer_pos, length)
-            elif type_def.element_type_hash == typedef_s64:
-                v, buffer_pos = ff_read_s64s(buffer, n_buffer, buffer_pos, length)
-            elif type_def.element_type_hash == typedef_f32:
-                v, buffer_pos = ff_read_f32s(buffer, n_buffer, buffer_pos, length)
-            elif type_def.element_type_hash == typedef_f64:
-                v, buffer_pos = ff_read_f64s(buffer, n_buffer, buffer_pos, length)
-            else:
-                v = [None] * length
-                for i in range(length):
-                    p0 = buffer_pos
-                    v[i], buffer_pos = read_instance(
-                        buffer, n_buffer, buffer_pos,
-                        type_def.element_type_hash, map_typedef, map_string_hash, abs_offset,
-                        found_strings=found_strings)
-            if opos is not None:
-                buffer_pos = opos
-            
-            v = AdfValue(v, type_id, dpos + abs_offset, offset + abs_offset)
+            v, buffer_pos = read_array(
+                buffer, n_buffer, buffer_pos, type_id, type_def, map_typedef, map_string_hash, abs_offset,
+                found_strings, array_view, lazy_reader)
         elif type_def.metatype == 7:  # BitField
             if type_def.size == 1:
                 v, buffer_pos = ff_read_u8(buffer, n_buffer, buffer_pos)
@@ -731,6 +1498,632 @@ def read_instance(
     return v, buffer_pos
 
 
+# where the game puts array data, non empty arrays at 8 (or their element alignment) and the data after an empty array
+# at 16, checked against the sample saves
+adf_array_data_align = 8
+adf_empty_array_align = 16
+
+
+adf_header = struct.Struct('<4sIIIIIIIIII5I')
+
+# the 8 bytes before the instance table in every file seen so far, meaning unknown
+adf_instance_table_marker = struct.pack('<II', 12, 0)
+
+
+def adf_align(v, n):
+    return (v + n - 1) // n * n
+
+
+def adf_type_align(type_id, map_typedef):
+    if type_id in adf_prim_dtypes:
+        return np.dtype(adf_prim_dtypes[type_id]).itemsize
+    type_def = map_typedef.get(type_id)
+    if type_def is None or not type_def.alignment:
+        return 1
+    return type_def.alignment
+
+
+def _adf_plain(v):
+    if isinstance(v, AdfValue):
+        return v.value
+    return v
+
+
+def write_instance(buf, pos, v, type_id, map_typedef, deferred, bit_offset=None):
+    """
+    Write a value of type_id (an AdfValue or the plain value) at pos of buf, a zero filled bytearray already long
+    enough for it. Arrays and strings only get their header here, their data goes after the value, they are queued
+    on deferred as (header_pos, type_id, type_def, value) for write_deferred.
+    """
+    if isinstance(v, AdfValue):
+        if bit_offset is None:
+            bit_offset = v.bit_offset
+        v = v.value
+
+    code = adf_prim_struct_codes.get(type_id)
+    if code is not None:
+        struct.pack_into('<' + code, buf, pos, v)
+        return
+    if type_id == 0x8955583e:  # string
+        deferred.append((pos, type_id, None, v))
+        return
+    if type_id in adf_special_types:
+        raise EDecaBuildError('ADF serialize: values of 0x{:08x} are not supported'.format(type_id))
+
+    type_def = map_typedef.get(type_id)
+    if type_def is None:
+        raise EDecaMissingAdfType(type_id)
+
+    if type_def.metatype == 1:  # Structure
+        write_struct(buf, pos, v, type_def, map_typedef, deferred)
+    elif type_def.metatype == 2:  # Pointer, read as (value, note)
+        struct.pack_into('<Q', buf, pos, v[0])
+    elif type_def.metatype == 3:  # Array
+        deferred.append((pos, type_id, type_def, v))
+    elif type_def.metatype == 4:  # Inline Array
+        write_elements(buf, pos, v, type_def.element_type_hash, map_typedef, deferred)
+    elif type_def.metatype == 7:  # BitField, members share the word
+        word = int.from_bytes(buf[pos:pos + type_def.size], 'little') | ((int(v) & 1) << (bit_offset or 0))
+        buf[pos:pos + type_def.size] = word.to_bytes(type_def.size, 'little')
+    elif type_def.metatype == 8:  # Enumeration
+        struct.pack_into('<I', buf, pos, v)
+    elif type_def.metatype == 9:  # String Hash
+        if type_def.size == 4:
+            struct.pack_into('<I', buf, pos, v)
+        elif type_def.size == 6:
+            struct.pack_into('<HHH', buf, pos, (v >> 32) & 0xffff, (v >> 16) & 0xffff, v & 0xffff)
+        elif type_def.size == 8:
+            struct.pack_into('<Q', buf, pos, v)
+        else:
+            buf[pos:pos + type_def.size] = bytes(v)
+    else:
+        raise EDecaBuildError('ADF serialize: metatype {} of {} is not supported'.format(
+            type_def.metatype, type_def.name))
+
+
+def write_struct(buf, pos, v, type_def, map_typedef, deferred):
+    if isinstance(v, np.void):  # record of a structured array view, the same bytes as the struct
+        buf[pos:pos + type_def.size] = v.tobytes()
+        return
+
+    _, _, ops = adf_struct_plan(type_def, map_typedef)
+    for op in ops:
+        if op[0] == 'prims':
+            _, start, fmt, members = op
+            values = [_adf_plain(v[name]) for name, _, _ in members]
+            if 'x' in fmt:
+                # padding in the run may belong to members written before, pack only the members themselves
+                for (_, offset, member_hash), value in zip(members, values):
+                    struct.pack_into('<' + adf_prim_struct_codes[member_hash], buf, pos + offset, value)
+            else:
+                struct.pack_into(fmt, buf, pos + start, *values)
+        elif op[0] == 'struct':
+            _, name, offset, member_hash, _ = op
+            write_instance(buf, pos + offset, v[name], member_hash, map_typedef, deferred)
+        else:
+            _, name, offset, member_hash, bit_offset = op
+            write_instance(buf, pos + offset, v[name], member_hash, map_typedef, deferred, bit_offset)
+
+
+def write_elements(buf, pos, values, element_type, map_typedef, deferred):
+    """
+    Write consecutive elements of element_type from pos, primitive and structured arrays in one copy
+    """
+    values = _adf_plain(values)
+    if isinstance(values, (bytes, bytearray, memoryview)):
+        buf[pos:pos + len(values)] = values
+    elif isinstance(values, np.ndarray) and values.dtype.names is not None:
+        data = values.tobytes()
+        buf[pos:pos + len(data)] = data
+    elif element_type in adf_prim_dtypes:
+        data = np.asarray(values, dtype=adf_prim_dtypes[element_type]).tobytes()
+        buf[pos:pos + len(data)] = data
+    else:
+        element_size = adf_type_size(element_type, map_typedef)
+        for i, item in enumerate(values):
+            write_instance(buf, pos + i * element_size, item, element_type, map_typedef, deferred)
+
+
+def write_deferred(buf, deferred, slots, map_typedef):
+    """
+    Append the data of the queued arrays and strings to buf in order, the arrays an element owns follow that element,
+    depth first. The header position of every non empty array goes on slots for the relocation chain.
+    """
+    for header_pos, type_id, type_def, v in deferred:
+        v = _adf_plain(v)
+        if type_def is None:  # string, (offset, length) then the bytes and a terminator
+            data_pos = len(buf)
+            buf.extend(v + b'\00')
+            struct.pack_into('<II', buf, header_pos, data_pos, len(v))
+            continue
+
+        count = len(v)
+        if count == 0:
+            # an empty array has an all zero header and is not part of the relocation chain
+            buf.extend(bytes(adf_align(len(buf), adf_empty_array_align) - len(buf)))
+            continue
+
+        element_type = type_def.element_type_hash
+        element_size = adf_type_size(element_type, map_typedef)
+        data_pos = adf_align(len(buf), max(adf_array_data_align, adf_type_align(element_type, map_typedef)))
+        buf.extend(bytes(data_pos - len(buf) + element_size * count))
+        struct.pack_into('<III', buf, header_pos, data_pos, 0, count)
+        slots.append(header_pos)
+
+        if element_type in adf_prim_dtypes or (isinstance(v, np.ndarray) and v.dtype.names is not None):
+            write_elements(buf, data_pos, v, element_type, map_typedef, None)
+            continue
+        for i, item in enumerate(v):
+            child_deferred = []
+            write_instance(buf, data_pos + i * element_size, item, element_type, map_typedef, child_deferred)
+            write_deferred(buf, child_deferred, slots, map_typedef)
+
+
+def adf_instance_bytes(v, type_id, map_typedef, original=None):
+    """
+    Instance data for the value v of type_id, the root value first and then the data of its arrays and strings (see
+    write_deferred). The second u32 of each non empty array header is the distance to the next one. When original,
+    the buffer the instance was read from, has every one of those headers at the same place with the same offset and
+    count, its own chain values are kept so an unedited instance comes back byte for byte.
+    """
+    buf = bytearray(adf_type_size(type_id, map_typedef))
+    deferred = []
+    slots = []
+    write_instance(buf, 0, v, type_id, map_typedef, deferred)
+    write_deferred(buf, deferred, slots, map_typedef)
+
+    slots.sort()
+    for slot, next_slot in zip(slots, slots[1:]):
+        struct.pack_into('<I', buf, slot + 4, next_slot - slot)
+
+    if original is not None and len(original) == len(buf):
+        original = memoryview(original).cast('B')
+        if all(original[s:s + 4] == buf[s:s + 4] and original[s + 8:s + 12] == buf[s + 8:s + 12] for s in slots):
+            for s in slots:
+                buf[s + 4:s + 8] = original[s + 4:s + 8]
+    return buf
+
+
+adf_query_ops = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+adf_query_step_re = re.compile(r'([A-Za-z_]\w*)?((?:\[(?:[^\]\'"]|\'[^\']*\'|"[^"]*")*\])*)(\.|$)')
+adf_query_selector_re = re.compile(r'\[((?:[^\]\'"]|\'[^\']*\'|"[^"]*")*)\]')
+adf_query_slice_re = re.compile(r'^(-?\d*):(-?\d*)(?::(-?\d*))?$')
+adf_query_predicate_re = re.compile(r'^([A-Za-z_][\w.]*)\s*(==|!=|<=|>=|<|>)\s*(.+)$')
+
+adf_query_cache = {}
+
+
+def adf_query_parse(path):
+    """
+    Split a query path into steps, ('member', name) or a selector on the current value:
+        ('all',)                           [*]
+        ('index', i)                       [3], [-1]
+        ('slice', start, stop, step)       [2:5], [::2]
+        ('where', names, op, literal)      [Weight>50.5], [MapPosition.X<0], [Name=='bear']
+    """
+    steps = []
+    pos = 0
+    while pos < len(path):
+        match = adf_query_step_re.match(path, pos)
+        if match is None or match.end() == pos:
+            raise EDecaErrorParse('Bad query {!r} at {}'.format(path, pos))
+        name, selectors, _ = match.groups()
+        if name is not None:
+            steps.append(('member', name))
+        elif not selectors or steps:
+            raise EDecaErrorParse('Bad query {!r} at {}'.format(path, pos))
+        for selector in adf_query_selector_re.findall(selectors):
+            steps.append(adf_query_parse_selector(selector.strip(), path))
+        pos = match.end()
+        if match.group(3) == '.' and pos == len(path):
+            raise EDecaErrorParse('Bad query {!r}, ends with .'.format(path))
+    return tuple(steps)
+
+
+def adf_query_parse_selector(selector, path):
+    if selector == '*':
+        return ('all',)
+    if re.match(r'^-?\d+$', selector):
+        return ('index', int(selector))
+    match = adf_query_slice_re.match(selector)
+    if match is not None:
+        return ('slice',) + tuple(None if v in {None, ''} else int(v) for v in match.groups())
+    match = adf_query_predicate_re.match(selector)
+    if match is not None:
+        names, op, literal = match.groups()
+        try:
+            literal = ast.literal_eval(literal.strip())
+        except (ValueError, SyntaxError):
+            raise EDecaErrorParse('Bad literal {!r} in query {!r}'.format(literal, path))
+        if isinstance(literal, str):
+            literal = literal.encode('utf-8')
+        return ('where', tuple(names.split('.')), op, literal)
+    raise EDecaErrorParse('Bad selector [{}] in query {!r}'.format(selector, path))
+
+
+def adf_type_size(type_id, map_typedef):
+    if type_id in adf_prim_dtypes:
+        return np.dtype(adf_prim_dtypes[type_id]).itemsize
+    elif type_id == 0x8955583e:  # string, offset and length
+        return 8
+    elif type_id == 0xdefe88ed:  # deferred value
+        return 16
+    elif type_id in map_typedef:
+        return map_typedef[type_id].size
+    raise EDecaMissingAdfType(type_id)
+
+
+def adf_query_member(type_id, name, map_typedef):
+    type_def = map_typedef.get(type_id)
+    if type_def is None or type_def.metatype != 1:
+        raise EDecaErrorParse('Query: 0x{:08x} has no member {}'.format(type_id, name))
+    member = adf_struct_members(type_def).get(name)
+    if member is None:
+        raise EDecaErrorParse('Query: {} has no member {}'.format(type_def.name, name))
+    return member
+
+
+def adf_query_compile(path, type_id, map_typedef):
+    """
+    Resolve a query path against the typedefs, starting at a value of type_id. Each op works on every current
+    position at once:
+        ('member', offset, type_hash, bit_offset)
+        ('elements', selector, array_metatype, element_length, element_type_hash, element_size)
+        ('where', offset, type_hash, bit_offset, op, literal)  filter on the leaf at offset
+    """
+    key = (type_id, path)
+    ops = adf_query_cache.get(key)
+    if ops is not None:
+        return ops
+
+    ops = []
+    bit_offset = None
+    for step in adf_query_parse(path):
+        type_def = map_typedef.get(type_id)
+        if step[0] == 'member':
+            m = adf_query_member(type_id, step[1], map_typedef)
+            ops.append(('member', m.offset, m.type_hash, m.bit_offset))
+            type_id = m.type_hash
+            bit_offset = m.bit_offset
+        elif type_def is not None and type_def.metatype in {3, 4}:
+            element_size = adf_type_size(type_def.element_type_hash, map_typedef)
+            if step[0] == 'where':
+                selector = ('all',)
+            else:
+                selector = step
+            ops.append((
+                'elements', selector, type_def.metatype, type_def.element_length, type_def.element_type_hash,
+                element_size))
+            type_id = type_def.element_type_hash
+            bit_offset = None
+            if step[0] == 'where':
+                ops.append(adf_query_compile_where(step, type_id, map_typedef))
+        elif step[0] == 'where':
+            ops.append(adf_query_compile_where(step, type_id, map_typedef))
+        else:
+            raise EDecaErrorParse('Query {!r}: selector on 0x{:08x} which is not an array'.format(path, type_id))
+
+    ops = (tuple(ops), type_id, bit_offset)
+    adf_query_cache[key] = ops
+    return ops
+
+
+def adf_query_compile_where(step, type_id, map_typedef):
+    _, names, op, literal = step
+    offset = 0
+    bit_offset = None
+    for name in names:
+        m = adf_query_member(type_id, name, map_typedef)
+        offset += m.offset
+        type_id = m.type_hash
+        bit_offset = m.bit_offset
+    return ('where', offset, type_id, bit_offset, adf_query_ops[op], literal)
+
+
+def adf_query_read(buffer, n_buffer, positions, type_id, bit_offset, map_typedef, map_string_hash, abs_offset,
+                   array_view=False):
+    """
+    Values of type_id at positions of the instance buffer, an np.ndarray for primitives and bitfields, otherwise a
+    list of the values adf_value_extract gives
+    """
+    type_def = map_typedef.get(type_id)
+    if type_id in adf_prim_dtypes or (type_def is not None and type_def.metatype == 7):
+        if type_id in adf_prim_dtypes:
+            dtype = np.dtype(adf_prim_dtypes[type_id])
+        else:
+            dtype = np.dtype(adf_bitfield_dtypes[type_def.size])
+        if len(positions) and positions.max() + dtype.itemsize > n_buffer:
+            raise_error()
+        raw = np.frombuffer(buffer, dtype=np.uint8, count=n_buffer)
+        values = raw[positions[:, None] + np.arange(dtype.itemsize)].view(dtype).ravel()
+        if type_id not in adf_prim_dtypes:
+            values = (values >> (bit_offset or 0)) & 1
+        return values
+
+    values = []
+    for pos in positions.tolist():
+        v, _ = read_instance(
+            buffer, n_buffer, pos, type_id, map_typedef, map_string_hash, abs_offset,
+            bit_offset=bit_offset, array_view=array_view)
+        values.append(adf_value_extract(v))
+    return values
+
+
+def adf_query_run(buffer, n_buffer, type_id, path, map_typedef, map_string_hash, abs_offset, array_view=False):
+    ops, leaf_type, leaf_bit_offset = adf_query_compile(path, type_id, map_typedef)
+    array_header = struct.Struct('<III')
+
+    positions = np.zeros(1, dtype=np.int64)
+    for op in ops:
+        if op[0] == 'member':
+            positions = positions + op[1]
+        elif op[0] == 'elements':
+            _, selector, metatype, element_length, element_type, element_size = op
+            selected = []
+            for pos in positions.tolist():
+                if metatype == 3:
+                    if pos + array_header.size > n_buffer:
+                        raise_error()
+                    offset, _, length = array_header.unpack_from(buffer, pos)
+                else:
+                    offset, length = pos, element_length
+                if selector[0] == 'index':
+                    index = selector[1] + length if selector[1] < 0 else selector[1]
+                    indices = np.arange(index, index + 1) if 0 <= index < length else np.arange(0)
+                elif selector[0] == 'slice':
+                    indices = np.arange(*slice(*selector[1:]).indices(length))
+                else:
+                    indices = np.arange(length)
+                selected.append(offset + indices * element_size)
+            positions = np.concatenate(selected).astype(np.int64) if selected else positions[:0]
+        else:
+            _, offset, where_type, where_bit_offset, op_func, literal = op
+            values = adf_query_read(
+                buffer, n_buffer, positions + offset, where_type, where_bit_offset, map_typedef, map_string_hash,
+                abs_offset, array_view)
+            if isinstance(values, np.ndarray):
+                mask = op_func(values, literal)
+            else:
+                mask = np.array([op_func(v, literal) for v in values], dtype=bool)
+            positions = positions[mask]
+
+    values = adf_query_read(
+        buffer, n_buffer, positions, leaf_type, leaf_bit_offset, map_typedef, map_string_hash, abs_offset,
+        array_view)
+    return values, positions + abs_offset
+
+
+# On disk layout, all values little endian
+#   header: magic, version, typedef_count, name_count, section_count, typedef_size, name_size
+#   typedefs: as in an ADF typedef section, names are indices into the name table
+#   name table: as in an ADF, u8 lengths and then the zero terminated names
+#   sections: 16 byte key, u32 entry count, then (u32 type_hash, u32 position) per entry
+type_library_magic = b'DECATLIB'
+type_library_version = 2
+type_library_header = struct.Struct('<8sIIIIQQ')
+type_library_section = struct.Struct('<16sI')
+
+
+@contextlib.contextmanager
+def adf_gc_paused():
+    """
+    Hold off the cyclic garbage collector while decoding. AdfValue trees hold no reference cycles, but building one
+    triggers collections that walk every tree alive, which took most of the decode time once a few were loaded.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+# data and maps a process pool worker decodes from, set once per worker by adf_worker_init
+adf_worker_state = {}
+
+
+def adf_worker_init(source, map_typedef, map_string_hash, array_view):
+    # source is a file name, mapped here, or the name of a shared memory block, attached here
+    if isinstance(source, tuple):
+        shm = shared_memory.SharedMemory(name=source[1])
+        adf_worker_state['shm'] = shm
+        buffer = shm.buf
+    else:
+        buffer = map_file(source).view
+    adf_worker_state['buffer'] = buffer
+    adf_worker_state['map_typedef'] = map_typedef
+    adf_worker_state['map_string_hash'] = map_string_hash
+    adf_worker_state['array_view'] = array_view
+
+
+def adf_worker_read(start, size, abs_offset, type_hash):
+    # the worker is a process of the pool, pausing its collector does not touch the caller's
+    state = adf_worker_state
+    with adf_gc_paused():
+        return adf_read_one_instance(
+            state['buffer'][start:start + size], abs_offset, type_hash, state['map_typedef'],
+            state['map_string_hash'], state['array_view'])
+
+
+def adf_read_one_instance(buffer, abs_offset, type_hash, map_typedef, map_string_hash, array_view):
+    found_strings = set()
+    v, _ = read_instance(
+        buffer, len(buffer), 0, type_hash, map_typedef, map_string_hash, abs_offset,
+        found_strings=found_strings, array_view=array_view)
+    return v, found_strings
+
+
+def adf_gil_enabled():
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is None or is_gil_enabled()
+
+
+def adf_read_instances(
+        source, instances, map_typedef, map_string_hash, array_view=False, workers=None, source_offset=0,
+        gc_paused=False):
+    """
+    Decode the instances concurrently, returns (value, found_strings) for each in the order of instances. source is
+    the name of the file or a buffer of it from source_offset on. The decoders are Python, so this runs on a process
+    pool or on a thread pool when the interpreter runs without the GIL. Each process maps a file itself, a buffer is
+    copied once into a shared memory block the processes attach to, and a task reads only its own instance. Values
+    coming back from a process are pickled, which costs more than decoding small structs, a process pool pays off for
+    instances that are mostly arrays read with array_view. gc_paused pauses the collector of this process while the
+    results are merged (see adf_gc_paused).
+    """
+    starts = [ins.offset - source_offset for ins in instances]
+    sizes = [ins.size for ins in instances]
+
+    if not adf_gil_enabled():
+        fp = map_file(source) if isinstance(source, (str, os.PathLike)) else BufferArchiveFile(source)
+        with fp:
+            def read(index):
+                ins = instances[index]
+                return adf_read_one_instance(
+                    fp.view[starts[index]:starts[index] + sizes[index]], ins.offset, ins.type_hash, map_typedef,
+                    map_string_hash, array_view)
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(read, range(len(instances))))
+
+    shm = None
+    if not isinstance(source, (str, os.PathLike)):
+        source = memoryview(source).cast('B')
+        shm = shared_memory.SharedMemory(create=True, size=max(len(source), 1))
+        shm.buf[:len(source)] = source
+        source = ('shm', shm.name)
+    try:
+        # the results are unpickled here as they arrive
+        with ProcessPoolExecutor(
+                max_workers=workers, initializer=adf_worker_init,
+                initargs=(source, map_typedef, map_string_hash, array_view)) as executor, \
+                (adf_gc_paused() if gc_paused else contextlib.nullcontext()):
+            return list(executor.map(
+                adf_worker_read, starts, sizes, [ins.offset for ins in instances],
+                [ins.type_hash for ins in instances]))
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+
+class TypeLibrary(dict):
+    """
+    Typedefs shared between ADF files, type hash to TypeDef.
+
+    Passed as map_typedef to Adf.deserialize, a file whose typedef section and name table match one seen before takes
+    its typedefs from the library instead of parsing them, anything new is parsed and added. save and load keep the
+    typedefs and the section keys in a plain binary layout, so a batch over many files with the same schema does the
+    typedef parsing once. Struct plans and dtypes are built from the typedefs on first decode, as for any file.
+    """
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        # section key to (type_hash, position from the start of the typedef section) of each typedef in file order
+        self.sections = {}
+
+    @staticmethod
+    def section_key(typedef_section, name_table):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(typedef_section)
+        h.update(name_table)
+        return h.digest()
+
+    def lookup(self, key, typedef_offset):
+        """
+        Typedefs of a known section in file order, with META_position moved to typedef_offset, or None
+        """
+        entries = self.sections.get(key)
+        if entries is None:
+            return None
+        table = []
+        for type_hash, position in entries:
+            type_def = copy.copy(self[type_hash])
+            type_def.META_position = typedef_offset + position
+            table.append(type_def)
+        return table
+
+    def add_section(self, key, table_typedef, typedef_offset):
+        self.sections[key] = tuple((td.type_hash, td.META_position - typedef_offset) for td in table_typedef)
+        for td in table_typedef:
+            self[td.type_hash] = td
+
+    # persistence
+    def save(self, filename):
+        table_typedef = list(self.values())
+        table_name = []
+        name_index = {}
+        for td in table_typedef:
+            for name in [td.name] + [m.name for m in (td.members or [])]:
+                if name not in name_index:
+                    name_index[name] = len(table_name)
+                    table_name.append(name)
+
+        typedef_size = sum(td.serialized_size() for td in table_typedef)
+        name_size = len(table_name) + sum(len(name) + 1 for name in table_name)
+        section_size = sum(type_library_section.size + 8 * len(entries) for entries in self.sections.values())
+        fw = BufferWriter(type_library_header.size + typedef_size + name_size + section_size)
+        fw.pack(
+            type_library_header, type_library_magic, type_library_version, len(table_typedef), len(table_name),
+            len(self.sections), typedef_size, name_size)
+        for td in table_typedef:
+            td.serialize(fw, name_index)
+        fw.write(bytes(len(name) for name in table_name))
+        for name in table_name:
+            fw.write(name + b'\00')
+        for key, entries in self.sections.items():
+            fw.pack(type_library_section, key, len(entries))
+            fw.write(np.array(entries, dtype='<u4').reshape(-1).tobytes())
+
+        tmp_filename = '{}.tmp'.format(filename)
+        with open(tmp_filename, 'wb') as f:
+            fw.flush(f)
+        os.replace(tmp_filename, filename)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'rb') as f:
+            buf = f.read()
+        if len(buf) < type_library_header.size:
+            raise EDecaIncorrectFileFormat('Type library too short: {}'.format(filename))
+        magic, version, typedef_count, name_count, section_count, typedef_size, name_size = \
+            type_library_header.unpack_from(buf, 0)
+        if magic != type_library_magic or version != type_library_version:
+            raise EDecaIncorrectFileFormat('Not a type library: {}'.format(filename))
+
+        fp = BufferArchiveFile(buf)
+        fp.seek(type_library_header.size + typedef_size)
+        name_lengths = fp.read_u8(name_count) if name_count > 0 else []
+        table_name = []
+        for length in name_lengths:
+            name = fp.read(length + 1)
+            table_name.append([length, name[:length]])
+
+        lib = cls()
+        fp.seek(type_library_header.size)
+        for i in range(typedef_count):
+            td = TypeDef()
+            td.deserialize(fp, table_name)
+            lib[td.type_hash] = td
+
+        pos = type_library_header.size + typedef_size + name_size
+        for i in range(section_count):
+            key, count = type_library_section.unpack_from(buf, pos)
+            pos += type_library_section.size
+            entries = np.frombuffer(buf, dtype='<u4', count=2 * count, offset=pos).reshape(-1, 2).tolist()
+            lib.sections[key] = tuple(tuple(e) for e in entries)
+            pos += 8 * count
+        return lib
+
+
 class Adf:
     def __init__(self):
         self.version = None
@@ -761,70 +2154,107 @@ class Adf:
         self.found_strings = set()
         self.table_instance_full_values = []
         self.table_instance_values = []
-
-    def dump_to_string(self):
-        sbuf = ''
-        sbuf = sbuf + '--------header\n'
-        sbuf = sbuf + '{}: {}\n'.format('version', self.version)
-        sbuf = sbuf + '{}: {}\n'.format('instance_count', self.instance_count)
-        sbuf = sbuf + '{}: {}\n'.format('instance_offset', self.instance_offset)
-        sbuf = sbuf + '{}: {}\n'.format('typedef_count', self.typedef_count)
-        sbuf = sbuf + '{}: {}\n'.format('typedef_offset', self.typedef_offset)
-        sbuf = sbuf + '{}: {}\n'.format('stringhash_count', self.stringhash_count)
-        sbuf = sbuf + '{}: {}\n'.format('stringhash_offset', self.stringhash_offset)
-        sbuf = sbuf + '{}: {}\n'.format('nametable_count', self.nametable_count)
-        sbuf = sbuf + '{}: {}\n'.format('nametable_offset', self.nametable_offset)
-        sbuf = sbuf + '{}: {}\n'.format('total_size', self.total_size)
+        self.table_instance_buffers = []
+        self.instance_source = None
+
+    def dump_to_string(self, hash_db=None):
+        return ''.join(self.dump_lines(hash_db=hash_db))
+
+    def dump(self, f, hash_db=None):
+        """
+        Write the dump_to_string text to the text stream f without building it in memory
+        """
+        for line in self.dump_lines(hash_db=hash_db):
+            f.write(line)
+
+    def dump_lines(self, hash_db=None):
+        """
+        dump_to_string as a sequence of strings of whole lines (see adf_format_lines), type names and typedef dumps
+        are only formatted once per dump
+        """
+        memo = {}
+        yield '--------header\n'
+        yield '{}: {}\n'.format('version', self.version)
+        yield '{}: {}\n'.format('instance_count', self.instance_count)
+        yield '{}: {}\n'.format('instance_offset', self.instance_offset)
+        yield '{}: {}\n'.format('typedef_count', self.typedef_count)
+        yield '{}: {}\n'.format('typedef_offset', self.typedef_offset)
+        yield '{}: {}\n'.format('stringhash_count', self.stringhash_count)
+        yield '{}: {}\n'.format('stringhash_offset', self.stringhash_offset)
+        yield '{}: {}\n'.format('nametable_count', self.nametable_count)
+        yield '{}: {}\n'.format('nametable_offset', self.nametable_offset)
+        yield '{}: {}\n'.format('total_size', self.total_size)
         for i in range(len(self.unknown)):
-            sbuf = sbuf + 'Unknown[{0}]: {1} 0x{1:08x}\n'.format(i, self.unknown[i])
+            yield 'Unknown[{0}]: {1} 0x{1:08x}\n'.format(i, self.unknown[i])
 
-        sbuf = sbuf + '\n--------comment\n'
-        sbuf = sbuf + self.comment.decode('utf-8')
+        yield '\n'
+        yield '--------comment\n'
+        yield self.comment.decode('utf-8') + '\n'
 
-        sbuf = sbuf + '\n\n--------name_table\n'
-        # sbuf = sbuf + '  NOT CURRENTLY SHOWN\n'
+        yield '\n'
+        yield '--------name_table\n'
+        # yield '  NOT CURRENTLY SHOWN\n'
         for i in range(len(self.table_name)):
-            sbuf = sbuf + 'name_table\t{}\t{}\n'.format(i, self.table_name[i][1].decode('utf-8'))
+            yield 'name_table\t{}\t{}\n'.format(i, self.table_name[i][1].decode('utf-8'))
 
-        sbuf = sbuf + '\n--------string_hash\n'
-        # sbuf = sbuf + '  NOT CURRENTLY SHOWN\n'
+        yield '\n'
+        yield '--------string_hash\n'
+        # yield '  NOT CURRENTLY SHOWN\n'
         v: StringHash
         for k, v in self.map_stringhash.items():
-            sbuf = sbuf + 'string_hash\t{:016x}\t{}\n'.format(k, v.value)
+            yield 'string_hash\t{:016x}\t{}\n'.format(k, v.value)
 
-        sbuf = sbuf + '\n--------typedefs\n'
-        # sbuf = sbuf + '  NOT CURRENTLY SHOWN\n'
+        yield '\n'
+        yield '--------typedefs\n'
+        # yield '  NOT CURRENTLY SHOWN\n'
         vt: TypeDef
         for k, vt in self.map_typedef.items():
-            sbuf = sbuf + 'typedefs\t{:08x}\t{} @ {} (0x{:08x})\n'.format(
+            yield 'typedefs\t{:08x}\t{} @ {} (0x{:08x})\n'.format(
                 k, vt.name.decode('utf-8'), vt.META_position, vt.META_position)
-            sbuf = sbuf + dump_type(k, self.extended_map_typedef, 2)
+            yield from dump_type_lines(k, self.extended_map_typedef, 2, memo=memo)
 
-        sbuf = sbuf + '\n--------instances\n'
+        yield '\n'
+        yield '--------instances\n'
         for info, v, fv in zip(self.table_instance, self.table_instance_values, self.table_instance_full_values):
             end_str = '{:08x}-???'.format(info.offset)
             if info.size is not None:
                 end_str = '{:08x}-{:08x}'.format(info.offset, info.offset + info.size)
 
-            sbuf = sbuf + 'instances\t{:08x}\t{:08x}\t{}\t{}\t{}\t{}\n'.format(
+            yield 'instances\t{:08x}\t{:08x}\t{}\t{}\t{}\t{}\n'.format(
                 info.name_hash,
                 info.type_hash,
                 info.name.decode('utf-8'),
                 info.offset, info.size,
                 end_str)
 
-            # sbuf = sbuf + pformat(v, width=1024) + '\n'
-            sbuf = sbuf + adf_format(fv, self.extended_map_typedef) + '\n'
-
-        return sbuf
-
-    def deserialize(self, fp, map_typedef=None, process_instances=True):      
+            # yield pformat(v, width=1024) + '\n'
+            yield from adf_format_lines(fv, self.extended_map_typedef, hash_db=hash_db, memo=memo)
+            yield '\n'
+
+    def deserialize(
+            self, fp, map_typedef=None, process_instances=True, array_view=False, workers=None, gc_paused=False):
+        """
+        array_view: arrays of primitives (other than u8/s8) are read only np.ndarray views instead of lists, arrays of
+            structs made only of primitives, bitfields and such structs are structured views (see adf_struct_dtype)
+        process_instances: 'lazy' reads structs and arrays of structs only when a member or element is accessed (see
+            AdfLazyStruct), found_strings then only holds the strings read so far
+        table_instance_full_values holds the AdfValue trees, table_instance_values the plain values as read-only
+        projections of them (see adf_value_view)
+        map_typedef: typedefs the file may use without defining them, a TypeLibrary also supplies and collects the
+            file's own typedefs
+        workers: decode the instances on up to this many workers (see adf_read_instances) when there is more than
+            one, the values are the same as a serial decode. Not used in lazy mode
+        gc_paused: hold off the cyclic garbage collector while the values are built (see adf_gc_paused). It is process
+            wide, so only for callers that own the process
+        """
         if map_typedef is None:
             map_typedef = {}
 
+        fp = as_archive_file(fp)
+
         header = fp.read(0x40)
 
-        fh = ArchiveFile(io.BytesIO(header))
+        fh = BufferArchiveFile(header)
 
         if len(header) < 0x40:
             raise EDecaErrorParse('File Too Short')
@@ -856,11 +2286,18 @@ class Adf:
 
         # name table
         self.table_name = [[0, b''] for i in range(self.nametable_count)]
+        name_table = b''
         fp.seek(self.nametable_offset)
-        for i in range(self.nametable_count):
-            self.table_name[i][0] = fp.read_u8()
-        for i in range(self.nametable_count):
-            self.table_name[i][1] = fp.read(self.table_name[i][0] + 1)[0:-1]
+        if self.nametable_count > 0:
+            # read all lengths and then the whole string block at once, each name is followed by a terminator
+            name_lengths = fp.read_u8(self.nametable_count)
+            name_block = fp.read(sum(name_lengths) + self.nametable_count)
+            name_table = bytes(name_lengths) + bytes(name_block)
+            pos = 0
+            for i in range(self.nametable_count):
+                self.table_name[i][0] = name_lengths[i]
+                self.table_name[i][1] = name_block[pos:pos + name_lengths[i]]
+                pos += name_lengths[i] + 1
 
         # string hash
         self.table_stringhash = [StringHash() for i in range(self.stringhash_count)]
@@ -871,18 +2308,36 @@ class Adf:
             self.map_stringhash[self.table_stringhash[i].value_hash] = self.table_stringhash[i]
 
         # typedef
-        self.table_typedef = [TypeDef() for i in range(self.typedef_count)]
+        section_key = None
+        table_typedef = None
+        if isinstance(map_typedef, TypeLibrary) and self.typedef_count > 0:
+            # the section runs up to whatever comes after it
+            typedef_end = min(
+                [o for o in (self.instance_offset, self.stringhash_offset, self.nametable_offset, self.total_size)
+                 if o > self.typedef_offset], default=None)
+            if typedef_end is not None:
+                fp.seek(self.typedef_offset)
+                section_key = map_typedef.section_key(
+                    fp.read_view(typedef_end - self.typedef_offset), name_table)
+                table_typedef = map_typedef.lookup(section_key, self.typedef_offset)
 
         self.extended_map_typedef = {}
         for k, v in map_typedef.items():
             self.extended_map_typedef[k] = v
 
+        if table_typedef is None:
+            table_typedef = [TypeDef() for i in range(self.typedef_count)]
+            fp.seek(self.typedef_offset)
+            for i in range(self.typedef_count):
+                table_typedef[i].deserialize(fp, self.table_name)
+            if section_key is not None:
+                map_typedef.add_section(section_key, table_typedef, self.typedef_offset)
+
+        self.table_typedef = table_typedef
         self.map_typedef = {}
-        fp.seek(self.typedef_offset)
-        for i in range(self.typedef_count):
-            self.table_typedef[i].deserialize(fp, self.table_name)
-            self.map_typedef[self.table_typedef[i].type_hash] = self.table_typedef[i]
-            self.extended_map_typedef[self.table_typedef[i].type_hash] = self.table_typedef[i]
+        for type_def in self.table_typedef:
+            self.map_typedef[type_def.type_hash] = type_def
+            self.extended_map_typedef[type_def.type_hash] = type_def
 
         # instance
         self.table_instance = [InstanceEntry() for i in range(self.instance_count)]
@@ -895,16 +2350,152 @@ class Adf:
         self.found_strings = set()
         self.table_instance_values = [None] * len(self.table_instance)
         self.table_instance_full_values = [None] * len(self.table_instance)
-        if process_instances:
+
+        # views of a buffer cost nothing to keep, a stream is read again on demand (see instance_buffer) unless the
+        # lazy values need the data
+        self.instance_source = fp
+        self.table_instance_buffers = [None] * len(self.table_instance)
+        if isinstance(fp, BufferArchiveFile) or process_instances == 'lazy':
+            for i, ins in enumerate(self.table_instance):
+                fp.seek(ins.offset)
+                self.table_instance_buffers[i] = fp.read_view(ins.size)
+
+        if process_instances and process_instances != 'lazy' and workers is not None and workers > 1 and \
+                len(self.table_instance) > 1:
+            # workers map the file themselves when it has a name, otherwise they get the span of the instances
+            source_offset = 0
+            if getattr(fp, 'filename', None) is not None:
+                source = fp.filename
+            elif isinstance(fp, BufferArchiveFile):
+                source = fp.view
+            else:
+                source_offset = min(ins.offset for ins in self.table_instance)
+                fp.seek(source_offset)
+                source = fp.read(max(ins.offset + ins.size for ins in self.table_instance) - source_offset)
+            results = adf_read_instances(
+                source, self.table_instance, self.extended_map_typedef, self.map_stringhash, array_view, workers,
+                source_offset=source_offset, gc_paused=gc_paused)
+            for i, (v, found_strings) in enumerate(results):
+                self.found_strings.update(found_strings)
+                self.table_instance_full_values[i] = v
+                self.table_instance_values[i] = adf_value_view(v)
+        elif process_instances:
             for i in range(len(self.table_instance)):
                 ins = self.table_instance[i]
-                fp.seek(ins.offset)
-                buffer = fp.read(ins.size)
+                buffer = self.instance_buffer(i)
                 n_buffer = len(buffer)
                 buffer_pos = 0
-                v, buffer_pos = read_instance(
-                    buffer, n_buffer, buffer_pos,
-                    ins.type_hash, self.extended_map_typedef, self.map_stringhash, ins.offset,
-                    found_strings=self.found_strings)
+                lazy_reader = None
+                if process_instances == 'lazy':
+                    lazy_reader = adf_lazy_reader(
+                        buffer, n_buffer, self.extended_map_typedef, self.map_stringhash, ins.offset,
+                        self.found_strings, array_view)
+                with adf_gc_paused() if gc_paused else contextlib.nullcontext():
+                    v, buffer_pos = read_instance(
+                        buffer, n_buffer, buffer_pos,
+                        ins.type_hash, self.extended_map_typedef, self.map_stringhash, ins.offset,
+                        found_strings=self.found_strings, array_view=array_view, lazy_reader=lazy_reader)
                 self.table_instance_full_values[i] = v
-                self.table_instance_values[i] = adf_value_extract(v)
+                self.table_instance_values[i] = adf_value_view(v)
+
+    def instance_buffer(self, i):
+        """
+        Data of instance i, the view kept by deserialize for a buffer or a lazy decode, otherwise it is read again
+        from the file deserialize read, which then has to still be open. None when there is neither
+        """
+        buffer = self.table_instance_buffers[i] if i < len(self.table_instance_buffers) else None
+        if buffer is None and self.instance_source is not None and i < len(self.table_instance):
+            ins = self.table_instance[i]
+            self.instance_source.seek(ins.offset)
+            buffer = self.instance_source.read(ins.size)
+        return buffer
+
+    def serialize(self, f=None):
+        """
+        Build the file from the typedefs and the AdfValue trees in table_instance_full_values, in the layout the game
+        writes: header, comment, instance data, instance table, typedefs, string hashes and the name table. An
+        instance without a value (process_instances=False) keeps its original bytes. The sections are sized first
+        and written into one buffer, which is written to f when given and returned. An unedited file comes back
+        byte for byte.
+        """
+        name_index = {}
+        table_name = [name for _, name in self.table_name]
+        for i, name in enumerate(table_name):
+            name_index.setdefault(name, i)
+
+        def add_name(name):
+            if name not in name_index:
+                name_index[name] = len(table_name)
+                table_name.append(name)
+
+        for type_def in self.table_typedef:
+            add_name(type_def.name)
+            for m in type_def.members or []:
+                add_name(m.name)
+        for ins in self.table_instance:
+            add_name(ins.name)
+
+        # instance data
+        pos = 0x40 + len(self.comment) + 1
+        instance_data = []
+        for i, ins in enumerate(self.table_instance):
+            v = self.table_instance_full_values[i] if i < len(self.table_instance_full_values) else None
+            original = self.instance_buffer(i)
+            if v is None:
+                if original is None:
+                    raise EDecaErrorParse('Instance {} has neither a value nor data'.format(i))
+                data = original
+            else:
+                data = adf_instance_bytes(v, ins.type_hash, self.extended_map_typedef, original)
+            pos = adf_align(pos, max(adf_array_data_align, adf_type_align(ins.type_hash, self.extended_map_typedef)))
+            instance_data.append((pos, data))
+            pos += len(data)
+
+        instance_offset = adf_align(pos, 8) + len(adf_instance_table_marker)
+        typedef_offset = instance_offset + 24 * len(self.table_instance)
+        stringhash_offset = typedef_offset + sum(t.serialized_size() for t in self.table_typedef)
+        nametable_offset = stringhash_offset + sum(sh.serialized_size() for sh in self.table_stringhash)
+        total_size = nametable_offset + len(table_name) + sum(len(name) + 1 for name in table_name)
+        if not self.table_stringhash:
+            stringhash_offset = 0
+
+        fw = BufferWriter(total_size)
+        fw.pack(
+            adf_header, b' FDA', self.version, len(self.table_instance), instance_offset, len(self.table_typedef),
+            typedef_offset, len(self.table_stringhash), stringhash_offset, len(table_name), nametable_offset,
+            total_size, *self.unknown)
+        fw.write(self.comment + b'\00')
+        for pos, data in instance_data:
+            fw.seek(pos)
+            fw.write(data)
+
+        fw.seek(instance_offset - len(adf_instance_table_marker))
+        fw.write(adf_instance_table_marker)
+        for ins, (pos, data) in zip(self.table_instance, instance_data):
+            ins.serialize(fw, name_index, pos, len(data))
+        for type_def in self.table_typedef:
+            type_def.serialize(fw, name_index)
+        for sh in self.table_stringhash:
+            sh.serialize(fw, name_index)
+        fw.write(bytes(len(name) for name in table_name))
+        for name in table_name:
+            fw.write(name + b'\00')
+
+        if f is not None:
+            fw.flush(f)
+        return bytes(fw.buffer)
+
+    def query(self, path, instance=0, array_view=False):
+        """
+        Read the values at a path in an instance without decoding the rest of it, e.g.
+            Populations[*].Groups[3].Animals[*].Weight
+            Populations[0].Groups[1:4].Animals[IsGreatOne==1].MapPosition.X
+        Selectors are [*], [i], [start:stop:step] and [member op literal] with ==, !=, <, <=, >, >=, a predicate on
+        an array keeps the elements it holds for. Returns (values, offsets), values is an np.ndarray for primitive
+        and bitfield leaves and a list otherwise, offsets is an np.ndarray of the absolute offsets of the values.
+        """
+        ins = self.table_instance[instance]
+        buffer = self.instance_buffer(instance)
+        return adf_query_run(
+            buffer, len(buffer), ins.type_hash, path, self.extended_map_typedef, self.map_stringhash, ins.offset,
+            array_view)
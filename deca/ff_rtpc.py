@@ -1,4 +1,4 @@
-from deca.file import ArchiveFile
+from deca.file import as_archive_file
 from deca.fast_file_2 import *
 from deca.hashes import hash32_func
 import struct
@@ -286,7 +286,7 @@ def rtpc_from_binary(f_raw, rtpc: Optional[Rtpc] = None):
     if rtpc is None:
         rtpc = Rtpc()
 
-    f = ArchiveFile(f_raw)
+    f = as_archive_file(f_raw)
 
     rtpc.magic = f.read_strl(4)
     if rtpc.magic != b'RTPC':
@@ -363,7 +363,21 @@ def parse_prop_data(bufn, prop_info):
 
     return prop_data, prop_data_pos
 
-def rtpc_prop_to_string(prop0):
+def hash_db_lookup_str(hash_db, width, value):
+    if hash_db is None:
+        return None
+    if width == 32:
+        v = hash_db.lookup32(value & 0xffffffff)
+    elif width == 48:
+        v = hash_db.lookup48(value & 0x0000ffffffffffff)
+    else:
+        v = hash_db.lookup64(value)
+    if v is not None:
+        v = v.decode('utf-8', errors='replace')
+    return v
+
+
+def rtpc_prop_to_string(prop0, hash_db=None):
     if isinstance(prop0, RtpcProperty):
         prop_pos = prop0.pos
         prop_name_hash = prop0.name_hash
@@ -376,12 +390,12 @@ def rtpc_prop_to_string(prop0):
 
     data = prop_data
     if prop_type == k_type_objid:
-        name6 = None
+        name6 = hash_db_lookup_str(hash_db, 48, data)
         name = 'id:0x{:012X}'.format(data)
         if name6:
             name = 'id:DB:H6:"{}"[{}]'.format(name6, name)
         else:
-            name4 = None
+            name4 = hash_db_lookup_str(hash_db, 32, data)
             if name4:
                 name = 'id:DB:H4:"{}"[{}]'.format(name4, name)
 
@@ -390,12 +404,12 @@ def rtpc_prop_to_string(prop0):
     elif prop_type == k_type_event:
         data_new = []
         for d in data:
-            name6 = None
+            name6 = hash_db_lookup_str(hash_db, 48, d)
             name = 'ev:0x{:012X}'.format(d)
             if name6:
                 name = 'ev:DB:H6:"{}"[{}]'.format(name6, name)
             else:
-                name4 = None
+                name4 = hash_db_lookup_str(hash_db, 32, d)
                 if name4:
                     name = 'ev:DB:H4:"{}"[{}]'.format(name4, name)
 
@@ -405,7 +419,7 @@ def rtpc_prop_to_string(prop0):
     elif prop_type in {k_type_u32, k_type_unk_15, k_type_unk_16}:
         d = data
         name = '{} (0x{:08X})'.format(d, d)
-        name4 = None
+        name4 = hash_db_lookup_str(hash_db, 32, d)
         if name4:
             name = 'u32:DB:H4:"{}"[{}]'.format(name4, name)
         data = name
@@ -413,14 +427,14 @@ def rtpc_prop_to_string(prop0):
         data_new = []
         for d in data:
             name = '{} (0x{:08X})'.format(d, d)
-            name4 = None
+            name4 = hash_db_lookup_str(hash_db, 32, d)
             if name4:
                 name = 'u32:DB:H4:"{}"[{}]'.format(name4, name)
 
             data_new.append(name)
         data = data_new
 
-    name = None
+    name = hash_db_lookup_str(hash_db, 32, prop_name_hash)
     if name:
         name = f'"{name}"[0x{prop_name_hash:08x}]'
     else:
@@ -520,8 +534,9 @@ class RtpcVisitor:
 
 
 class RtpcVisitorDumpToString(RtpcVisitor):
-    def __init__(self):
+    def __init__(self, hash_db=None):
         super(RtpcVisitorDumpToString, self).__init__()
+        self._hash_db = hash_db
         self._result = None
         self._lines = []
         self._depth = -1
@@ -549,7 +564,7 @@ class RtpcVisitorDumpToString(RtpcVisitor):
         self.process_depth()
 
         name_hash, data_offset, prop_count, child_count = node_info
-        name4 = None
+        name4 = hash_db_lookup_str(self._hash_db, 32, name_hash)
         name = f'0x{name_hash:08x}'
 
         if name4:
@@ -580,4 +595,4 @@ class RtpcVisitorDumpToString(RtpcVisitor):
     def prop_start(self, bufn, pos, index, prop_info):
         prop = (*prop_info, *parse_prop_data(bufn, prop_info))
 
-        self._lines.append(self._ind2 + rtpc_prop_to_string(prop))
\ No newline at end of file
+        self._lines.append(self._ind2 + rtpc_prop_to_string(prop, self._hash_db))
\ No newline at end of file
@@ -1,9 +1,16 @@
-from deca.file import ArchiveFile
-from deca.hashes import hash32_func
+from deca.file import ArchiveFile, BufferWriter, as_archive_file
+from deca.hashes import hash32_func, hash32_many
 from deca.util import align_to
 import os
+import struct
 import numpy as np
 
+# record layouts used when serializing
+sarc_header = struct.Struct('<I4sII')
+sarc_u32 = struct.Struct('<I')
+sarc_v2_entry_tail = struct.Struct('<II')
+sarc_v3_entry = struct.Struct('<IIIII')
+
 
 class EntrySarc:
     def __init__(self, index=None, v_path=None):
@@ -19,7 +26,7 @@ class EntrySarc:
         self.v_hash = None
         self.is_symlink = None
 
-    def deserialize_v2(self, f: ArchiveFile):
+    def deserialize_v2(self, f: ArchiveFile, hash_path=True):
         self.META_entry_ptr = f.tell()
         self.v_path = f.read_strl_u32()  # string raw length in multiples of 4 bytes (based on theHunter:COTW)
         self.v_path = self.v_path.strip(b'\00')
@@ -28,7 +35,8 @@ class EntrySarc:
         self.META_entry_size_ptr = f.tell()
         self.length = f.read_u32()
 
-        self.v_hash = hash32_func(self.v_path)
+        if hash_path:
+            self.v_hash = hash32_func(self.v_path)
         self.is_symlink = self.offset == 0
 
     def serialize_v2(self, f: ArchiveFile):
@@ -41,7 +49,7 @@ class EntrySarc:
 
         f.write_u32(self.length)
 
-    def deserialize_v3(self, f):
+    def deserialize_v3(self, f, check_hashes=True):
         self.META_entry_ptr = f.tell()
         self.string_offset = f.read_u32()
         self.META_entry_offset_ptr = f.tell()
@@ -53,8 +61,9 @@ class EntrySarc:
 
         self.is_symlink = self.offset == 0
 
-        assert(self.v_hash == hash32_func(self.v_path))
-        assert(self.file_ext_hash == hash32_func(os.path.splitext(self.v_path)[1]))
+        if check_hashes:
+            assert(self.v_hash == hash32_func(self.v_path))
+            assert(self.file_ext_hash == hash32_func(os.path.splitext(self.v_path)[1]))
 
     def serialize_v3(self, f):
         # update entry based on v_path
@@ -96,7 +105,7 @@ class FileSarc:
         self.entries_end = None
 
     def header_deserialize(self, fin):
-        with ArchiveFile(fin) as f:
+        with as_archive_file(fin) as f:
             self.version = f.read_u32()
             self.magic = f.read(4)
             self.ver2 = f.read_u32()
@@ -115,10 +124,15 @@ class FileSarc:
                 idx = 0
                 while f.tell() + 12 <= end_pos:  # 12 is minimum length of v2 sarc entry and they pad with some zeros
                     entry = EntrySarc(idx)
-                    entry.deserialize_v2(f)
+                    entry.deserialize_v2(f, hash_path=False)
                     self.entries.append(entry)
                     idx += 1
 
+                # hash all paths in one batch instead of once per entry
+                v_hashes = hash32_many([ent.v_path for ent in self.entries]).tolist()
+                for ent, v_hash in zip(self.entries, v_hashes):
+                    ent.v_hash = v_hash
+
             elif self.ver2 == 3:
                 string_len = f.read_u32()
                 self.strings0 = f.read(string_len)
@@ -128,7 +142,13 @@ class FileSarc:
                 self.entries_begin = f.tell()
                 self.entries = [EntrySarc(index=i, v_path=s) for i, s in enumerate(self.strings)]
                 for ent in self.entries:
-                    ent.deserialize_v3(f)
+                    ent.deserialize_v3(f, check_hashes=False)
+
+                # verify stored hashes in one batch instead of twice per entry
+                v_hashes = hash32_many([ent.v_path for ent in self.entries])
+                ext_hashes = hash32_many([os.path.splitext(ent.v_path)[1] for ent in self.entries])
+                assert(np.array_equal(v_hashes, np.array([ent.v_hash for ent in self.entries], dtype=np.uint32)))
+                assert(np.array_equal(ext_hashes, np.array([ent.file_ext_hash for ent in self.entries], dtype=np.uint32)))
 
             else:
                 raise NotImplementedError('FileSarc.header_deserialize: self.ver2 == {}'.format(self.ver2))
@@ -136,26 +156,31 @@ class FileSarc:
             self.entries_end = f.tell()
 
     def header_serialize(self, f):
-        vpath_string = b''
-
         if self.ver2 == 2:
+            # prepare data that will be written, v_path should be a multiple of 4 in length
+            v_path_lens = [align_to(len(entry.v_path), 4) for entry in self.entries]
+
             # calculate dir block length
-            dir_block_len = 0
-            entry: EntrySarc
-            for entry in self.entries:
-                dir_block_len += 12 + align_to(len(entry.v_path), 4)
+            dir_block_len = 12 * len(self.entries) + sum(v_path_lens)
             dir_block_len = align_to(dir_block_len, 16)
 
         elif self.ver2 == 3:
-            # calculate dir block length
+            # string table of null terminated v_paths, hashes computed in one batch
+            string_offset = 0
             entry: EntrySarc
             for entry in self.entries:
-                entry.string_offset = len(vpath_string)
-                vpath_string = vpath_string + entry.v_path + b'\00'
-
-            # vpath_string = vpath_string + b'\00'
-
-            dir_block_len = 4 + len(vpath_string) + 20 * len(self.entries)
+                entry.string_offset = string_offset
+                string_offset += len(entry.v_path) + 1
+            vpath_string = b''.join([entry.v_path + b'\00' for entry in self.entries])
+
+            v_paths = [entry.v_path for entry in self.entries]
+            v_hashes = hash32_many(v_paths).tolist()
+            ext_hashes = hash32_many([os.path.splitext(v_path)[1] for v_path in v_paths]).tolist()
+            for entry, v_hash, ext_hash in zip(self.entries, v_hashes, ext_hashes):
+                entry.v_hash = v_hash
+                entry.file_ext_hash = ext_hash
+
+            dir_block_len = 4 + len(vpath_string) + sarc_v3_entry.size * len(self.entries)
             dir_block_len = align_to(dir_block_len, 16)
 
         else:
@@ -164,21 +189,18 @@ class FileSarc:
         data_write_pos = 16 + dir_block_len
 
         # determine offsets for files in sarc
+        # IMPORTANT SARCS apparently don't want data to cross 32MB boundary (maybe small boundary?)
+        max_block_size = 32 * 1024 * 1024
         for entry in self.entries:
             sz = entry.length
             entry.offset = 0
             # figure out where data goes, take into account 32MB boundaries
 
             if not entry.is_symlink:
-                # IMPORTANT SARCS apparently don't want data to cross 32MB boundary (maybe small boundary?)
-                max_block_size = 32 * 1024 * 1024
                 if sz > max_block_size:
                     raise NotImplementedError('Excessive file size: {}'.format(entry.v_path))
 
-                block_pos_diff = \
-                    np.floor((data_write_pos + sz) / max_block_size) - np.floor(data_write_pos / max_block_size)
-
-                if block_pos_diff > 0:
+                if (data_write_pos + sz) // max_block_size > data_write_pos // max_block_size:
                     # boundary crossed
                     data_write_pos = ((data_write_pos + max_block_size - 1) // max_block_size) * max_block_size
 
@@ -186,34 +208,27 @@ class FileSarc:
                 data_write_pos = data_write_pos + sz
                 data_write_pos = align_to(data_write_pos, 4)
 
-        if self.ver2 == 2:
-            f.write_u32(4)              # Version == 4 for supported sarc files
-            f.write(b'SARC')            # Magic number/id
-            f.write_u32(self.ver2)      # Subversion
-            f.write_u32(dir_block_len)  # dir block length
-
-            for entry in self.entries:
-                entry.serialize_v2(f)
+        # header, directory and zero fill up to the data offset position are built in one buffer
+        fw = BufferWriter(data_write_pos - f.tell())
+        fw.pack(sarc_header, 4, b'SARC', self.ver2, dir_block_len)  # version == 4, magic, subversion, dir length
 
-            # fill with zeros to data offset position
-            f.write(b'\00' * (data_write_pos - f.tell()))
+        if self.ver2 == 2:
+            for entry, v_path_len in zip(self.entries, v_path_lens):
+                fw.pack(sarc_u32, v_path_len)
+                pos = fw.tell()
+                fw.write(entry.v_path)
+                fw.seek(pos + v_path_len)
+                fw.pack(sarc_v2_entry_tail, entry.offset, entry.length)
 
         elif self.ver2 == 3:
-            f.write_u32(4)              # Version == 4 for supported sarc files
-            f.write(b'SARC')            # Magic number/id
-            f.write_u32(self.ver2)      # Subversion
-            f.write_u32(dir_block_len)  # dir block length
-
-            f.write_u32(len(vpath_string))
-            f.write(vpath_string)
+            fw.pack(sarc_u32, len(vpath_string))
+            fw.write(vpath_string)
             for entry in self.entries:
-                entry.serialize_v3(f)
-
-            # fill with zeros to data offset position
-            f.write(b'\00' * (data_write_pos - f.tell()))
+                fw.pack(
+                    sarc_v3_entry,
+                    entry.string_offset, entry.offset, entry.length, entry.v_hash, entry.file_ext_hash)
 
-        else:
-            raise NotImplementedError('FileSarc.header_serialize: self.ver2 == {}'.format(self.ver2))
+        fw.flush(f)
 
     def dump_str(self):
         sbuf = ''
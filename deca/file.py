@@ -1,5 +1,9 @@
+import os
+import mmap
 import struct
+import functools
 from deca.errors import EDecaOutOfData
+from deca.util import find_byte
 
 
 class SubsetFile:
@@ -64,6 +68,10 @@ class ArchiveFile:
     def read(self, n=None):
         return self.f.read(n)
 
+    def read_view(self, n=None):
+        # streams can not hand out views, BufferArchiveFile overrides this with a zero copy slice
+        return self.read(n)
+
     def write(self, blk):
         return self.f.write(blk)
 
@@ -207,3 +215,218 @@ class ArchiveFile:
         return self.write_base('d', 8, v)
 
 
+@functools.lru_cache(maxsize=512)
+def struct_for(fmt, n=None):
+    if n is None:
+        return struct.Struct('<' + fmt)
+    return struct.Struct('<{}{}'.format(n, fmt))
+
+
+class BufferArchiveFile(ArchiveFile):
+    """
+    ArchiveFile over an in memory buffer (bytes, bytearray, memoryview or mmap)
+
+    Scalars are unpacked in place with cached struct.Struct objects, strings are located with a single find and
+    read_view returns zero copy memoryview slices of the buffer.
+    """
+    def __init__(self, buffer, debug=False, endian=None, owns_buffer=False):
+        ArchiveFile.__init__(self, None, debug=debug, endian=endian)
+        if isinstance(buffer, memoryview):
+            buffer = buffer.cast('B')
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        self.n_buffer = len(self.view)
+        self.pos = 0
+        self.owns_buffer = owns_buffer
+        # set by map_file, lets other processes map the same file instead of being sent the data
+        self.filename = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t, value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Release the buffer if it was opened by map_file. A map that still has views handed out (read_view, array
+        values, ...) is left open and is unmapped when the last view is collected.
+        """
+        if not self.owns_buffer:
+            return
+        self.owns_buffer = False
+        self.view.release()
+        try:
+            self.buffer.close()
+        except BufferError:
+            pass
+
+    def seek(self, pos):
+        self.pos = pos
+        return pos
+
+    def tell(self):
+        return self.pos
+
+    def _advance(self, n):
+        bpos = self.pos
+        if n is None:
+            epos = self.n_buffer
+        else:
+            epos = min(bpos + n, self.n_buffer)
+        self.pos = max(epos, bpos)
+        return bpos, epos
+
+    def read(self, n=None):
+        bpos, epos = self._advance(n)
+        return bytes(self.view[bpos:epos])
+
+    def read_view(self, n=None):
+        bpos, epos = self._advance(n)
+        return self.view[bpos:epos]
+
+    def write(self, blk):
+        raise NotImplementedError('BufferArchiveFile is read only')
+
+    def read_strz(self, delim=b'\00'):
+        bpos = self.pos
+        epos = find_byte(self.buffer, delim, bpos, self.n_buffer)
+        if epos < 0:
+            self.pos = max(self.n_buffer, bpos)
+            return None
+        self.pos = epos + len(delim)
+        return bytes(self.view[bpos:epos])
+
+    def read_strl(self, n=None, raise_on_no_data=False):
+        if n is None:
+            return self.read_base('c', 1, n, raise_on_no_data)
+        bpos = self.pos
+        if bpos + n > self.n_buffer:
+            self.pos = max(self.n_buffer, bpos)
+            if raise_on_no_data:
+                raise EDecaOutOfData()
+            return None
+        self.pos = bpos + n
+        return bytes(self.view[bpos:bpos + n])
+
+    def read_base(self, fmt, elen, n, raise_on_no_data):
+        st = struct_for(fmt, n)
+        bpos = self.pos
+        if bpos + st.size > self.n_buffer:
+            self.pos = max(self.n_buffer, bpos)
+            if raise_on_no_data:
+                raise EDecaOutOfData()
+            return None
+        self.pos = bpos + st.size
+
+        v = st.unpack_from(self.buffer, bpos)
+        if n is None:
+            v = v[0]
+
+        if self.debug:
+            vs = ['{:02x}'.format(t) for t in self.view[bpos:self.pos]]
+            vs = ''.join(vs)
+            print('{} {}'.format(vs, v))
+
+        return v
+
+
+class BufferWriter(ArchiveFile):
+    """
+    ArchiveFile that serializes into a preallocated, zero filled bytearray
+
+    The caller computes the final size up front, values are packed in place with pack_into (cached struct.Struct
+    objects for write_*, precompiled record layouts with pack) and the result is flushed with a single write.
+    Padding is skipped, the buffer is already zeroed.
+    """
+    def __init__(self, size, debug=False, endian=None):
+        ArchiveFile.__init__(self, None, debug=debug, endian=endian)
+        self.buffer = bytearray(size)
+        self.n_buffer = size
+        self.pos = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t, value, traceback):
+        pass
+
+    def seek(self, pos):
+        self.pos = pos
+        return pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, n=None):
+        raise NotImplementedError('BufferWriter is write only')
+
+    def _reserve(self, n):
+        bpos = self.pos
+        epos = bpos + n
+        if epos > self.n_buffer:
+            raise EDecaOutOfData('BufferWriter: write past end of buffer {} > {}'.format(epos, self.n_buffer))
+        self.pos = epos
+        return bpos
+
+    def write(self, blk):
+        n = len(blk)
+        bpos = self._reserve(n)
+        self.buffer[bpos:bpos + n] = blk
+
+    def skip(self, n):
+        self._reserve(n)
+
+    def pack(self, st, *v):
+        """
+        Pack one record with a precompiled struct.Struct
+        """
+        st.pack_into(self.buffer, self._reserve(st.size), *v)
+
+    def write_base(self, fmt, elen, v):
+        if isinstance(v, list) or isinstance(v, tuple):
+            st = struct_for(fmt, len(v))
+        else:
+            st = struct_for(fmt)
+            v = (v,)
+        bpos = self._reserve(st.size)
+        st.pack_into(self.buffer, bpos, *v)
+
+        if self.debug:
+            vs = ['{:02x}'.format(t) for t in self.buffer[bpos:self.pos]]
+            vs = ''.join(vs)
+            print('{} {}'.format(vs, v))
+
+        return None
+
+    def flush(self, f):
+        """
+        Write the whole buffer to f in one call
+        """
+        return f.write(self.buffer)
+
+
+def map_file(filename):
+    """
+    Memory map a file read only, the returned BufferArchiveFile decodes straight from the map so only the pages that
+    are actually read are loaded
+    """
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return BufferArchiveFile(b'')
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    fp = BufferArchiveFile(buffer, owns_buffer=True)
+    fp.filename = os.fspath(filename)
+    return fp
+
+
+def as_archive_file(f):
+    """
+    Pass through ArchiveFile instances (including BufferArchiveFile), wrap buffers in a BufferArchiveFile and any
+    other file like object in an ArchiveFile
+    """
+    if isinstance(f, ArchiveFile):
+        return f
+    if isinstance(f, (bytes, bytearray, memoryview, mmap.mmap)):
+        return BufferArchiveFile(f)
+    return ArchiveFile(f)
@@ -0,0 +1,245 @@
+import os
+import mmap
+import struct
+import numpy as np
+from deca.errors import EDecaIncorrectFileFormat
+from deca.hashes import hash32_many, hash48_many, hash64_many
+from deca.ff_rtpc import RtpcVisitor, RtpcNode, k_type_str
+from deca.fast_file_2 import ff_read_strz
+
+# On disk layout, all values little endian, every section starts 8 byte aligned
+#   header: magic, version, string_count, blob_size, count32, count48, count64
+#   string offsets: u64[string_count + 1] into the blob
+#   blob: the raw strings back to back
+#   per hash width (32, 48, 64): sorted u64 hashes, then the u32 string index of each hash
+hash_dictionary_magic = b'DECAHSDB'
+hash_dictionary_version = 1
+hash_dictionary_header = struct.Struct('<8sIIQQQQ')
+
+hash_widths = (32, 48, 64)
+hash_many_funcs = {
+    32: hash32_many,
+    48: hash48_many,
+    64: hash64_many,
+}
+
+
+def _align8(v):
+    return (v + 7) & ~7
+
+
+class HashDictionary:
+    """
+    Reverse lookup from 32, 48 and 64 bit hashes to the strings that produced them.
+
+    Strings are collected with the add_* methods, written to a sorted binary index with save and loaded back with
+    load, which memory maps the index so lookups are a binary search without reading the whole file. close, or the
+    end of a with block, releases the map of a loaded index.
+    """
+
+    def __init__(self):
+        self._map = None
+        self._offsets = None
+        self._blob = None
+        self._keys = {w: np.zeros(0, dtype=np.uint64) for w in hash_widths}
+        self._index = {w: np.zeros(0, dtype=np.uint32) for w in hash_widths}
+
+        self._pending = set()
+        self._pending_hashed = 0
+        self._pending_list = []
+        self._pending_maps = {w: {} for w in hash_widths}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t, value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Release the map of a loaded index, its strings are dropped, the pending ones are kept
+        """
+        if self._map is None:
+            return
+        self._blob.release()
+        self._offsets = None
+        self._blob = None
+        self._keys = {w: np.zeros(0, dtype=np.uint64) for w in hash_widths}
+        self._index = {w: np.zeros(0, dtype=np.uint32) for w in hash_widths}
+        index_map, self._map = self._map, None
+        index_map.close()
+
+    def __len__(self):
+        return self.string_count() + len(self._pending)
+
+    def string_count(self):
+        if self._offsets is None:
+            return 0
+        return len(self._offsets) - 1
+
+    def string(self, index):
+        return bytes(self._blob[int(self._offsets[index]):int(self._offsets[index + 1])])
+
+    def strings(self):
+        for i in range(self.string_count()):
+            yield self.string(i)
+        for s in self._pending_list:
+            yield s
+
+    # collecting
+    def add(self, s):
+        if s is None:
+            return
+        if isinstance(s, str):
+            s = s.encode('utf-8')
+        s = bytes(s)
+        if len(s) == 0 or s in self._pending:
+            return
+        self._pending.add(s)
+        self._pending_list.append(s)
+
+    def add_many(self, strings):
+        for s in strings:
+            self.add(s)
+
+    def add_adf(self, adf):
+        self.add_many(adf.found_strings)
+        self.add_many(sh.value for sh in adf.table_stringhash)
+        self.add_many(name for _, name in adf.table_name)
+
+    def add_sarc(self, sarc):
+        self.add_many(ent.v_path for ent in sarc.entries)
+
+    def add_gdcc(self, entries):
+        self.add_many(ent.v_path for ent in entries)
+
+    def add_rtpc(self, rtpc):
+        """
+        rtpc is either a parsed Rtpc/RtpcNode or the raw RTPC buffer
+        """
+        if isinstance(rtpc, (bytes, bytearray, memoryview, mmap.mmap)):
+            visitor = RtpcVisitorCollectStrings(self)
+            visitor.visit(rtpc)
+            return
+
+        nodes = [rtpc.root_node if not isinstance(rtpc, RtpcNode) else rtpc]
+        while nodes:
+            node = nodes.pop()
+            for prop in node.prop_table:
+                if prop.type == k_type_str:
+                    self.add(prop.data)
+            nodes.extend(node.child_table)
+
+    # lookup
+    def _update_pending(self):
+        if self._pending_hashed == len(self._pending_list):
+            return
+        new_strings = self._pending_list[self._pending_hashed:]
+        for w in hash_widths:
+            pmap = self._pending_maps[w]
+            for h, s in zip(hash_many_funcs[w](new_strings).tolist(), new_strings):
+                pmap.setdefault(h, s)
+        self._pending_hashed = len(self._pending_list)
+
+    def _lookup(self, width, value):
+        keys = self._keys[width]
+        if len(keys) > 0 and 0 <= value <= 0xffffffffffffffff:
+            idx = int(np.searchsorted(keys, np.uint64(value)))
+            if idx < len(keys) and int(keys[idx]) == value:
+                return self.string(int(self._index[width][idx]))
+        if self._pending:
+            self._update_pending()
+            return self._pending_maps[width].get(value)
+        return None
+
+    def lookup32(self, value):
+        return self._lookup(32, value)
+
+    def lookup48(self, value):
+        return self._lookup(48, value)
+
+    def lookup64(self, value):
+        return self._lookup(64, value)
+
+    # persistence
+    def save(self, filename):
+        strings = sorted(set(self.strings()))
+
+        offsets = np.zeros(len(strings) + 1, dtype='<u8')
+        if strings:
+            offsets[1:] = np.cumsum([len(s) for s in strings])
+        blob = b''.join(strings)
+
+        tables = []
+        for w in hash_widths:
+            hashes = hash_many_funcs[w](strings).astype('<u8')
+            order = np.argsort(hashes, kind='stable')
+            tables.append((hashes[order], order.astype('<u4')))
+
+        # write next to the target and swap it in. On POSIX that is fine while the old index is still mapped, on
+        # Windows a mapped file can not be replaced, so this dictionary's own map is closed first and the new index
+        # mapped again, a map held by another process still makes os.replace raise PermissionError there
+        tmp_filename = '{}.tmp'.format(filename)
+        with open(tmp_filename, 'wb') as f:
+            f.write(hash_dictionary_header.pack(
+                hash_dictionary_magic, hash_dictionary_version, len(strings), len(blob),
+                *[len(keys) for keys, _ in tables]))
+            f.write(offsets.tobytes())
+            f.write(blob)
+            f.write(b'\00' * (_align8(len(blob)) - len(blob)))
+            for keys, index in tables:
+                f.write(keys.tobytes())
+                f.write(index.tobytes())
+                f.write(b'\00' * (_align8(index.nbytes) - index.nbytes))
+        reload = self._map is not None
+        self.close()
+        os.replace(tmp_filename, filename)
+        if reload:
+            # every string is in the new index now
+            self._open(filename)
+            self._pending = set()
+            self._pending_hashed = 0
+            self._pending_list = []
+            self._pending_maps = {w: {} for w in hash_widths}
+
+    @classmethod
+    def load(cls, filename):
+        hd = cls()
+        hd._open(filename)
+        return hd
+
+    def _open(self, filename):
+        with open(filename, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(buf) < hash_dictionary_header.size:
+            buf.close()
+            raise EDecaIncorrectFileFormat('Hash dictionary too short: {}'.format(filename))
+        magic, version, string_count, blob_size, *counts = hash_dictionary_header.unpack_from(buf, 0)
+        if magic != hash_dictionary_magic or version != hash_dictionary_version:
+            buf.close()
+            raise EDecaIncorrectFileFormat('Not a hash dictionary: {}'.format(filename))
+
+        self._map = buf
+        pos = hash_dictionary_header.size
+        self._offsets = np.frombuffer(buf, dtype='<u8', count=string_count + 1, offset=pos)
+        pos += self._offsets.nbytes
+        self._blob = memoryview(buf)[pos:pos + blob_size]
+        pos = _align8(pos + blob_size)
+        for w, count in zip(hash_widths, counts):
+            self._keys[w] = np.frombuffer(buf, dtype='<u8', count=count, offset=pos)
+            pos += count * 8
+            self._index[w] = np.frombuffer(buf, dtype='<u4', count=count, offset=pos)
+            pos += _align8(count * 4)
+
+
+class RtpcVisitorCollectStrings(RtpcVisitor):
+    def __init__(self, hash_db):
+        super(RtpcVisitorCollectStrings, self).__init__()
+        self._hash_db = hash_db
+
+    def prop_start(self, bufn, pos, index, prop_info):
+        prop_pos, prop_name_hash, prop_data_pos, prop_data_raw, prop_type = prop_info
+        if prop_type == k_type_str:
+            v, _ = ff_read_strz(bufn, prop_data_raw)
+            self._hash_db.add(v)
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def rot(x, k):
     return (x << k) | (x >> (32 - k))
 
@@ -65,4 +68,115 @@ def hash32_func_bytes(data, init_val=0):
 def hash32_func(data, init_val=0):
     if isinstance(data, str):
         data = data.encode('ascii')
-    return hash32_func_bytes(data, init_val)
\ No newline at end of file
+    return hash32_func_bytes(data, init_val)
+
+def hash64_func(data, init_val=0):
+    if isinstance(data, str):
+        data = data.encode('ascii')
+    c, b = hashlittle2(data, init_val, 0)
+    return c | (b << 32)
+
+def hash48_func(data, init_val=0):
+    return hash64_func(data, init_val) & 0x0000ffffffffffff
+
+def _rot_many(x, k):
+    return (x << np.uint32(k)) | (x >> np.uint32(32 - k))
+
+
+def _mix_many(a, b, c):
+    a -= c; a ^= _rot_many(c, 4);  c += b
+    b -= a; b ^= _rot_many(a, 6);  a += c
+    c -= b; c ^= _rot_many(b, 8);  b += a
+    a -= c; a ^= _rot_many(c, 16); c += b
+    b -= a; b ^= _rot_many(a, 19); a += c
+    c -= b; c ^= _rot_many(b, 4);  b += a
+
+
+def _final_many(a, b, c):
+    c ^= b; c -= _rot_many(b, 14)
+    a ^= c; a -= _rot_many(c, 11)
+    b ^= a; b -= _rot_many(a, 25)
+    c ^= b; c -= _rot_many(b, 16)
+    a ^= c; a -= _rot_many(c, 4)
+    b ^= a; b -= _rot_many(a, 14)
+    c ^= b; c -= _rot_many(b, 24)
+
+
+def hashlittle2_many(keys, initval=0, initval2=0):
+    """
+    Vectorized hashlittle2 over a sequence of byte strings, returns (c, b) as uint32 arrays in the order of keys.
+
+    Keys are sorted by block count and zero padded into a (count, words) uint32 matrix, so each mix round only
+    touches the prefix of keys that still have a full 12 byte block left, zero padding makes the partial tail
+    reads of the scalar version unnecessary.
+    """
+    keys = [k.encode('ascii') if isinstance(k, str) else bytes(k) for k in keys]
+    n = len(keys)
+    if n == 0:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32)
+
+    lengths = np.fromiter((len(k) for k in keys), dtype=np.int64, count=n)
+    # number of blocks mixed in the main loop, the remaining 1..12 bytes are handled by the tail
+    n_blocks = np.maximum(lengths - 1, 0) // 12
+    order = np.argsort(-n_blocks, kind='stable')
+    lengths = lengths[order]
+    n_blocks = n_blocks[order]
+
+    width = (int(n_blocks[0]) + 1) * 12
+    padded = b''.join([keys[i].ljust(width, b'\00') for i in order])
+    words = np.frombuffer(padded, dtype='<u4').reshape(n, width // 4)
+
+    a = (np.uint32(0xdeadbeef) + lengths.astype(np.uint32) + np.uint32(initval & 0xffffffff)).astype(np.uint32)
+    b = a.copy()
+    c = a + np.uint32(initval2 & 0xffffffff)
+
+    # keys are sorted so the ones still in the main loop are always a prefix
+    active = np.searchsorted(-n_blocks, -(np.arange(int(n_blocks[0])) + 1), side='right')
+    for j, cnt in enumerate(active):
+        a[:cnt] += words[:cnt, 3 * j + 0]
+        b[:cnt] += words[:cnt, 3 * j + 1]
+        c[:cnt] += words[:cnt, 3 * j + 2]
+        av, bv, cv = a[:cnt], b[:cnt], c[:cnt]
+        _mix_many(av, bv, cv)
+
+    rows = np.arange(n)
+    tail = 3 * n_blocks
+    a += words[rows, tail + 0]
+    b += words[rows, tail + 1]
+    c += words[rows, tail + 2]
+
+    # zero length keys skip the final round
+    nz = lengths > 0
+    af, bf, cf = a[nz], b[nz], c[nz]
+    _final_many(af, bf, cf)
+    b[nz] = bf
+    c[nz] = cf
+
+    rc = np.empty(n, dtype=np.uint32)
+    rb = np.empty(n, dtype=np.uint32)
+    rc[order] = c
+    rb[order] = b
+    return rc, rb
+
+
+def hash32_many(keys, init_val=0):
+    """
+    Vectorized hash32_func, returns a uint32 array with one hash per key, keys can be bytes or ascii str
+    """
+    c, b = hashlittle2_many(keys, init_val, 0)
+    return c
+
+
+def hash64_many(keys, init_val=0):
+    """
+    Vectorized hash64_func, returns a uint64 array with one hash per key
+    """
+    c, b = hashlittle2_many(keys, init_val, 0)
+    return c.astype(np.uint64) | (b.astype(np.uint64) << np.uint64(32))
+
+
+def hash48_many(keys, init_val=0):
+    """
+    Vectorized hash48_func, returns a uint64 array with one hash per key
+    """
+    return hash64_many(keys, init_val) & np.uint64(0x0000ffffffffffff)
@@ -104,6 +104,28 @@ def common_prefix(s0, s1):
     return s0[:cnt], s0[cnt:], s1[cnt:]
 
 
+def find_byte(buffer, value, start=0, end=None):
+    """
+    buffer.find for bytes, bytearray and mmap, memoryview has no find so it is searched in growing chunks
+    """
+    if end is None:
+        end = len(buffer)
+    find = getattr(buffer, 'find', None)
+    if find is not None:
+        return find(value, start, end)
+
+    chunk = 256
+    pos = start
+    while pos < end:
+        epos = min(pos + chunk, end)
+        idx = bytes(buffer[pos:epos]).find(value)
+        if idx >= 0:
+            return pos + idx
+        pos = epos
+        chunk = chunk * 2
+    return -1
+
+
 def align_to(v, boundry):
     return ((v + boundry - 1) // boundry) * boundry
 
@@ -0,0 +1,20 @@
+import json
+from pathlib import Path
+
+from deca.ff_adf import Adf, adf_value_extract
+from deca.file import map_file
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_lazy_extract_round_trips_through_json():
+    filename = ROOT / 'animal_population_8_org_sliced'
+    eager = Adf()
+    eager.deserialize(filename.read_bytes())
+    with map_file(filename) as fp:
+        lazy = Adf()
+        lazy.deserialize(fp, process_instances='lazy')
+        value = adf_value_extract(lazy.table_instance_values[0])
+        assert isinstance(value, dict)
+        text = json.dumps(value, default=str)
+    assert json.loads(text) == json.loads(json.dumps(adf_value_extract(eager.table_instance_values[0]), default=str))